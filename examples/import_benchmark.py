@@ -0,0 +1,66 @@
+"""导入耗时基准：每个模块在独立的子进程中导入，报告耗时与被加载的重量级依赖
+
+用法：python examples/import_benchmark.py [模块名 ...] [--repeat N]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+DEFAULT_MODULES = [
+    'src.morphology_engine',
+    'src.utils.performance',
+    'src.model_manager',
+    'src.plugin_manager',
+    'src.segmentation_interface',
+    'src.visualization_platform',
+    'src.utils.exporter',
+    'src.analysis.time_series',
+]
+
+HEAVY_DEPENDENCIES = ['torch', 'skimage', 'matplotlib', 'seaborn', 'pandas', 'scipy', 'ultralytics']
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{'seconds': elapsed, 'heavy': heavy}}))
+"""
+
+
+def measure(module: str, repeat: int = 3) -> dict:
+    """在新的解释器中导入模块，返回耗时中位数与加载的重量级依赖"""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'module': module,
+        'seconds': statistics.median(run['seconds'] for run in runs),
+        'heavy': runs[-1]['heavy'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        heavy = ', '.join(result['heavy']) or '-'
+        print(f"{result['module']:<32} {result['seconds']:7.3f} s   {heavy}")
+
+
+if __name__ == '__main__':
+    main()
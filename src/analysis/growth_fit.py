@@ -0,0 +1,289 @@
+from typing import Any, Dict, Sequence, Tuple
+import numpy as np
+import warnings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 模型参数名（在原始时间与数值单位下）
+MODEL_PARAMS = {
+    'linear': ('slope', 'intercept'),
+    'exponential': ('initial', 'rate'),
+    'logistic': ('capacity', 'rate', 'midpoint'),
+    'gompertz': ('capacity', 'rate', 'midpoint'),
+}
+
+_EXP_LIMIT = 50.0  # 指数参数截断，避免迭代初期溢出
+# 归一化数值下的均方残差下限（双精度舍入误差量级）：精确拟合的 AIC 保持有限，按参数个数比较
+_MSE_FLOOR = np.finfo(np.float64).eps ** 2
+
+
+def interpolate_series(times: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """逐行线性插值填补内部缺失值（NaN），首尾缺失保持 NaN；所有行一次向量化完成"""
+    values = np.asarray(values, dtype=np.float64)
+    n_series, n_times = values.shape
+    times = np.broadcast_to(np.asarray(times, dtype=np.float64), values.shape)
+    valid = ~np.isnan(values)
+    index = np.broadcast_to(np.arange(n_times), values.shape)
+
+    # 每个位置之前/之后最近的有效点
+    prev = np.maximum.accumulate(np.where(valid, index, -1), axis=1)
+    next_ = np.minimum.accumulate(np.where(valid, index, n_times)[:, ::-1], axis=1)[:, ::-1]
+    inside = ~valid & (prev >= 0) & (next_ < n_times)
+
+    rows = np.broadcast_to(np.arange(n_series)[:, None], values.shape)
+    r, p, q = rows[inside], prev[inside], next_[inside]
+    t, t0, t1 = times[inside], times[r, p], times[r, q]
+    result = values.copy()
+    result[inside] = values[r, p] + (values[r, q] - values[r, p]) * (t - t0) / (t1 - t0)
+    return result
+
+
+def smooth_series(values: np.ndarray, window: int = 3) -> np.ndarray:
+    """逐行居中移动平均，忽略 NaN（窗口内无有效点时为 NaN，原本缺失的位置保持缺失）"""
+    if window < 1:
+        raise ValueError("window must be positive")
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    half = window // 2
+    pad = ((0, 0), (half + 1, window - half - 1))
+    sums = np.cumsum(np.pad(np.where(valid, values, 0.0), pad), axis=1)
+    counts = np.cumsum(np.pad(valid.astype(np.float64), pad), axis=1)
+    window_sums = sums[:, window:] - sums[:, :-window]
+    window_counts = counts[:, window:] - counts[:, :-window]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        smoothed = window_sums / window_counts
+    smoothed[~valid] = np.nan
+    return smoothed
+
+
+def _weighted_line(x: np.ndarray, y: np.ndarray, w: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """逐行加权最小二乘直线 y = slope·x + intercept（闭式解）"""
+    sw = w.sum(axis=1)
+    sx, sy = (w * x).sum(axis=1), (w * y).sum(axis=1)
+    sxx, sxy = (w * x * x).sum(axis=1), (w * x * y).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = (sw * sxy - sx * sy) / (sw * sxx - sx * sx)
+        intercept = (sy - slope * sx) / sw
+    return slope, intercept
+
+
+def _model(name: str, t: np.ndarray, p: np.ndarray, jacobian: bool = True):
+    """模型值与对参数的雅可比（p 为 N×k，t 为 N×T，返回 N×T 与 N×T×k；jacobian=False 时雅可比为 None）"""
+    if name == 'exponential':
+        a, r = p[:, :1], p[:, 1:2]
+        e = np.exp(np.clip(r * t, -_EXP_LIMIT, _EXP_LIMIT))
+        return a * e, (np.stack([e, a * t * e], axis=-1) if jacobian else None)
+    K, r, t0 = p[:, :1], p[:, 1:2], p[:, 2:3]
+    d = t - t0
+    e = np.exp(np.clip(-r * d, -_EXP_LIMIT, _EXP_LIMIT))
+    if name == 'logistic':
+        s = 1.0 / (1.0 + e)
+        if not jacobian:
+            return K * s, None
+        ds = K * s * (1.0 - s)
+        return K * s, np.stack([s, ds * d, -ds * r], axis=-1)
+    if name == 'gompertz':
+        g = np.exp(-e)
+        if not jacobian:
+            return K * g, None
+        dg = K * g * e
+        return K * g, np.stack([g, dg * d, -dg * r], axis=-1)
+    raise ValueError(f"Unsupported growth model: {name}")
+
+
+def _initial_params(name: str, t: np.ndarray, y: np.ndarray, w: np.ndarray) -> np.ndarray:
+    """由线性化变换的闭式回归得到初值"""
+    eps = 1e-6
+    if name == 'exponential':
+        positive = w * (y > 0)
+        slope, intercept = _weighted_line(t, np.log(np.where(y > 0, y, 1.0)), positive)
+        return np.stack([np.exp(intercept), slope], axis=1)
+    K = 1.05 * np.nanmax(np.where(w > 0, y, np.nan), axis=1)
+    q = np.clip(y / K[:, None], eps, 1 - eps)
+    # logistic: ln(q/(1-q)) = r(t - t0)；gompertz: -ln(-ln q) = r(t - t0)
+    z = np.log(q / (1 - q)) if name == 'logistic' else -np.log(-np.log(q))
+    slope, intercept = _weighted_line(t, z, w)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.stack([K, slope, -intercept / slope], axis=1)
+
+
+def _levenberg_marquardt(name: str, t: np.ndarray, y: np.ndarray, w: np.ndarray, p: np.ndarray,
+                         max_iter: int, tol: float) -> Tuple[np.ndarray, np.ndarray]:
+    """所有序列同时迭代的 Levenberg-Marquardt，每行独立调整阻尼；返回参数与是否收敛"""
+    n, k = p.shape
+    y = np.where(w > 0, y, 0.0)
+
+    def rss_of(params, rows):
+        with np.errstate(over='ignore', invalid='ignore'):
+            f, _ = _model(name, t[rows], params, jacobian=False)
+            rss = (w[rows] * (y[rows] - f) ** 2).sum(axis=1)
+        return np.where(np.isfinite(rss), rss, np.inf)
+
+    lam = np.full(n, 1e-3)
+    rss = rss_of(p, np.arange(n))
+    active = np.all(np.isfinite(p), axis=1) & np.isfinite(rss)
+    converged = np.zeros(n, dtype=bool)
+    eye = np.eye(k)
+    for _ in range(max_iter):
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+        pi = p[idx]
+        with np.errstate(over='ignore', invalid='ignore'):
+            f, J = _model(name, t[idx], pi)
+        wi = w[idx]
+        # 正规方程 (JᵀWJ + λ·diag) δ = JᵀW r，按行批量求解
+        JtW = (J * wi[..., None]).transpose(0, 2, 1)
+        A = JtW @ J
+        g = (JtW @ (y[idx] - f)[..., None])[..., 0]
+        damped = A + lam[idx, None, None] * (A * eye + 1e-12 * eye)
+        try:
+            step = np.linalg.solve(damped, g[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.stack([np.linalg.lstsq(m, v, rcond=None)[0] for m, v in zip(damped, g)])
+        candidate = pi + step
+        new_rss = rss_of(candidate, idx)
+        better = new_rss < rss[idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            improvement = (rss[idx] - new_rss) / rss[idx]
+
+        p[idx[better]] = candidate[better]
+        rss[idx[better]] = new_rss[better]
+        lam[idx] = np.where(better, lam[idx] / 10, lam[idx] * 10)
+        # 相对改进足够小，或阻尼饱和（任何步长都不再下降）时视为收敛
+        done = (better & ~(improvement >= tol)) | (lam[idx] > 1e10)
+        converged[idx[done]] = True
+        active[idx[done]] = False
+    return p, converged
+
+
+class GrowthCurveFitter:
+    """批量生长曲线拟合：对象×时间矩阵（NaN 表示缺失）的所有行同时拟合
+
+    线性模型用加权闭式解；指数、logistic 与 Gompertz 先由线性化变换得到闭式初值，
+    再用所有行并行的 Levenberg-Marquardt 迭代。可选在拟合前插值与平滑。
+    时间与数值在内部按行归一化以改善数值条件，结果换算回原始单位。
+    """
+
+    def __init__(self, models: Sequence[str] = ('linear', 'exponential', 'logistic', 'gompertz'),
+                 interpolation: bool = False, smoothing: bool = False, smoothing_window: int = 3,
+                 min_time_points: int = 3, max_iter: int = 100, tol: float = 1e-8):
+        unknown = [m for m in models if m not in MODEL_PARAMS]
+        if unknown:
+            raise ValueError(f"Unsupported growth models: {unknown}")
+        self.models = list(models)
+        self.interpolation = interpolation
+        self.smoothing = smoothing
+        self.smoothing_window = smoothing_window
+        self.min_time_points = min_time_points
+        self.max_iter = max_iter
+        self.tol = tol
+
+    @classmethod
+    def from_config(cls, analysis_config: Dict[str, Any]) -> 'GrowthCurveFitter':
+        """由 config.yaml 的 time_series.analysis 配置创建"""
+        options = {
+            'interpolation': analysis_config.get('interpolation', False),
+            'smoothing': analysis_config.get('smoothing', False),
+            'smoothing_window': analysis_config.get('smoothing_window', 3),
+            'min_time_points': analysis_config.get('min_time_points', 3),
+        }
+        if 'growth_models' in analysis_config:
+            options['models'] = analysis_config['growth_models']
+        return cls(**options)
+
+    def preprocess(self, times: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """按配置插值与平滑"""
+        values = np.asarray(values, dtype=np.float64)
+        if self.interpolation:
+            values = interpolate_series(times, values)
+        if self.smoothing:
+            values = smooth_series(values, self.smoothing_window)
+        return values
+
+    def fit(self, times: np.ndarray, values: np.ndarray) -> Dict[str, np.ndarray]:
+        """拟合所有行，返回列式结果表（每个序列一行）
+
+        times 为长度 T 的公共时间轴或与 values 同形的 N×T 矩阵。
+        每个模型输出 <模型>_<参数>、<模型>_rss、<模型>_r_squared、<模型>_aic、<模型>_converged，
+        另有 n_points 与按 AIC 选出的 best_model。有效点数不足的行结果为 NaN。
+        """
+        try:
+            values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+            times = np.broadcast_to(np.asarray(times, dtype=np.float64), values.shape)
+            values = self.preprocess(times, values)
+
+            w = (~np.isnan(values) & ~np.isnan(times)).astype(np.float64)
+            n_points = w.sum(axis=1)
+            table: Dict[str, np.ndarray] = {'n_points': n_points.astype(np.int64)}
+
+            # 按行把时间平移缩放到 [0, 1]、数值缩放到最大值为 1
+            masked_t = np.where(w > 0, times, np.nan)
+            with warnings.catch_warnings():
+                # 全为缺失的行给出 NaN，不需要警告
+                warnings.simplefilter('ignore', RuntimeWarning)
+                t_min = np.nanmin(masked_t, axis=1)
+                t_scale = np.nanmax(masked_t, axis=1) - t_min
+                y_scale = np.nanmax(np.abs(np.where(w > 0, values, np.nan)), axis=1)
+            t_scale = np.where(t_scale > 0, t_scale, 1.0)
+            y_scale = np.where(y_scale > 0, y_scale, 1.0)
+            t = np.where(w > 0, (times - t_min[:, None]) / t_scale[:, None], 0.0)
+            y = np.where(w > 0, values / y_scale[:, None], 0.0)
+            y_mean = (w * y).sum(axis=1) / np.maximum(n_points, 1)
+            tss = (w * (y - y_mean[:, None]) ** 2).sum(axis=1)
+
+            aic = []
+            for name in self.models:
+                k = len(MODEL_PARAMS[name])
+                usable = n_points >= max(self.min_time_points, k)
+                if name == 'linear':
+                    slope, intercept = _weighted_line(t, y, w)
+                    p = np.stack([slope, intercept], axis=1)
+                    with np.errstate(invalid='ignore'):
+                        rss = (w * (y - (slope[:, None] * t + intercept[:, None])) ** 2).sum(axis=1)
+                    converged = np.isfinite(rss)
+                else:
+                    p = np.full((len(y), k), np.nan)
+                    converged = np.zeros(len(y), dtype=bool)
+                    rows = np.flatnonzero(usable)
+                    if rows.size:
+                        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                            p0 = _initial_params(name, t[rows], y[rows], w[rows])
+                        p[rows], converged[rows] = _levenberg_marquardt(
+                            name, t[rows], y[rows], w[rows], p0, self.max_iter, self.tol)
+                    with np.errstate(over='ignore', invalid='ignore'):
+                        rss = (w * (y - _model(name, t, np.nan_to_num(p), jacobian=False)[0]) ** 2).sum(axis=1)
+                rss = np.where(usable & np.all(np.isfinite(p), axis=1), rss, np.nan)
+
+                for column, value in zip(MODEL_PARAMS[name], self._unscale(name, p, t_min, t_scale, y_scale)):
+                    table[f'{name}_{column}'] = np.where(np.isnan(rss), np.nan, value)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    table[f'{name}_rss'] = rss * y_scale ** 2
+                    table[f'{name}_r_squared'] = 1 - rss / tss
+                    model_aic = n_points * np.log(np.maximum(rss / n_points, _MSE_FLOOR)) + 2 * k
+                table[f'{name}_aic'] = model_aic
+                table[f'{name}_converged'] = converged & ~np.isnan(rss)
+                aic.append(np.where(np.isnan(model_aic), np.inf, model_aic))
+
+            best = np.argmin(np.stack(aic), axis=0)
+            has_fit = np.isfinite(np.min(np.stack(aic), axis=0))
+            table['best_model'] = np.where(has_fit, np.array(self.models, dtype=object)[best], None)
+            return table
+
+        except Exception as e:
+            logger.error(f"Error fitting growth curves: {str(e)}")
+            raise
+
+    @staticmethod
+    def _unscale(name: str, p: np.ndarray, t_min: np.ndarray, t_scale: np.ndarray,
+                 y_scale: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """把归一化坐标下的参数换算回原始时间与数值单位"""
+        with np.errstate(over='ignore', invalid='ignore'):
+            if name == 'linear':
+                slope = p[:, 0] * y_scale / t_scale
+                return slope, p[:, 1] * y_scale - slope * t_min
+            if name == 'exponential':
+                rate = p[:, 1] / t_scale
+                return p[:, 0] * y_scale * np.exp(-rate * t_min), rate
+            return p[:, 0] * y_scale, p[:, 1] / t_scale, p[:, 2] * t_scale + t_min
@@ -1,92 +1,298 @@
-from typing import List, Dict, Any
-import numpy as np
-from scipy import stats
-import pandas as pd
-from dataclasses import dataclass
-import logging
-
-logger = logging.getLogger(__name__)
-
-@dataclass
-class TimePoint:
-    """时间点数据"""
-    time: float  # 时间点
-    image: np.ndarray  # 图像数据
-    metadata: Dict[str, Any]  # 元数据
-
-class TimeSeriesAnalyzer:
-    """时间序列分析器"""
-    
-    def __init__(self):
-        self.time_points: List[TimePoint] = []
-        
-    def add_time_point(self, time_point: TimePoint):
-        """添加时间点数据"""
-        self.time_points.append(time_point)
-        self._sort_time_points()
-        
-    def analyze_growth(self) -> Dict[str, Any]:
-        """分析生长趋势"""
-        try:
-            times = [tp.time for tp in self.time_points]
-            areas = [tp.metadata.get('area', 0) for tp in self.time_points]
-            
-            # 计算生长率
-            growth_rate = np.diff(areas) / np.diff(times)
-            
-            # 拟合生长曲线
-            slope, intercept, r_value, p_value, std_err = stats.linregress(times, areas)
-            
-            return {
-                'growth_rate': growth_rate.tolist(),
-                'average_growth_rate': np.mean(growth_rate),
-                'slope': slope,
-                'r_squared': r_value**2,
-                'p_value': p_value
-            }
-        except Exception as e:
-            logger.error(f"Error analyzing growth: {str(e)}")
-            raise
-            
-    def analyze_morphology_changes(self) -> Dict[str, Any]:
-        """分析形态变化"""
-        try:
-            shape_metrics = []
-            for tp in self.time_points:
-                metrics = {
-                    'time': tp.time,
-                    'sphericity': tp.metadata.get('sphericity', 0),
-                    'volume': tp.metadata.get('volume', 0),
-                    'surface_area': tp.metadata.get('surface_area', 0)
-                }
-                shape_metrics.append(metrics)
-            
-            df = pd.DataFrame(shape_metrics)
-            
-            return {
-                'shape_variation': df.std().to_dict(),
-                'trend_analysis': self._analyze_trends(df),
-                'time_points': df.to_dict('records')
-            }
-        except Exception as e:
-            logger.error(f"Error analyzing morphology changes: {str(e)}")
-            raise
-            
-    def _sort_time_points(self):
-        """按时间排序"""
-        self.time_points.sort(key=lambda x: x.time)
-        
-    def _analyze_trends(self, df: pd.DataFrame) -> Dict[str, Any]:
-        """分析时间序列趋势"""
-        trends = {}
-        for column in df.columns:
-            if column != 'time':
-                # 计算移动平均
-                ma = df[column].rolling(window=3).mean()
-                # 计算趋势方向
-                trend = 'increasing' if df[column].iloc[-1] > df[column].iloc[0] else 'decreasing'
-                trends[column] = {
-                    'trend': trend,
-                    'moving_average': ma.tolist()
-                }
-        return trends 
\ No newline at end of file
+from typing import Iterable, List, Dict, Any, Optional, Union, TYPE_CHECKING
+import numpy as np
+from dataclasses import dataclass, field
+import logging
+from src.utils.image_io import ImageReader, load_image
+
+if TYPE_CHECKING:
+    from src.utils.performance import DataCache
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class ImageRef:
+    """图像的惰性引用：文件路径（可带平面序号）或结果缓存键，需要像素时才读取"""
+    path: Optional[str] = None
+    plane: Optional[int] = None  # 多平面堆栈中的平面序号，None 表示整幅图像
+    cache_key: Optional[str] = None
+    
+    def load(self, cache: "DataCache" = None) -> np.ndarray:
+        """读取像素；按缓存键引用时需提供 DataCache"""
+        if self.path is not None:
+            if self.plane is None:
+                return load_image(self.path)
+            with ImageReader(self.path) as reader:
+                return reader.read_plane(self.plane)
+        if self.cache_key is not None:
+            if cache is None:
+                raise ValueError("A DataCache is required to load an image by cache key")
+            image = cache.get_cached(self.cache_key)
+            if image is None:
+                raise KeyError(f"Image not found in cache: {self.cache_key}")
+            return image
+        raise ValueError("ImageRef needs a path or a cache key")
+
+
+@dataclass
+class TimePoint:
+    """时间点数据；image 可以是像素数组、惰性引用 ImageRef，或 None（只有测量值）"""
+    time: float  # 时间点
+    image: Union[np.ndarray, ImageRef, None] = None  # 图像数据或其引用
+    metadata: Dict[str, Any] = field(default_factory=dict)  # 元数据
+    
+    def get_image(self, cache: "DataCache" = None) -> Optional[np.ndarray]:
+        """取像素数据，惰性引用在此时才读取（不在时间点中保留）"""
+        if isinstance(self.image, ImageRef):
+            return self.image.load(cache)
+        return self.image
+    
+    def compact(self) -> 'MetricPoint':
+        """只保留时间与数值型元数据"""
+        return MetricPoint(self.time, self.metadata)
+
+
+class MetricPoint:
+    """只含测量值的紧凑时间点：无图像，元数据只保留数值标量，__slots__ 免去逐实例字典"""
+    
+    __slots__ = ('time', 'metadata')
+    
+    def __init__(self, time: float, metadata: Dict[str, Any]):
+        self.time = time
+        self.metadata = {k: v for k, v in metadata.items()
+                         if isinstance(v, (int, float, np.number, np.bool_))}
+        
+    @property
+    def image(self) -> None:
+        return None
+    
+    def get_image(self, cache: "DataCache" = None) -> None:
+        return None
+    
+    def compact(self) -> 'MetricPoint':
+        return self
+    
+    def __repr__(self) -> str:
+        return f"MetricPoint(time={self.time!r}, metadata={self.metadata!r})"
+
+# 分析使用的列：analyze_growth 用 time/area，analyze_morphology_changes 用 time 与形态列
+_COLUMNS = ('time', 'area', 'sphericity', 'volume', 'surface_area')
+_SHAPE_COLUMNS = ('time', 'sphericity', 'volume', 'surface_area')
+_MA_WINDOW = 3  # 移动平均窗口
+
+
+class _GrowableTable:
+    """容量按倍数增长的 float64 列表，支持在任意位置插入一行"""
+    
+    def __init__(self, n_columns: int, capacity: int = 64):
+        self._data = np.empty((capacity, n_columns))
+        self.size = 0
+        
+    @property
+    def values(self) -> np.ndarray:
+        return self._data[:self.size]
+        
+    def _reserve(self, n: int):
+        if n > len(self._data):
+            grown = np.empty((max(n, 2 * len(self._data)), self._data.shape[1]))
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+            
+    def insert(self, index: int, row) -> np.ndarray:
+        """在 index 处插入一行，之后的行整体后移（追加时无需移动）"""
+        self._reserve(self.size + 1)
+        self._data[index + 1:self.size + 1] = self._data[index:self.size]
+        self._data[index] = row
+        self.size += 1
+        return self.values
+        
+    def extend(self, rows: np.ndarray) -> np.ndarray:
+        """在末尾追加多行"""
+        self._reserve(self.size + len(rows))
+        self._data[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+        return self.values
+
+
+class TimeSeriesAnalyzer:
+    """时间序列分析器
+    
+    时间点按时间有序插入（二分查找位置，按时间顺序到达时为追加），
+    分析用到的数值保存在预分配的 NumPy 列中，并增量维护：
+    回归所需的累加和、逐段生长率、移动平均，以及各列的方差累加和。
+    分析结果在新增时间点前一直缓存，反复查询不会重复计算。
+    时间点可以用 ImageRef 引用图像而不持有像素；metrics_only 模式下只保留测量值。
+    """
+    
+    def __init__(self, metrics_only: bool = False):
+        """metrics_only: 时间点只以 MetricPoint 保存（丢弃图像与非数值元数据），长时间序列内存恒定于测量值"""
+        self.metrics_only = metrics_only
+        self.time_points: List[Union[TimePoint, MetricPoint]] = []
+        self._table = _GrowableTable(len(_COLUMNS))
+        self._growth_rate = _GrowableTable(1)
+        self._moving_average = _GrowableTable(len(_SHAPE_COLUMNS) - 1)
+        # 以首个时间点为原点的累加和（平移后计算方差与回归，避免大数相减损失精度）
+        self._origin: np.ndarray = None
+        self._sum = np.zeros(len(_COLUMNS))
+        self._sum_sq = np.zeros(len(_COLUMNS))
+        self._sum_time_area = 0.0
+        self._cache: Dict[str, Dict[str, Any]] = {}
+        
+    def __len__(self) -> int:
+        return len(self.time_points)
+        
+    def add_time_point(self, time_point: TimePoint):
+        """添加时间点数据（保持按时间排序，时间相同时排在已有时间点之后）"""
+        row = np.array([time_point.time] + [float(time_point.metadata.get(c, 0)) for c in _COLUMNS[1:]])
+        index = int(np.searchsorted(self._table.values[:, 0], row[0], side='right'))
+        self.time_points.insert(index, time_point.compact() if self.metrics_only else time_point)
+        values = self._table.insert(index, row)
+        
+        if self._origin is None:
+            self._origin = row.copy()
+        shifted = row - self._origin
+        self._sum += shifted
+        self._sum_sq += shifted ** 2
+        self._sum_time_area += shifted[0] * shifted[1]
+        
+        self._update_growth_rate(values, index)
+        self._update_moving_average(values, index)
+        self._cache.clear()
+        
+    def extend(self, time_points: Iterable[TimePoint]):
+        """批量添加时间点；分析器为空时只排序一次并向量化建立各列与累加和"""
+        time_points = list(time_points)
+        if self.time_points or len(time_points) < 2:
+            for time_point in time_points:
+                self.add_time_point(time_point)
+            return
+        rows = np.array([[tp.time] + [float(tp.metadata.get(c, 0)) for c in _COLUMNS[1:]]
+                         for tp in time_points])
+        # 稳定排序：时间相同时保持添加顺序，与逐个添加一致
+        order = np.argsort(rows[:, 0], kind='stable')
+        rows = rows[order]
+        self.time_points = [time_points[i].compact() if self.metrics_only else time_points[i]
+                            for i in order]
+        self._table.extend(rows)
+        
+        self._origin = rows[0].copy()
+        shifted = rows - self._origin
+        self._sum = shifted.sum(axis=0)
+        self._sum_sq = (shifted ** 2).sum(axis=0)
+        self._sum_time_area = float(shifted[:, 0] @ shifted[:, 1])
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self._growth_rate.extend((np.diff(rows[:, 1]) / np.diff(rows[:, 0]))[:, None])
+        columns = [_COLUMNS.index(c) for c in _SHAPE_COLUMNS[1:]]
+        averages = np.full((len(rows), len(columns)), np.nan)
+        if len(rows) >= _MA_WINDOW:
+            windows = np.lib.stride_tricks.sliding_window_view(rows[:, columns], _MA_WINDOW, axis=0)
+            averages[_MA_WINDOW - 1:] = windows.mean(axis=-1)
+        self._moving_average.extend(averages)
+        self._cache.clear()
+        
+    def metrics(self) -> np.ndarray:
+        """按时间排序的分析列（time、area、sphericity、volume、surface_area）结构化数组（副本）"""
+        dtype = np.dtype([(c, np.float64) for c in _COLUMNS])
+        return self._table.values.copy().view(dtype)[:, 0]
+        
+    def _update_growth_rate(self, values: np.ndarray, index: int):
+        """插入后只重算与新时间点相邻的两段生长率"""
+        n = len(values)
+        if n < 2:
+            return
+        rates = self._growth_rate.insert(min(index, self._growth_rate.size), np.nan)
+        lo, hi = max(index - 1, 0), min(index + 1, n - 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates[lo:hi, 0] = np.diff(values[lo:hi + 1, 1]) / np.diff(values[lo:hi + 1, 0])
+            
+    def _update_moving_average(self, values: np.ndarray, index: int):
+        """插入后只重算窗口覆盖到新时间点的移动平均（前 window-1 个为 NaN）"""
+        n = len(values)
+        columns = [_COLUMNS.index(c) for c in _SHAPE_COLUMNS[1:]]
+        averages = self._moving_average.insert(index, np.nan)
+        for j in range(max(index, _MA_WINDOW - 1), min(index + _MA_WINDOW, n)):
+            averages[j] = values[j - _MA_WINDOW + 1:j + 1, columns].mean(axis=0)
+            
+    def _variance(self, column: str) -> float:
+        """样本方差（ddof=1）"""
+        n = len(self)
+        if n < 2:
+            return np.nan
+        i = _COLUMNS.index(column)
+        return max(self._sum_sq[i] - self._sum[i] ** 2 / n, 0.0) / (n - 1)
+        
+    def analyze_growth(self) -> Dict[str, Any]:
+        """分析生长趋势"""
+        if 'growth' in self._cache:
+            return self._cache['growth']
+        try:
+            n = len(self)
+            growth_rate = self._growth_rate.values[:, 0]
+            
+            # 由累加和计算线性回归（与 scipy.stats.linregress 结果一致）
+            if n < 2:
+                raise ValueError("Inputs must not be empty and need at least two time points")
+            (st, sa), (stt, saa) = self._sum[:2], self._sum_sq[:2]
+            ssxm = stt - st * st / n
+            ssym = saa - sa * sa / n
+            ssxym = self._sum_time_area - st * sa / n
+            if ssxm <= 0:
+                raise ValueError("Cannot calculate a linear regression if all x values are identical")
+            slope = ssxym / ssxm
+            r_value = 0.0 if ssym <= 0 else float(np.clip(ssxym / np.sqrt(ssxm * ssym), -1.0, 1.0))
+            
+            self._cache['growth'] = {
+                'growth_rate': growth_rate.tolist(),
+                'average_growth_rate': np.mean(growth_rate),
+                'slope': slope,
+                'r_squared': r_value**2,
+                'p_value': self._regression_p_value(r_value, n)
+            }
+            return self._cache['growth']
+        except Exception as e:
+            logger.error(f"Error analyzing growth: {str(e)}")
+            raise
+            
+    @staticmethod
+    def _regression_p_value(r_value: float, n: int) -> float:
+        """斜率为零的双侧检验 p 值（t 分布，自由度 n-2）"""
+        if n == 2:
+            return 1.0 if r_value == 0 else 0.0
+        # scipy.stats 导入较慢，用到时才导入
+        from scipy import stats
+        df = n - 2
+        t = r_value * np.sqrt(df / ((1.0 - r_value) * (1.0 + r_value) + 1e-20))
+        return float(2 * stats.t.sf(abs(t), df))
+            
+    def analyze_morphology_changes(self) -> Dict[str, Any]:
+        """分析形态变化"""
+        if 'morphology' in self._cache:
+            return self._cache['morphology']
+        try:
+            values = self._table.values
+            columns = {c: values[:, _COLUMNS.index(c)] for c in _SHAPE_COLUMNS}
+            
+            self._cache['morphology'] = {
+                'shape_variation': {c: float(np.sqrt(self._variance(c))) for c in _SHAPE_COLUMNS},
+                'trend_analysis': self._analyze_trends(columns),
+                'time_points': [dict(zip(_SHAPE_COLUMNS, row))
+                                for row in np.stack(list(columns.values()), axis=1).tolist()]
+            }
+            return self._cache['morphology']
+        except Exception as e:
+            logger.error(f"Error analyzing morphology changes: {str(e)}")
+            raise
+            
+    def _analyze_trends(self, columns: Dict[str, np.ndarray]) -> Dict[str, Any]:
+        """分析时间序列趋势"""
+        trends = {}
+        averages = self._moving_average.values
+        for j, column in enumerate(_SHAPE_COLUMNS[1:]):
+            values = columns[column]
+            # 计算趋势方向
+            trend = 'increasing' if len(values) and values[-1] > values[0] else 'decreasing'
+            trends[column] = {
+                'trend': trend,
+                'moving_average': averages[:, j].tolist()
+            }
+        return trends
@@ -0,0 +1,257 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from dataclasses import dataclass
+import numpy as np
+import logging
+from src.analysis.time_series import TimeSeriesAnalyzer, TimePoint
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TrackEvent:
+    """轨迹事件：'split' 表示 track 从 other 分裂而来，'merge' 表示 track 并入 other"""
+    frame: int
+    kind: str
+    track: int
+    other: int
+
+
+def _columns(table: Dict[str, np.ndarray], prefix: str) -> np.ndarray:
+    """按序号取出 centroid-i / bbox-i 等分量列，拼成 N×d 数组"""
+    keys = sorted((k for k in table if k.startswith(prefix)), key=lambda k: int(k[len(prefix):]))
+    if not keys:
+        return np.zeros((len(table['area']), 0))
+    return np.stack([np.asarray(table[k], dtype=np.float64) for k in keys], axis=1)
+
+
+def _bbox_overlap(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """逐行判断两组边界框（[min..., max...]）是否相交"""
+    d = a.shape[1] // 2
+    return np.all((a[:, :d] < b[:, d:]) & (b[:, :d] < a[:, d:]), axis=1)
+
+
+def _assign(rows: np.ndarray, cols: np.ndarray, cost: np.ndarray,
+            n_rows: int, n_cols: int) -> Tuple[np.ndarray, np.ndarray]:
+    """稀疏候选边上的最小代价一对一匹配
+
+    候选图按连通分量拆开：只有一条边的分量直接匹配，其余分量各自做线性分配，
+    代价矩阵只有分量大小，不会出现 N×M 的稠密矩阵。
+    """
+    from scipy.optimize import linear_sum_assignment
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    if rows.size == 0:
+        return rows, cols
+    n = n_rows + n_cols
+    graph = coo_matrix((np.ones(rows.size), (rows, cols + n_rows)), shape=(n, n))
+    _, component = connected_components(graph, directed=False)
+    edge_component = component[rows]
+    edges_per_component = np.bincount(edge_component, minlength=n)
+
+    single = edges_per_component[edge_component] == 1
+    matched_rows, matched_cols = [rows[single]], [cols[single]]
+
+    multi = np.flatnonzero(~single)
+    order = multi[np.argsort(edge_component[multi], kind='stable')]
+    bounds = np.flatnonzero(np.diff(edge_component[order])) + 1
+    for edges in np.split(order, bounds) if order.size else []:
+        r_ids, r = np.unique(rows[edges], return_inverse=True)
+        c_ids, c = np.unique(cols[edges], return_inverse=True)
+        block = np.full((r_ids.size, c_ids.size), np.inf)
+        block[r, c] = cost[edges]
+        # 非候选位置用远大于任何候选代价的有限值占位，分配后再剔除
+        finite = np.isfinite(block)
+        block[~finite] = cost[edges].max() * (r_ids.size + c_ids.size) + 1.0
+        bi, bj = linear_sum_assignment(block)
+        keep = finite[bi, bj]
+        matched_rows.append(r_ids[bi[keep]])
+        matched_cols.append(c_ids[bj[keep]])
+    return np.concatenate(matched_rows), np.concatenate(matched_cols)
+
+
+class TrackingResult:
+    """跟踪结果：每个观测（轨迹×帧）一行的列式表，以及分裂/合并事件"""
+
+    def __init__(self, table: Dict[str, np.ndarray], events: List[TrackEvent]):
+        self.table = table
+        self.events = events
+        # 按 (track_id, frame) 排序一次，之后按轨迹切片
+        order = np.lexsort((table['frame'], table['track_id']))
+        self._order = order
+        ids, starts = np.unique(table['track_id'][order], return_index=True)
+        self._ids = ids
+        self._bounds = np.append(starts, order.size)
+
+    def __len__(self) -> int:
+        return self._ids.size
+
+    def track_ids(self) -> np.ndarray:
+        return self._ids
+
+    def track_lengths(self) -> Dict[int, int]:
+        return dict(zip(self._ids.tolist(), np.diff(self._bounds).tolist()))
+
+    def track(self, track_id: int) -> Dict[str, np.ndarray]:
+        """单条轨迹按帧排序的观测"""
+        i = int(np.searchsorted(self._ids, track_id))
+        if i == self._ids.size or self._ids[i] != track_id:
+            raise KeyError(f"Unknown track: {track_id}")
+        rows = self._order[self._bounds[i]:self._bounds[i + 1]]
+        return {k: v[rows] for k, v in self.table.items()}
+
+    def to_matrix(self, column: str = 'area') -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """轨迹×帧矩阵（缺失为 NaN），返回 (track_ids, 各帧时间, 矩阵)，可直接交给批量生长曲线拟合"""
+        frames = self.table['frame'].astype(np.int64)
+        n_frames = int(frames.max()) + 1 if frames.size else 0
+        times = np.full(n_frames, np.nan)
+        times[frames] = self.table['time']
+        matrix = np.full((self._ids.size, n_frames), np.nan)
+        rows = np.searchsorted(self._ids, self.table['track_id'])
+        matrix[rows, frames] = self.table[column]
+        return self._ids, times, matrix
+
+    def to_time_series(self, min_length: int = 2) -> Dict[int, TimeSeriesAnalyzer]:
+        """为每条长度不少于 min_length 的轨迹构建时间序列分析器，观测的各列作为时间点元数据"""
+        analyzers = {}
+        metric_columns = [k for k in self.table if k not in ('track_id', 'frame', 'time')]
+        for i, track_id in enumerate(self._ids.tolist()):
+            rows = self._order[self._bounds[i]:self._bounds[i + 1]]
+            if rows.size < min_length:
+                continue
+            analyzer = TimeSeriesAnalyzer()
+            values = [self.table[k][rows].tolist() for k in metric_columns]
+            analyzer.extend(TimePoint(time, None, dict(zip(metric_columns, row)))
+                            for time, row in zip(self.table['time'][rows].tolist(), zip(*values)))
+            analyzers[track_id] = analyzer
+        return analyzers
+
+    def analyze_tracks(self, min_length: int = 3) -> Dict[int, Dict[str, Any]]:
+        """逐轨迹的生长与形态变化分析"""
+        return {
+            track_id: {
+                'growth_analysis': analyzer.analyze_growth(),
+                'morphology_changes': analyzer.analyze_morphology_changes()
+            }
+            for track_id, analyzer in self.to_time_series(min_length).items()
+        }
+
+
+class ObjectTracker:
+    """多类器官跨帧跟踪：KD树检索候选、向量化代价与线性分配链接，检测分裂与合并
+
+    代价 = 质心距离 / max_distance + area_weight · |ln(面积比)|，只考虑距离不超过
+    max_distance 的候选对。轨迹最多可以缺失 max_gap 帧（按最后位置继续匹配）。
+    逐帧表使用 compute_label_table 的列（area、centroid-i、bbox-i）；有边界框时，
+    未匹配的新对象与已匹配轨迹的上一位置相交记为分裂，未匹配的旧轨迹与已匹配的
+    当前对象相交记为合并。
+    """
+
+    def __init__(self, max_distance: float, area_weight: float = 1.0, max_gap: int = 0):
+        if max_distance <= 0:
+            raise ValueError("max_distance must be positive")
+        if max_gap < 0:
+            raise ValueError("max_gap must be non-negative")
+        self.max_distance = max_distance
+        self.area_weight = area_weight
+        self.max_gap = max_gap
+
+    def link(self, tables: Sequence[Dict[str, np.ndarray]],
+             times: Optional[Sequence[float]] = None) -> TrackingResult:
+        """链接逐帧对象表，times 缺省时用帧序号"""
+        from scipy.spatial import cKDTree
+
+        try:
+            if times is None:
+                times = range(len(tables))
+            if len(times) != len(tables):
+                raise ValueError("times and tables must have the same length")
+            # 只保留所有帧共有的列
+            shared = set.intersection(*(set(t) for t in tables)) if tables else set()
+            extra = [k for k in (tables[0] if tables else {}) if k in shared]
+
+            # 活动轨迹状态
+            ids = np.zeros(0, dtype=np.int64)
+            pos = area = bbox = None
+            last_frame = np.zeros(0, dtype=np.int64)
+            next_id = 0
+            observations: List[Dict[str, np.ndarray]] = []
+            events: List[TrackEvent] = []
+
+            for frame, (table, time) in enumerate(zip(tables, times)):
+                cur_pos = _columns(table, 'centroid-')
+                cur_area = np.asarray(table['area'], dtype=np.float64)
+                cur_bbox = _columns(table, 'bbox-')
+                n_cur = cur_area.size
+                cur_ids = np.full(n_cur, -1, dtype=np.int64)
+
+                if pos is None:
+                    pos = np.zeros((0, cur_pos.shape[1]))
+                    area = np.zeros(0)
+                    bbox = np.zeros((0, cur_bbox.shape[1]))
+                n_prev = ids.size
+
+                # KD 树检索距离阈值内的候选对，向量化计算代价
+                rows = cols = cost = np.zeros(0, dtype=np.int64)
+                if n_prev and n_cur:
+                    pairs = cKDTree(pos).sparse_distance_matrix(
+                        cKDTree(cur_pos), self.max_distance, output_type='ndarray')
+                    rows = pairs['i'].astype(np.int64)
+                    cols = pairs['j'].astype(np.int64)
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        ratio = np.log(np.maximum(cur_area[cols], 1e-12) / np.maximum(area[rows], 1e-12))
+                    cost = pairs['v'] / self.max_distance + self.area_weight * np.abs(ratio)
+
+                mi, mj = _assign(rows, cols, cost, n_prev, n_cur)
+                cur_ids[mj] = ids[mi]
+                prev_matched = np.zeros(n_prev, dtype=bool)
+                prev_matched[mi] = True
+
+                # 未匹配的新对象开始新轨迹
+                new = cur_ids < 0
+                cur_ids[new] = np.arange(next_id, next_id + int(new.sum()))
+                next_id += int(new.sum())
+
+                retire = np.zeros(n_prev, dtype=bool)
+                if bbox.shape[1] and cur_bbox.shape[1] and rows.size:
+                    touching = _bbox_overlap(bbox[rows], cur_bbox[cols])
+                    # 分裂：新对象与某条已匹配轨迹的上一位置相交
+                    split = touching & new[cols] & prev_matched[rows]
+                    for i, j in self._best_pairs(rows[split], cols[split], cost[split], by=cols[split]):
+                        events.append(TrackEvent(frame, 'split', int(cur_ids[j]), int(ids[i])))
+                    # 合并：未匹配的旧轨迹与某个已匹配的当前对象相交
+                    merge = touching & ~prev_matched[rows] & ~new[cols]
+                    for i, j in self._best_pairs(rows[merge], cols[merge], cost[merge], by=rows[merge]):
+                        events.append(TrackEvent(frame, 'merge', int(ids[i]), int(cur_ids[j])))
+                        retire[i] = True
+
+                observation = {'track_id': cur_ids, 'frame': np.full(n_cur, frame),
+                               'time': np.full(n_cur, float(time))}
+                observation.update({k: np.asarray(table[k]) for k in extra})
+                observations.append(observation)
+
+                # 更新活动轨迹：当前对象 + 在允许间隔内未出现的旧轨迹
+                keep = ~prev_matched & ~retire & (frame - last_frame <= self.max_gap)
+                ids = np.concatenate([cur_ids, ids[keep]])
+                pos = np.concatenate([cur_pos, pos[keep]])
+                area = np.concatenate([cur_area, area[keep]])
+                bbox = np.concatenate([cur_bbox, bbox[keep]])
+                last_frame = np.concatenate([np.full(n_cur, frame), last_frame[keep]])
+
+            columns = ['track_id', 'frame', 'time'] + extra
+            table = {k: np.concatenate([o[k] for o in observations]) if observations else np.zeros(0)
+                     for k in columns}
+            logger.debug(f"Linked {len(tables)} frames into {next_id} tracks")
+            return TrackingResult(table, events)
+
+        except Exception as e:
+            logger.error(f"Error linking object tracks: {str(e)}")
+            raise
+
+    @staticmethod
+    def _best_pairs(rows: np.ndarray, cols: np.ndarray, cost: np.ndarray, by: np.ndarray):
+        """每个 by 值只保留代价最低的一对"""
+        order = np.lexsort((cost, by))
+        first = np.ones(order.size, dtype=bool)
+        first[1:] = by[order][1:] != by[order][:-1]
+        return zip(rows[order[first]].tolist(), cols[order[first]].tolist())
@@ -0,0 +1,171 @@
+from dataclasses import dataclass, asdict, replace
+from pathlib import Path
+from typing import Dict, List, Optional
+import tempfile
+import threading
+import json
+import os
+import logging
+from src.utils.hashing import digest_file
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+
+@dataclass
+class CheckpointEntry:
+    """检查点索引条目"""
+    plugin: str
+    path: str  # 相对检查点根目录的路径
+    size: int
+    mtime_ns: int
+    digest: str  # 文件内容摘要（与掩膜存储、结果缓存使用同一摘要）
+    model_type: str = ""
+    config_hash: str = ""
+    version: str = ""  # 默认取文件名（不含扩展名）
+
+
+class CheckpointIndex:
+    """持久化的检查点索引：记录路径、大小、修改时间、内容摘要、模型类型与配置哈希
+
+    刷新是增量的：目录修改时间未变时不列目录，文件大小与修改时间未变时不重新计算摘要。
+    原地覆盖写入不改变目录修改时间，使用某个条目前应调用 revalidate 核对该文件。
+    每个插件可以固定（pin）某个版本或摘要。
+    """
+
+    def __init__(self, root: Path, index_path: Optional[Path] = None):
+        self.root = Path(root)
+        self.index_path = Path(index_path) if index_path else self.root / "index.json"
+        self.entries: Dict[str, List[CheckpointEntry]] = {}
+        self.pins: Dict[str, str] = {}  # 插件名 -> 固定的检查点摘要
+        self._dir_mtimes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """从磁盘读取索引（热启动）；格式不符时忽略并重建"""
+        try:
+            data = json.loads(self.index_path.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint index {self.index_path}: {str(e)}")
+            return
+        if data.get('version') != INDEX_VERSION:
+            return
+        self.entries = {plugin: [CheckpointEntry(**e) for e in entries]
+                        for plugin, entries in data.get('entries', {}).items()}
+        self.pins = data.get('pins', {})
+        self._dir_mtimes = data.get('dir_mtimes', {})
+
+    def save(self):
+        """原子写回索引文件"""
+        with self._lock:
+            data = {
+                'version': INDEX_VERSION,
+                'entries': {p: [asdict(e) for e in es] for p, es in self.entries.items()},
+                'pins': self.pins,
+                'dir_mtimes': self._dir_mtimes,
+            }
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.index_path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp, self.index_path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    def refresh(self, plugin: str, model_type: Optional[str] = None,
+                config_hash: Optional[str] = None, pattern: str = "*.pt",
+                force: bool = False) -> bool:
+        """增量刷新某个插件的检查点，返回索引是否有变化
+
+        model_type/config_hash 为 None 时保留已记录的值。
+        目录修改时间反映不了原地覆盖写入的文件：选中的条目由 revalidate 单独核对，
+        需要核对所有文件时用 force=True。
+        """
+        directory = self.root / plugin
+        try:
+            dir_mtime = directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            dir_mtime = None
+
+        with self._lock:
+            old = {e.path: e for e in self.entries.get(plugin, [])}
+            unchanged_dir = (not force and dir_mtime is not None
+                             and self._dir_mtimes.get(plugin) == dir_mtime)
+            if unchanged_dir and all(model_type in (None, e.model_type)
+                                     and config_hash in (None, e.config_hash)
+                                     for e in old.values()):
+                return False
+
+        entries = []
+        for path in (sorted(directory.glob(pattern)) if dir_mtime is not None else []):
+            stat = path.stat()
+            rel = str(path.relative_to(self.root))
+            entry = old.get(rel)
+            if entry is None or entry.size != stat.st_size or entry.mtime_ns != stat.st_mtime_ns:
+                entry = CheckpointEntry(plugin, rel, stat.st_size, stat.st_mtime_ns,
+                                        digest_file(path), version=path.stem)
+            if model_type is not None:
+                entry.model_type = model_type
+            if config_hash is not None:
+                entry.config_hash = config_hash
+            entries.append(entry)
+
+        with self._lock:
+            self.entries[plugin] = entries
+            if dir_mtime is not None:
+                self._dir_mtimes[plugin] = dir_mtime
+        return True
+
+    def revalidate(self, entry: CheckpointEntry) -> CheckpointEntry:
+        """按文件当前的大小与修改时间核对条目，原地覆盖过的检查点重新计算摘要并更新索引"""
+        path = self.root / entry.path
+        stat = path.stat()
+        if stat.st_size == entry.size and stat.st_mtime_ns == entry.mtime_ns:
+            return entry
+        updated = replace(entry, size=stat.st_size, mtime_ns=stat.st_mtime_ns, digest=digest_file(path))
+        logger.info(f"Checkpoint {path} changed on disk, new digest {updated.digest}")
+        with self._lock:
+            self.entries[entry.plugin] = [updated if e.path == entry.path else e
+                                          for e in self.entries.get(entry.plugin, [])]
+            if self.pins.get(entry.plugin) == entry.digest:
+                self.pins[entry.plugin] = updated.digest
+        return updated
+
+    def list(self, plugin: str) -> List[CheckpointEntry]:
+        return list(self.entries.get(plugin, []))
+
+    def pin(self, plugin: str, version: Optional[str] = None, digest: Optional[str] = None):
+        """固定插件使用的检查点"""
+        entry = self.revalidate(self.select(plugin, version=version, digest=digest))
+        with self._lock:
+            self.pins[plugin] = entry.digest
+
+    def unpin(self, plugin: str):
+        with self._lock:
+            self.pins.pop(plugin, None)
+
+    def select(self, plugin: str, version: Optional[str] = None,
+               digest: Optional[str] = None) -> CheckpointEntry:
+        """按版本或摘要（可为前缀）选择检查点；都未指定时用固定的检查点，否则取最新的"""
+        entries = self.entries.get(plugin, [])
+        if not entries:
+            raise FileNotFoundError(f"No checkpoints found in {self.root / plugin}")
+        if version is None and digest is None:
+            digest = self.pins.get(plugin)
+        if version is not None:
+            matches = [e for e in entries if e.version == version]
+        elif digest is not None:
+            matches = [e for e in entries if e.digest.startswith(digest)]
+        else:
+            return max(entries, key=lambda e: e.mtime_ns)
+        if not matches:
+            raise KeyError(f"No checkpoint for plugin {plugin} matching version={version} digest={digest}")
+        if len(matches) > 1 and version is None:
+            raise KeyError(f"Digest prefix {digest} is ambiguous for plugin {plugin}")
+        return max(matches, key=lambda e: e.mtime_ns)
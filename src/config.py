@@ -1,19 +1,25 @@
-from dataclasses import dataclass
-from pathlib import Path
-import yaml
-
-@dataclass
-class Config:
-    """配置类"""
-    model_path: Path
-    output_dir: Path
-    batch_size: int
-    gpu_enabled: bool
-    log_level: str
-    
-    @classmethod
-    def from_yaml(cls, yaml_path: str) -> 'Config':
-        """从YAML文件加载配置"""
-        with open(yaml_path, 'r') as f:
-            config_dict = yaml.safe_load(f)
-        return cls(**config_dict) 
\ No newline at end of file
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Any
+import yaml
+
+@dataclass
+class Config:
+    """配置类"""
+    model_path: Path
+    output_dir: Path
+    batch_size: int
+    log_level: str
+    gpu_enabled: bool = False
+    performance: Dict[str, Any] = field(default_factory=dict)  # 性能优化配置
+    time_series: Dict[str, Any] = field(default_factory=dict)  # 时间序列分析配置
+    
+    @classmethod
+    def from_yaml(cls, yaml_path: str) -> 'Config':
+        """从YAML文件加载配置"""
+        with open(yaml_path, 'r') as f:
+            config_dict = yaml.safe_load(f)
+        # gpu_enabled 可写在顶层或 performance 下
+        config_dict.setdefault(
+            'gpu_enabled', config_dict.get('performance', {}).get('gpu_enabled', False))
+        return cls(**config_dict)
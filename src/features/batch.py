@@ -0,0 +1,151 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+from dataclasses import dataclass, field
+import logging
+
+from src.features.labeled import _PERIMETER_KERNEL, _PERIMETER_WEIGHTS, _moment_features
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BatchFeatures:
+    """批量形态特征结果（结构化数组：每个特征一列，每个掩膜一行）"""
+    features: Dict[str, np.ndarray]  # 特征名 -> 长度为N的数组
+    valid: np.ndarray  # 每个掩膜是否计算成功
+    errors: List[Optional[str]] = field(default_factory=list)  # 失败原因，成功为None
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.features[name]
+
+    @classmethod
+    def concat(cls, parts: Sequence['BatchFeatures']) -> 'BatchFeatures':
+        """按顺序拼接多个分块结果"""
+        if not parts:
+            return cls(features={}, valid=np.zeros(0, dtype=bool), errors=[])
+        features = {name: np.concatenate([p.features[name] for p in parts])
+                    for name in parts[0].features}
+        valid = np.concatenate([p.valid for p in parts])
+        errors = [e for p in parts for e in p.errors]
+        return cls(features=features, valid=valid, errors=errors)
+
+    def row(self, index: int) -> Optional[Dict[str, float]]:
+        """获取单个掩膜的特征字典；无效项返回None"""
+        if not self.valid[index]:
+            return None
+        return {name: values[index].item() for name, values in self.features.items()}
+
+
+def stack_masks(masks: Union[np.ndarray, Sequence[np.ndarray]]) -> np.ndarray:
+    """将掩膜列表合并为连续的布尔数组（N×H×W 或 N×Z×H×W）"""
+    if isinstance(masks, np.ndarray):
+        stack = masks
+    else:
+        shapes = {m.shape for m in masks}
+        if len(shapes) > 1:
+            raise ValueError(f"All masks must share one shape, got {sorted(shapes)}")
+        stack = np.stack(masks) if masks else np.zeros((0, 0, 0), dtype=bool)
+    if stack.ndim not in (3, 4):
+        raise ValueError(f"Expected N×H×W or N×Z×H×W masks, got shape {stack.shape}")
+    return np.ascontiguousarray(stack > 0)
+
+
+def _perimeter_stack(stack: np.ndarray) -> np.ndarray:
+    """批量计算N×H×W掩膜周长（与 skimage.measure.perimeter 的4邻域结果一致）"""
+    n, h, w = stack.shape
+    padded = np.pad(stack, ((0, 0), (1, 1), (1, 1)))
+
+    def shifted(arr, dy, dx):
+        return arr[:, 1 + dy:1 + dy + h, 1 + dx:1 + dx + w]
+
+    # 4邻域腐蚀后剩下的差即为边界
+    interior = stack.copy()
+    for dy, dx in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+        interior &= shifted(padded, dy, dx)
+    border = stack & ~interior
+
+    padded_border = np.pad(border, ((0, 0), (1, 1), (1, 1)))
+    code = np.zeros(stack.shape, dtype=np.uint8)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            code += np.uint8(_PERIMETER_KERNEL[dy + 1, dx + 1]) * shifted(padded_border, dy, dx)
+
+    weights = np.where(border, _PERIMETER_WEIGHTS[code], 0.0)
+    return weights.sum(axis=(1, 2))
+
+
+def _covariance_stack(stack: np.ndarray, area: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """通过轴投影批量计算质心与协方差矩阵"""
+    n = stack.shape[0]
+    spatial = stack.shape[1:]
+    ndim = len(spatial)
+    axes = tuple(range(1, ndim + 1))
+    coords = [np.arange(s, dtype=np.float64) for s in spatial]
+    safe_area = np.where(area > 0, area, 1)
+
+    # 一阶矩：各轴投影与坐标向量的内积
+    centroid = np.zeros((n, ndim))
+    for i in range(ndim):
+        projection = stack.sum(axis=tuple(a for a in axes if a != i + 1), dtype=np.float64)
+        centroid[:, i] = projection @ coords[i] / safe_area
+
+    # 二阶中心矩
+    cov = np.zeros((n, ndim, ndim))
+    for i in range(ndim):
+        for j in range(i, ndim):
+            others = tuple(a for a in axes if a not in (i + 1, j + 1))
+            if i == j:
+                projection = stack.sum(axis=others, dtype=np.float64)
+                raw = projection @ coords[i] ** 2
+            else:
+                plane = stack.sum(axis=others, dtype=np.float64) if others else stack.astype(np.float64)
+                raw = np.einsum('nab,a,b->n', plane, coords[i], coords[j])
+            cov[:, i, j] = raw / safe_area - centroid[:, i] * centroid[:, j]
+            cov[:, j, i] = cov[:, i, j]
+    return centroid, cov
+
+
+def compute_batch_features(masks: Union[np.ndarray, Sequence[np.ndarray]],
+                           chunk_size: int = 256) -> BatchFeatures:
+    """对整组掩膜做向量化形态计算，每个掩膜的全部前景视为一个区域"""
+    stack = stack_masks(masks)
+    n = stack.shape[0]
+    ndim = stack.ndim - 1
+    axes = tuple(range(1, ndim + 1))
+
+    area = np.zeros(n)
+    centroid = np.zeros((n, ndim))
+    cov = np.zeros((n, ndim, ndim))
+    perimeter = np.full(n, np.nan)
+
+    # 分块处理以限制中间数组的内存占用
+    for start in range(0, n, chunk_size):
+        chunk = stack[start:start + chunk_size]
+        sl = slice(start, start + chunk.shape[0])
+        area[sl] = chunk.sum(axis=axes)
+        centroid[sl], cov[sl] = _covariance_stack(chunk, area[sl])
+        if ndim == 2:
+            perimeter[sl] = _perimeter_stack(chunk)
+
+    valid = area > 0
+    errors = [None if ok else "empty mask" for ok in valid]
+
+    features: Dict[str, np.ndarray] = {'area': area}
+    for i in range(ndim):
+        features[f'centroid-{i}'] = centroid[:, i]
+    features.update(_moment_features(cov))
+    if ndim == 2:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features['perimeter'] = perimeter
+            features['circularity'] = 4 * np.pi * area / perimeter ** 2
+
+    # 无效项统一置为NaN，避免下游误用
+    for name, values in features.items():
+        if name != 'area':
+            features[name] = np.where(valid, values, np.nan)
+
+    logger.debug(f"Computed batch features for {n} masks ({int(valid.sum())} valid)")
+    return BatchFeatures(features=features, valid=valid, errors=errors)
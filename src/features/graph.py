@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FeatureNode:
+    """特征节点：由声明的输入（源数据或其他特征）计算得到"""
+    name: str
+    func: Callable[..., Any]
+    inputs: Tuple[str, ...]
+
+
+_REGISTRY: Dict[str, FeatureNode] = {}
+
+
+def register_feature(name: str, inputs: Iterable[str] = ()):
+    """注册特征节点，func 按 inputs 的顺序接收输入值"""
+    def decorator(func: Callable[..., Any]):
+        _REGISTRY[name] = FeatureNode(name, func, tuple(inputs))
+        return func
+    return decorator
+
+
+def registered_features() -> List[str]:
+    return sorted(_REGISTRY)
+
+
+def resolve(names: Iterable[str], available: Iterable[str] = ()) -> List[str]:
+    """按依赖顺序返回计算 names 所需的节点；available 中的源数据与已算结果不再展开"""
+    available = set(available)
+    order: List[str] = []
+    state: Dict[str, str] = {}
+
+    def visit(name: str, path: Tuple[str, ...]):
+        if name in available or state.get(name) == 'done':
+            return
+        if name not in _REGISTRY:
+            raise ValueError(f"Unknown feature or missing input: {name}")
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Feature dependency cycle: {' -> '.join(path + (name,))}")
+        state[name] = 'visiting'
+        for dep in _REGISTRY[name].inputs:
+            visit(dep, path + (name,))
+        state[name] = 'done'
+        order.append(name)
+
+    for name in names:
+        visit(name, ())
+    return order
+
+
+class FeatureContext:
+    """单个对象的特征计算上下文：持有源数据并缓存已计算的节点，只计算被请求特征实际依赖的节点"""
+
+    def __init__(self, **sources: Any):
+        self._values: Dict[str, Any] = dict(sources)
+        self._lock = threading.RLock()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._values
+
+    def get(self, name: str) -> Any:
+        """取特征值，按依赖图计算缺失的节点"""
+        with self._lock:
+            for node_name in resolve([name], self._values):
+                node = _REGISTRY[node_name]
+                self._values[node_name] = node.func(*(self._values[i] for i in node.inputs))
+            return self._values[name]
+
+    def missing(self, names: Iterable[str]) -> List[str]:
+        """计算 names 还需要的节点（按依赖顺序），不执行计算"""
+        with self._lock:
+            return resolve(names, self._values)
+
+    def compute(self, names: Iterable[str]) -> Dict[str, Any]:
+        """计算一组特征"""
+        return {name: self.get(name) for name in names}
+
+    def prefetch(self, names: Iterable[str]) -> 'FeatureContext':
+        """预先计算一组特征，之后并行读取不再重复计算"""
+        for name in names:
+            self.get(name)
+        return self
@@ -0,0 +1,150 @@
+import numpy as np
+from typing import Dict, Optional, Tuple
+from scipy import ndimage
+import logging
+
+logger = logging.getLogger(__name__)
+
+# skimage.measure.perimeter 使用的 3x3 邻域编码权重
+_PERIMETER_KERNEL = np.array([[10, 2, 10],
+                              [2, 1, 2],
+                              [10, 2, 10]])
+_PERIMETER_WEIGHTS = np.zeros(50, dtype=np.float64)
+_PERIMETER_WEIGHTS[[5, 7, 15, 17, 25, 27]] = 1
+_PERIMETER_WEIGHTS[[21, 33]] = np.sqrt(2)
+_PERIMETER_WEIGHTS[[13, 23]] = (1 + np.sqrt(2)) / 2
+
+
+def label_objects(mask: np.ndarray, connectivity: Optional[int] = None) -> Tuple[np.ndarray, int]:
+    """对二值掩膜做一次连通域标记；已标记的掩膜原样返回"""
+    if mask.dtype == bool or mask.max(initial=0) <= 1:
+        structure = ndimage.generate_binary_structure(
+            mask.ndim, connectivity or mask.ndim)
+        labels, num = ndimage.label(mask > 0, structure=structure)
+        return labels, num
+    labels = mask.astype(np.int64, copy=False)
+    return labels, int(np.count_nonzero(np.bincount(labels.ravel())[1:]))
+
+
+def _group_pixels(labels: np.ndarray):
+    """按标签对前景像素排序分组，返回标签、分组起点、像素数和坐标"""
+    flat = labels.ravel()
+    idx = np.flatnonzero(flat)
+    lab = flat[idx]
+    order = np.argsort(lab, kind='stable')
+    idx = idx[order]
+    lab = lab[order]
+
+    starts = np.flatnonzero(np.r_[True, lab[1:] != lab[:-1]]) if lab.size else np.zeros(0, dtype=np.intp)
+    counts = np.diff(np.r_[starts, lab.size])
+    coords = np.stack(np.unravel_index(idx, labels.shape), axis=1)
+    return lab[starts], starts, counts, coords
+
+
+def _perimeter_2d(labels: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """逐标签周长（与 skimage.measure.perimeter 的4邻域结果一致）"""
+    padded = np.pad(labels, 1)
+    center = padded[1:-1, 1:-1]
+    h, w = labels.shape
+
+    def shifted(arr, dy, dx):
+        return arr[1 + dy:1 + dy + h, 1 + dx:1 + dx + w]
+
+    # 边界像素：至少有一个4邻域像素不属于同一标签
+    border = np.zeros(labels.shape, dtype=bool)
+    for dy, dx in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+        border |= shifted(padded, dy, dx) != center
+    border &= center != 0
+
+    padded_border = np.pad(border, 1)
+    code = np.zeros(labels.shape, dtype=np.int64)
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            same = shifted(padded_border, dy, dx) & (shifted(padded, dy, dx) == center)
+            code += _PERIMETER_KERNEL[dy + 1, dx + 1] * same
+
+    weights = np.where(border, _PERIMETER_WEIGHTS[code], 0.0)
+    totals = np.bincount(labels.ravel(), weights=weights.ravel(),
+                         minlength=int(ids.max(initial=0)) + 1)
+    return totals[ids]
+
+
+def _moment_features(cov: np.ndarray) -> Dict[str, np.ndarray]:
+    """由逐对象协方差矩阵 (N×d×d) 推导惯性特征值、主轴长度和方向"""
+    ndim = cov.shape[-1]
+    # 惯性张量特征值（降序），与 skimage 的 inertia_tensor_eigvals 一致
+    cov_eigvals = np.linalg.eigvalsh(cov) if len(cov) else np.zeros((0, ndim))
+    trace = np.trace(cov, axis1=1, axis2=2)
+    ev = np.clip(trace[:, None] - cov_eigvals, 0, None)
+
+    features = {f'inertia_tensor_eigvals-{i}': ev[:, i] for i in range(ndim)}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if ndim == 2:
+            major = 4 * np.sqrt(ev[:, 0])
+            minor = 4 * np.sqrt(ev[:, 1])
+            a, b, c = cov[:, 1, 1], -cov[:, 0, 1], cov[:, 0, 0]
+            features['eccentricity'] = np.where(ev[:, 0] > 0, np.sqrt(1 - ev[:, 1] / ev[:, 0]), 0.0)
+            features['orientation'] = np.where(
+                a - c == 0,
+                np.where(b < 0, np.pi / 4, -np.pi / 4),
+                0.5 * np.arctan2(-2 * b, c - a))
+        elif ndim == 3:
+            major = np.sqrt(np.clip(10 * (ev[:, 0] + ev[:, 1] - ev[:, 2]), 0, None))
+            minor = np.sqrt(np.clip(10 * (-ev[:, 0] + ev[:, 1] + ev[:, 2]), 0, None))
+        else:
+            return features
+        features['major_axis_length'] = major
+        features['minor_axis_length'] = minor
+        features['aspect_ratio'] = major / minor
+    return features
+
+
+def compute_label_table(labels: np.ndarray) -> Dict[str, np.ndarray]:
+    """在一次遍历中计算所有标签的形态统计，返回列式表（每个对象一行）"""
+    ndim = labels.ndim
+    ids, starts, counts, coords = _group_pixels(labels)
+    n = ids.size
+
+    # 质心与边界框
+    sums = np.add.reduceat(coords, starts, axis=0) if n else np.zeros((0, ndim))
+    centroid = sums / counts[:, None] if n else np.zeros((0, ndim))
+    bbox_min = np.minimum.reduceat(coords, starts, axis=0) if n else np.zeros((0, ndim), dtype=np.intp)
+    bbox_max = np.maximum.reduceat(coords, starts, axis=0) + 1 if n else np.zeros((0, ndim), dtype=np.intp)
+
+    # 二阶中心矩 -> 协方差矩阵
+    cov = np.zeros((n, ndim, ndim))
+    if n:
+        centered = coords - np.repeat(centroid, counts, axis=0)
+        for i in range(ndim):
+            for j in range(i, ndim):
+                cov[:, i, j] = np.add.reduceat(centered[:, i] * centered[:, j], starts) / counts
+                cov[:, j, i] = cov[:, i, j]
+
+    table: Dict[str, np.ndarray] = {
+        'label': ids,
+        'area': counts.astype(np.float64),
+    }
+    for i in range(ndim):
+        table[f'centroid-{i}'] = centroid[:, i]
+    for i in range(ndim):
+        table[f'bbox-{i}'] = bbox_min[:, i]
+    for i in range(ndim):
+        table[f'bbox-{i + ndim}'] = bbox_max[:, i]
+    table.update(_moment_features(cov))
+
+    if ndim == 2:
+        perimeter = _perimeter_2d(labels, ids)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            table['perimeter'] = perimeter
+            table['circularity'] = 4 * np.pi * table['area'] / perimeter ** 2
+    elif ndim == 3:
+        table['equivalent_diameter'] = 2 * (3 * table['area'] / (4 * np.pi)) ** (1 / 3)
+
+    return table
+
+
+def measure_objects(mask: np.ndarray, connectivity: Optional[int] = None) -> Dict[str, np.ndarray]:
+    """标记掩膜中的所有对象并返回逐对象特征表"""
+    labels, num = label_objects(mask, connectivity)
+    logger.debug(f"Labeled {num} objects in mask of shape {mask.shape}")
+    return compute_label_table(labels)
@@ -0,0 +1,186 @@
+import numpy as np
+from typing import Any, Dict, Optional, Sequence
+import logging
+from src.features.graph import FeatureContext, register_feature, registered_features
+
+logger = logging.getLogger(__name__)
+
+
+def available_shared_features() -> Sequence[str]:
+    return registered_features()
+
+
+class SharedFeatures(FeatureContext):
+    """单个掩膜上多个插件共用的特征上下文：首次请求时按依赖图计算，之后直接复用
+
+    源数据：mask、spacing、image（纹理用）、texture_levels、surface_method、surface_options；
+    也可直接传入已算好的节点（如张量后端得到的 props）。
+    """
+
+    def __init__(self, mask: np.ndarray, spacing: Optional[Sequence[float]] = None,
+                 image: Optional[np.ndarray] = None, texture_levels: int = 32,
+                 surface_method: str = 'voxel', surface_options: Optional[Dict[str, Any]] = None,
+                 **precomputed: Any):
+        super().__init__(mask=mask, spacing=spacing, image=image, texture_levels=texture_levels,
+                         surface_method=surface_method, surface_options=surface_options or {},
+                         **precomputed)
+
+    @property
+    def mask(self) -> np.ndarray:
+        return self.get('mask')
+
+    @property
+    def spacing(self) -> Optional[Sequence[float]]:
+        return self.get('spacing')
+
+
+# ---- 整幅掩膜 ----
+
+@register_feature('regionprops', inputs=('mask',))
+def _regionprops(mask):
+    """整幅掩膜按值分区的 regionprops（与 regionprops(mask.astype(int)) 一致）"""
+    from skimage import measure
+    return measure.regionprops(np.asarray(mask).astype(int))
+
+
+@register_feature('labels', inputs=('mask',))
+def _labels(mask) -> np.ndarray:
+    """连通域标记图"""
+    from src.features.labeled import label_objects
+    return label_objects(mask)[0]
+
+
+@register_feature('label_table', inputs=('labels',))
+def _label_table(labels) -> Dict[str, np.ndarray]:
+    """逐对象列式特征表"""
+    from src.features.labeled import compute_label_table
+    return compute_label_table(labels)
+
+
+@register_feature('surface_mesh', inputs=('mask', 'spacing'))
+def _surface_mesh(mask, spacing):
+    """前景的 marching cubes 网格 (verts, faces)，仅用于3D掩膜"""
+    from skimage import measure
+    from src.features.surface import crop_to_object, _spacing
+
+    crop = crop_to_object(mask)
+    if crop.ndim != 3 or crop.size == 0:
+        raise ValueError("surface_mesh requires a non-empty 3D mask")
+    verts, faces, _, _ = measure.marching_cubes(crop.astype(np.float32), level=0.5,
+                                                spacing=_spacing(spacing))
+    return verts, faces
+
+
+# ---- 单对象形态特征（props 为前景区域的 RegionProperties 或同名字段对象）----
+
+@register_feature('props', inputs=('regionprops',))
+def _props(regionprops):
+    if not regionprops:
+        raise ValueError("empty mask")
+    return regionprops[0]
+
+
+@register_feature('area', inputs=('props',))
+def _area(props):
+    return props.area
+
+
+@register_feature('centroid', inputs=('props',))
+def _centroid(props):
+    return tuple(props.centroid)
+
+
+@register_feature('perimeter', inputs=('props',))
+def _perimeter(props):
+    return props.perimeter
+
+
+@register_feature('eccentricity', inputs=('props',))
+def _eccentricity(props):
+    return props.eccentricity
+
+
+@register_feature('solidity', inputs=('props',))
+def _solidity(props):
+    return props.solidity
+
+
+@register_feature('major_axis_length', inputs=('props',))
+def _major_axis_length(props):
+    return props.major_axis_length
+
+
+@register_feature('minor_axis_length', inputs=('props',))
+def _minor_axis_length(props):
+    return props.minor_axis_length
+
+
+@register_feature('orientation', inputs=('props',))
+def _orientation(props):
+    return props.orientation
+
+
+@register_feature('principal_moments', inputs=('props',))
+def _principal_moments(props):
+    return props.inertia_tensor_eigvals
+
+
+@register_feature('circularity', inputs=('area', 'perimeter'))
+def _circularity(area, perimeter):
+    return 4 * np.pi * area / (perimeter ** 2)
+
+
+@register_feature('aspect_ratio', inputs=('major_axis_length', 'minor_axis_length'))
+def _aspect_ratio(major, minor):
+    return major / minor
+
+
+@register_feature('elongation', inputs=('major_axis_length', 'minor_axis_length'))
+def _elongation(major, minor) -> float:
+    """伸长率（主轴长度之比）"""
+    if minor == 0:
+        return float('inf')
+    return float(major / minor)
+
+
+@register_feature('texture', inputs=('mask', 'image', 'texture_levels'))
+def _texture(mask, image, texture_levels) -> Dict[str, float]:
+    """掩膜区域内强度图像的LBP直方图与GLCM纹理特征"""
+    from src.features.texture import compute_texture_table
+    if image is None:
+        raise ValueError("texture features need an intensity image")
+    texture = compute_texture_table(image, (mask > 0).astype(np.uint8), levels=texture_levels, ids=[1])
+    return {k: float(v[0]) for k, v in texture.items() if k != 'label'}
+
+
+# ---- 3D 体积与表面 ----
+
+@register_feature('volume', inputs=('area', 'spacing'))
+def _volume(area, spacing) -> float:
+    """按体素尺寸换算的体积"""
+    return float(area * (float(np.prod(spacing)) if spacing else 1.0))
+
+
+@register_feature('equivalent_diameter', inputs=('volume',))
+def _equivalent_diameter(volume) -> float:
+    """等体积球直径"""
+    return float(2 * (3 * volume / (4 * np.pi)) ** (1 / 3))
+
+
+@register_feature('surface_area', inputs=('mask', 'spacing', 'surface_method', 'surface_options'))
+def _surface_area(mask, spacing, surface_method, surface_options) -> float:
+    """表面积（在对象边界框内计算）"""
+    from src.features import surface
+    return surface.surface_area(mask, spacing, surface_method, **surface_options)
+
+
+@register_feature('sphericity', inputs=('volume', 'surface_area'))
+def _sphericity(volume, surface_area) -> float:
+    from src.features import surface
+    return float(surface.sphericity(volume, surface_area))
+
+
+@register_feature('compactness', inputs=('volume', 'surface_area'))
+def _compactness(volume, surface_area) -> float:
+    from src.features import surface
+    return float(surface.compactness(volume, surface_area))
@@ -0,0 +1,152 @@
+import numpy as np
+from typing import Dict, Optional, Sequence, Union
+import logging
+import torch
+import torch.nn.functional as F
+
+from src.features.labeled import _PERIMETER_KERNEL, _PERIMETER_WEIGHTS
+from src.features.batch import BatchFeatures, compute_batch_features
+
+logger = logging.getLogger(__name__)
+
+# float32 下与 skimage.measure.regionprops 的相对误差在 1e-4 以内
+TORCH_PROPS_RTOL = 1e-4
+
+_CROSS_OFFSETS = ((0, 1), (2, 1), (1, 0), (1, 2))
+
+
+def _as_batch(masks: Union[torch.Tensor, np.ndarray], device) -> torch.Tensor:
+    """转换为 N×H×W 的布尔张量"""
+    tensor = torch.as_tensor(masks, device=device)
+    if tensor.ndim == 2:
+        tensor = tensor[None]
+    if tensor.ndim != 3:
+        raise ValueError(f"Expected H×W or N×H×W masks, got shape {tuple(tensor.shape)}")
+    return tensor > 0
+
+
+def _conv3x3(x: torch.Tensor, kernel) -> torch.Tensor:
+    """以平移视图累加实现 3x3 卷积（单通道掩膜在CPU上比 conv2d 快一个数量级）"""
+    h, w = x.shape[-2:]
+    padded = F.pad(x, (1, 1, 1, 1))
+    out = torch.zeros_like(x)
+    for dy in range(3):
+        for dx in range(3):
+            if kernel[dy][dx]:
+                out += int(kernel[dy][dx]) * padded[..., dy:dy + h, dx:dx + w]
+    return out
+
+
+# 由特征分解得到的属性
+_AXIS_PROPS = ('inertia_tensor_eigvals', 'major_axis_length', 'minor_axis_length', 'eccentricity')
+TENSOR_PROPS = ('area', 'centroid', 'perimeter', 'orientation') + _AXIS_PROPS
+
+
+def compute_tensor_props(masks: Union[torch.Tensor, np.ndarray], device: str = None,
+                         dtype: torch.dtype = torch.float32,
+                         properties: Optional[Sequence[str]] = None) -> Dict[str, torch.Tensor]:
+    """在张量上批量计算区域属性（每个掩膜的全部前景视为一个区域）
+
+    properties 为 None 时计算 TENSOR_PROPS 中的全部属性，否则只计算列出的属性
+    （周长卷积与特征分解按需执行）。
+    """
+    wanted = set(TENSOR_PROPS if properties is None else properties)
+    unknown = wanted - set(TENSOR_PROPS)
+    if unknown:
+        raise ValueError(f"Unsupported tensor properties: {sorted(unknown)}")
+    device = device or (masks.device if isinstance(masks, torch.Tensor) else 'cpu')
+    mask = _as_batch(masks, device)
+    x = mask.to(dtype)
+    n, h, w = x.shape
+    result: Dict[str, torch.Tensor] = {}
+
+    # 零阶/一阶矩
+    rows = torch.arange(h, device=device, dtype=dtype)
+    cols = torch.arange(w, device=device, dtype=dtype)
+    row_proj = x.sum(dim=2)
+    col_proj = x.sum(dim=1)
+    area = row_proj.sum(dim=1)
+    safe_area = area.clamp(min=1)
+    cy = row_proj @ rows / safe_area
+    cx = col_proj @ cols / safe_area
+    if 'area' in wanted:
+        result['area'] = area
+    if 'centroid' in wanted:
+        result['centroid'] = torch.stack([cy, cx], dim=-1)
+
+    if wanted & set(_AXIS_PROPS + ('orientation',)):
+        # 以质心为原点的二阶中心矩，避免 float32 下的抵消误差
+        dr = rows[None] - cy[:, None]
+        dc = cols[None] - cx[:, None]
+        mu20 = (row_proj * dr ** 2).sum(dim=1) / safe_area
+        mu02 = (col_proj * dc ** 2).sum(dim=1) / safe_area
+        mu11 = (torch.bmm(x, dc[:, :, None])[..., 0] * dr).sum(dim=1) / safe_area
+
+        if wanted & set(_AXIS_PROPS):
+            # 协方差特征分解得到主轴（升序特征值）
+            cov = torch.stack([torch.stack([mu20, mu11], dim=-1),
+                               torch.stack([mu11, mu02], dim=-1)], dim=-2)
+            cov_eigvals = torch.linalg.eigvalsh(cov.double()).to(dtype).clamp(min=0)
+            ev_major, ev_minor = cov_eigvals[:, 1], cov_eigvals[:, 0]
+            result['inertia_tensor_eigvals'] = torch.stack([ev_major, ev_minor], dim=-1)
+            result['major_axis_length'] = 4 * torch.sqrt(ev_major)
+            result['minor_axis_length'] = 4 * torch.sqrt(ev_minor)
+            result['eccentricity'] = torch.where(ev_major > 0,
+                                                 torch.sqrt((1 - ev_minor / ev_major).clamp(min=0)),
+                                                 torch.zeros_like(ev_major))
+        if 'orientation' in wanted:
+            orientation = 0.5 * torch.atan2(2 * mu11, mu20 - mu02)
+            result['orientation'] = torch.where(
+                mu20 == mu02,
+                torch.where(mu11 > 0, torch.full_like(mu11, np.pi / 4), torch.full_like(mu11, -np.pi / 4)),
+                orientation)
+
+    if 'perimeter' in wanted:
+        # 卷积核计算周长：4邻域腐蚀得到边界，再按 3x3 邻域编码加权
+        padded = F.pad(mask, (1, 1, 1, 1))
+        interior = mask.clone()
+        for dy, dx in _CROSS_OFFSETS:
+            interior &= padded[:, dy:dy + h, dx:dx + w]
+        border = mask & ~interior
+        code = _conv3x3(border.to(torch.uint8), _PERIMETER_KERNEL)
+        weights = torch.as_tensor(_PERIMETER_WEIGHTS, device=device, dtype=dtype)
+        item = border.nonzero()[:, 0]
+        result['perimeter'] = torch.zeros(n, device=device, dtype=dtype).index_add_(
+            0, item, weights[code[border].long()])
+
+    return {k: v for k, v in result.items() if k in wanted}
+
+
+def compute_tensor_batch_features(masks: Union[torch.Tensor, np.ndarray],
+                                  device: str = None, chunk_size: int = 256) -> BatchFeatures:
+    """张量后端的批量特征计算，返回与 compute_batch_features 相同结构的结果"""
+    n = len(masks)
+    chunks = []
+    for start in range(0, n, chunk_size):
+        props = compute_tensor_props(masks[start:start + chunk_size], device=device)
+        chunks.append({k: v.detach().cpu().double().numpy() for k, v in props.items()})
+    if not chunks:
+        return compute_batch_features(np.zeros((0, 1, 1), dtype=bool))
+    merged = {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+
+    area = merged['area']
+    valid = area > 0
+    features: Dict[str, np.ndarray] = {'area': area}
+    for i in range(2):
+        features[f'centroid-{i}'] = merged['centroid'][:, i]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features['perimeter'] = merged['perimeter']
+        features['eccentricity'] = merged['eccentricity']
+        features['orientation'] = merged['orientation']
+        features['circularity'] = 4 * np.pi * area / merged['perimeter'] ** 2
+        for i in range(2):
+            features[f'inertia_tensor_eigvals-{i}'] = merged['inertia_tensor_eigvals'][:, i]
+        features['major_axis_length'] = merged['major_axis_length']
+        features['minor_axis_length'] = merged['minor_axis_length']
+        features['aspect_ratio'] = merged['major_axis_length'] / merged['minor_axis_length']
+    for name, values in features.items():
+        if name != 'area':
+            features[name] = np.where(valid, values, np.nan)
+
+    errors = [None if ok else "empty mask" for ok in valid]
+    return BatchFeatures(features=features, valid=valid, errors=errors)
@@ -1,91 +1,413 @@
-from pathlib import Path
-from typing import Dict, Any, Optional
-import yaml
-import torch
-import logging
-from abc import ABC, abstractmethod
-
-logger = logging.getLogger(__name__)
-
-class ModelWrapper(ABC):
-    """模型包装器基类"""
-    
-    @abstractmethod
-    def load(self, checkpoint_path: Path):
-        """加载模型"""
-        pass
-    
-    @abstractmethod
-    def predict(self, data: Any) -> Any:
-        """模型预测"""
-        pass
-
-class YOLOWrapper(ModelWrapper):
-    """YOLO模型包装器"""
-    
-    def __init__(self, config: Dict[str, Any]):
-        self.config = config
-        self.model = None
-        
-    def load(self, checkpoint_path: Path):
-        """加载YOLO模型"""
-        try:
-            from ultralytics import YOLO
-            self.model = YOLO(str(checkpoint_path))
-            logger.info(f"Loaded YOLO model from {checkpoint_path}")
-        except Exception as e:
-            logger.error(f"Error loading YOLO model: {str(e)}")
-            raise
-
-    def predict(self, data: Any) -> Any:
-        """YOLO预测"""
-        if self.model is None:
-            raise RuntimeError("Model not loaded")
-        return self.model.predict(data, **self.config.get('inference_params', {}))
-
-class ModelManager:
-    """模型管理器"""
-    
-    def __init__(self, base_dir: Path):
-        self.base_dir = Path(base_dir)
-        self.checkpoints_dir = self.base_dir / "checkpoints"
-        self.configs_dir = self.base_dir / "configs"
-        self.models: Dict[str, ModelWrapper] = {}
-        
-        # 创建必要的目录
-        self.checkpoints_dir.mkdir(parents=True, exist_ok=True)
-        self.configs_dir.mkdir(parents=True, exist_ok=True)
-    
-    def register_model(self, plugin_name: str, model_type: str, 
-                      config_path: Optional[Path] = None) -> ModelWrapper:
-        """注册新模型"""
-        # 确定模型检查点目录
-        checkpoint_dir = self.checkpoints_dir / plugin_name
-        checkpoint_dir.mkdir(exist_ok=True)
-        
-        # 加载模型配置
-        config = {}
-        if config_path:
-            with open(config_path) as f:
-                config = yaml.safe_load(f)
-        
-        # 创建模型包装器
-        if model_type.lower() == 'yolo':
-            model = YOLOWrapper(config)
-        else:
-            raise ValueError(f"Unsupported model type: {model_type}")
-        
-        # 查找最新的检查点
-        checkpoints = list(checkpoint_dir.glob("*.pt"))
-        if not checkpoints:
-            raise FileNotFoundError(f"No checkpoints found in {checkpoint_dir}")
-        
-        latest_checkpoint = max(checkpoints, key=lambda p: p.stat().st_mtime)
-        model.load(latest_checkpoint)
-        
-        self.models[plugin_name] = model
-        return model
-    
-    def get_model(self, plugin_name: str) -> ModelWrapper:
-        """获取模型实例"""
-        return self.models.get(plugin_name) 
\ No newline at end of file
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Sequence, TYPE_CHECKING
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import os
+import yaml
+import gc
+import logging
+from src.utils.hashing import make_cache_key, digest_file
+from src.checkpoint_index import CheckpointIndex, CheckpointEntry
+from src.utils.cpu_inference import (configure_torch_threads, artifact_path, compile_for_cpu,
+                                     quantize_onnx, is_torch_module)
+from abc import ABC, abstractmethod
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+# 未登记到注册表的模型使用的使用计数锁
+_USE_LOCK = threading.Lock()
+
+class ModelWrapper(ABC):
+    """模型包装器基类
+    
+    设置 checkpoint_path 后可惰性加载：首次 predict 时才读取检查点。
+    前向计算放在 in_use() 中，期间注册表不会为满足内存预算而卸载该模型。
+    """
+    
+    model: Any = None
+    checkpoint_path: Optional[Path] = None
+    checkpoint_digest: Optional[str] = None  # 已知的检查点内容摘要（由 ModelManager 设置）
+    registry: Optional['ModelRegistry'] = None
+    _users: int = 0
+    
+    def load_options(self) -> Any:
+        """影响加载结果的配置，参与共享权重的键"""
+        return None
+    
+    def weights_key(self) -> str:
+        """共享权重的键：同一类型、同一检查点内容与加载配置的包装器共用一份权重"""
+        digest = self.checkpoint_digest
+        if digest is None and self.checkpoint_path is not None and Path(self.checkpoint_path).is_file():
+            digest = digest_file(self.checkpoint_path)
+        return make_cache_key(type(self).__name__, digest or f"id:{id(self)}", self.load_options())
+    
+    @property
+    def is_loaded(self) -> bool:
+        return self.model is not None
+    
+    @property
+    def in_use_count(self) -> int:
+        return self._users
+    
+    @contextmanager
+    def in_use(self):
+        """确保模型已加载并在退出前占用它，返回底层模型"""
+        lock = self.registry._lock if self.registry is not None else _USE_LOCK
+        with lock:
+            self._users += 1
+        try:
+            self.ensure_loaded()
+            yield self.model
+        finally:
+            with lock:
+                self._users -= 1
+    
+    def ensure_loaded(self):
+        """未加载时加载检查点，并通知注册表检查内存预算"""
+        if self.is_loaded:
+            if self.registry is not None:
+                self.registry.touch(self)
+            return
+        if self.checkpoint_path is None:
+            raise RuntimeError("Model not loaded")
+        if self.registry is not None:
+            self.registry.load(self)
+        else:
+            self.load(self.checkpoint_path)
+    
+    def unload(self):
+        """释放模型权重"""
+        self.model = None
+    
+    def torch_module(self) -> Optional["torch.nn.Module"]:
+        """底层 torch 模块（用于统计内存与跨进程共享权重）"""
+        return self.model if is_torch_module(self.model) else None
+    
+    def memory_footprint(self) -> int:
+        """权重占用字节数；无法获取 torch 模块时以检查点文件大小估计"""
+        module = self.torch_module()
+        if module is not None:
+            tensors = list(module.parameters()) + list(module.buffers())
+            return sum(t.numel() * t.element_size() for t in tensors)
+        if self.checkpoint_path is not None and Path(self.checkpoint_path).exists():
+            return Path(self.checkpoint_path).stat().st_size
+        return 0
+    
+    def optimize_for_cpu(self, example_inputs: Any, quantize: bool = False):
+        """把 torch 模型编译为冻结的 TorchScript（可选动态int8量化），产物缓存在检查点旁"""
+        with self.in_use() as model:
+            if not is_torch_module(model) or self.checkpoint_path is None:
+                raise RuntimeError("CPU compilation needs a loaded torch module with a checkpoint")
+            cache_path = artifact_path(self.checkpoint_path, '.ts', quantize)
+            self.model = compile_for_cpu(model, example_inputs, cache_path, quantize)
+    
+    @abstractmethod
+    def load(self, checkpoint_path: Path):
+        """加载模型"""
+        pass
+    
+    @abstractmethod
+    def predict(self, data: Any) -> Any:
+        """模型预测"""
+        pass
+    
+    def predict_batch(self, batch: Sequence[Any]) -> List[Any]:
+        """批量预测，返回与输入一一对应的结果；支持批量前向的模型应重写此方法"""
+        return [self.predict(data) for data in batch]
+
+class YOLOWrapper(ModelWrapper):
+    """YOLO模型包装器
+    
+    配置 cpu_inference.enabled 后在CPU上使用导出的模型推理：
+        cpu_inference:
+          enabled: true
+          format: torchscript    # torchscript 或 onnx
+          quantize: false        # 仅 onnx：onnxruntime 动态int8量化
+          imgsz: 640
+          intra_op_threads: 4    # 每个工作进程的线程数
+          inter_op_threads: 1
+    导出产物缓存在检查点旁边，文件名带检查点摘要。
+    """
+    
+    EXPORT_SUFFIXES = {'torchscript': '.torchscript', 'onnx': '.onnx'}
+    
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.model = None
+        
+    def load(self, checkpoint_path: Path):
+        """加载YOLO模型"""
+        try:
+            import torch
+            from ultralytics import YOLO
+            cpu_config = self.config.get('cpu_inference', {})
+            if cpu_config.get('enabled') and not torch.cuda.is_available():
+                configure_torch_threads(cpu_config.get('intra_op_threads'),
+                                        cpu_config.get('inter_op_threads'))
+                checkpoint_path = self._export_for_cpu(Path(checkpoint_path), cpu_config)
+            self.model = YOLO(str(checkpoint_path), task=self.config.get('task'))
+            logger.info(f"Loaded YOLO model from {checkpoint_path}")
+        except Exception as e:
+            logger.error(f"Error loading YOLO model: {str(e)}")
+            raise
+    
+    def _export_for_cpu(self, checkpoint_path: Path, cpu_config: Dict[str, Any]) -> Path:
+        """导出一次 TorchScript/ONNX 模型（可选int8量化）并缓存，返回产物路径"""
+        from ultralytics import YOLO
+        
+        fmt = cpu_config.get('format', 'torchscript')
+        if fmt not in self.EXPORT_SUFFIXES:
+            raise ValueError(f"Unsupported CPU export format: {fmt}")
+        quantize = bool(cpu_config.get('quantize', False))
+        if quantize and fmt != 'onnx':
+            raise ValueError("int8 quantization requires format: onnx")
+        
+        target = artifact_path(checkpoint_path, self.EXPORT_SUFFIXES[fmt], quantize)
+        if target.exists():
+            return target
+        
+        exported = Path(YOLO(str(checkpoint_path)).export(
+            format=fmt, imgsz=cpu_config.get('imgsz', 640), device='cpu'))
+        if quantize:
+            quantize_onnx(exported, target)
+            exported.unlink(missing_ok=True)
+        else:
+            os.replace(exported, target)
+        logger.info(f"Exported {fmt} model for CPU inference: {target}")
+        return target
+
+    def torch_module(self) -> Optional["torch.nn.Module"]:
+        module = getattr(self.model, 'model', None)
+        return module if is_torch_module(module) else None
+    
+    def load_options(self) -> Any:
+        return {'task': self.config.get('task'), 'cpu_inference': self.config.get('cpu_inference', {})}
+
+    def predict(self, data: Any) -> Any:
+        """YOLO预测"""
+        with self.in_use() as model:
+            return model.predict(data, **self.config.get('inference_params', {}))
+    
+    def predict_batch(self, batch: Sequence[Any]) -> List[Any]:
+        """YOLO批量预测（一次调用处理整批图像）"""
+        with self.in_use() as model:
+            return list(model.predict(list(batch), **self.config.get('inference_params', {})))
+
+class ModelRegistry:
+    """已加载模型的内存登记：按检查点摘要共享权重，超出内存预算时按最近最少使用卸载（正在使用的模型除外）
+    
+    多个插件的包装器加载同一检查点（同类型、同加载配置）时只加载一次，共用同一份权重。
+    """
+    
+    def __init__(self, memory_budget: Optional[int] = None):
+        self.memory_budget = memory_budget  # 字节数，None 表示不限制
+        self._loaded: "OrderedDict[str, List[ModelWrapper]]" = OrderedDict()  # 权重键 -> 共享的包装器
+        self._weights: Dict[str, Any] = {}
+        self._footprints: Dict[str, int] = {}
+        self._keys: Dict[int, str] = {}  # 包装器 -> 当前登记的权重键
+        self._lock = threading.RLock()
+    
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._footprints.values())
+    
+    def footprints(self) -> Dict[str, int]:
+        """各份已加载权重的内存占用"""
+        with self._lock:
+            return {f"{type(ws[0]).__name__}:{ws[0].checkpoint_path}": self._footprints[k]
+                    for k, ws in self._loaded.items()}
+    
+    def touch(self, model: ModelWrapper):
+        """标记为最近使用"""
+        with self._lock:
+            key = self._keys.get(id(model))
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+    
+    def load(self, model: ModelWrapper):
+        """加载模型并登记占用；同一权重已加载时直接共用，必要时卸载其他模型"""
+        with self._lock:
+            key = model.weights_key()
+            if self._keys.get(id(model)) not in (None, key):
+                self._detach(model)  # 检查点已变化
+            if key in self._weights:
+                model.model = self._weights[key]
+            else:
+                if not model.is_loaded:
+                    model.load(model.checkpoint_path)
+                self._weights[key] = model.model
+                self._footprints[key] = model.memory_footprint()
+                self._loaded[key] = []
+            if all(w is not model for w in self._loaded[key]):
+                self._loaded[key].append(model)
+            self._keys[id(model)] = key
+            self._loaded.move_to_end(key)
+            self._enforce_budget(keep=key)
+    
+    def unload(self, model: ModelWrapper):
+        """卸载包装器；共享的权重在最后一个使用者卸载后释放"""
+        with self._lock:
+            self._detach(model)
+            model.unload()
+    
+    def _detach(self, model: ModelWrapper):
+        key = self._keys.pop(id(model), None)
+        if key is None:
+            return
+        wrappers = [w for w in self._loaded.get(key, []) if w is not model]
+        if wrappers:
+            self._loaded[key] = wrappers
+        else:
+            self._loaded.pop(key, None)
+            self._weights.pop(key, None)
+            self._footprints.pop(key, None)
+    
+    def _enforce_budget(self, keep: str):
+        if self.memory_budget is None:
+            return
+        for key in list(self._loaded):
+            if self.total_bytes <= self.memory_budget:
+                break
+            wrappers = self._loaded[key]
+            if key == keep or any(w.in_use_count for w in wrappers):
+                continue
+            logger.info(f"Unloading model {wrappers[0].checkpoint_path} to stay within memory budget")
+            for victim in list(wrappers):
+                self.unload(victim)
+        if self.total_bytes > self.memory_budget:
+            logger.warning(f"Model memory {self.total_bytes} bytes exceeds budget {self.memory_budget}")
+    
+    def share_for_fork(self):
+        """fork 工作进程前调用：权重移入共享内存，子进程写时复制共享同一份权重"""
+        with self._lock:
+            for wrappers in self._loaded.values():
+                module = wrappers[0].torch_module()
+                if module is not None:
+                    module.eval()
+                    module.requires_grad_(False)
+                    module.share_memory()
+
+@contextmanager
+def frozen_gc():
+    """在其中创建 fork 工作进程：冻结现有对象，避免子进程的GC遍历触碰父进程内存页而触发复制；退出时解冻"""
+    gc.collect()
+    gc.freeze()
+    try:
+        yield
+    finally:
+        gc.unfreeze()
+
+def load_model_config(config_path: Path) -> Dict[str, Any]:
+    """读取并校验模型YAML配置"""
+    with open(config_path) as f:
+        config = yaml.safe_load(f) or {}
+    if not isinstance(config, dict):
+        raise ValueError(f"Model config must be a mapping: {config_path}")
+    if not isinstance(config.get('inference_params', {}), dict):
+        raise ValueError(f"inference_params must be a mapping: {config_path}")
+    return config
+
+class ModelManager:
+    """模型管理器
+    
+    模型在首次预测时才加载；memory_budget 限制所有已加载模型的权重总量，超出时卸载最久未用的模型。
+    检查点信息持久化在 checkpoints/index.json 中，启动时直接读取，只对变化的目录和文件重新扫描。
+    """
+    
+    def __init__(self, base_dir: Path, memory_budget: Optional[int] = None):
+        self.base_dir = Path(base_dir)
+        self.checkpoints_dir = self.base_dir / "checkpoints"
+        self.configs_dir = self.base_dir / "configs"
+        self.models: Dict[str, ModelWrapper] = {}
+        self.checkpoints: Dict[str, CheckpointEntry] = {}  # 每个插件当前使用的检查点
+        self.registry = ModelRegistry(memory_budget)
+        
+        # 创建必要的目录
+        self.checkpoints_dir.mkdir(parents=True, exist_ok=True)
+        self.configs_dir.mkdir(parents=True, exist_ok=True)
+        self.index = CheckpointIndex(self.checkpoints_dir)
+    
+    def register_model(self, plugin_name: str, model_type: str, 
+                      config_path: Optional[Path] = None, lazy: bool = True,
+                      version: Optional[str] = None, digest: Optional[str] = None) -> ModelWrapper:
+        """注册新模型（lazy=False 时立即加载）
+        
+        version/digest 选择指定检查点，否则使用固定的检查点或最新的检查点。
+        """
+        # 确定模型检查点目录
+        checkpoint_dir = self.checkpoints_dir / plugin_name
+        checkpoint_dir.mkdir(exist_ok=True)
+        
+        # 加载模型配置
+        config = load_model_config(config_path) if config_path else {}
+        
+        # 创建模型包装器
+        if model_type.lower() == 'yolo':
+            model = YOLOWrapper(config)
+        else:
+            raise ValueError(f"Unsupported model type: {model_type}")
+        
+        # 从索引选择检查点（目录与文件未变化时不重新扫描）
+        if self.index.refresh(plugin_name, model_type.lower(), make_cache_key(config)):
+            self.index.save()
+        # 原地覆盖的检查点不改变目录修改时间，选中的文件单独核对
+        selected = self.index.select(plugin_name, version=version, digest=digest)
+        entry = self.index.revalidate(selected)
+        if entry is not selected:
+            self.index.save()
+        
+        model.checkpoint_path = self.checkpoints_dir / entry.path
+        model.checkpoint_digest = entry.digest
+        model.registry = self.registry
+        if not lazy:
+            model.ensure_loaded()
+        
+        self.models[plugin_name] = model
+        self.checkpoints[plugin_name] = entry
+        return model
+    
+    def pin_checkpoint(self, plugin_name: str, version: Optional[str] = None,
+                       digest: Optional[str] = None):
+        """固定插件使用的检查点（持久化到索引），之后的注册都使用该检查点"""
+        self.index.refresh(plugin_name)
+        self.index.pin(plugin_name, version=version, digest=digest)
+        self.index.save()
+    
+    def get_model(self, plugin_name: str) -> ModelWrapper:
+        """获取模型实例"""
+        return self.models.get(plugin_name)
+    
+    def checkpoint_digest(self, plugin_name: str) -> str:
+        """当前检查点的内容摘要，用作掩膜存储与结果缓存的键
+        
+        检查点文件被原地覆盖时重新计算摘要，并卸载旧权重（下次预测时加载新文件）。
+        """
+        if plugin_name not in self.checkpoints:
+            raise KeyError(f"No model registered for plugin: {plugin_name}")
+        entry = self.checkpoints[plugin_name]
+        current = self.index.revalidate(entry)
+        if current is not entry:
+            self.checkpoints[plugin_name] = current
+            self.index.save()
+            self.unload_model(plugin_name)
+            self.models[plugin_name].checkpoint_digest = current.digest
+        return current.digest
+    
+    def preload_for_workers(self, plugin_names: Optional[List[str]] = None):
+        """在创建 fork 工作进程前加载模型并共享权重，避免每个进程各持一份
+        
+        工作进程应在 with frozen_gc(): 中创建，子进程的GC才不会触发权重页复制。
+        """
+        for name in plugin_names or list(self.models):
+            self.models[name].ensure_loaded()
+        self.registry.share_for_fork()
+    
+    def unload_model(self, plugin_name: str):
+        """卸载模型，下次预测时重新加载"""
+        model = self.models.get(plugin_name)
+        if model is not None:
+            self.registry.unload(model) 
\ No newline at end of file
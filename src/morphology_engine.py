@@ -1,101 +1,201 @@
-import numpy as np
-from typing import Dict, Any, List
-from skimage import measure, morphology
-from scipy import ndimage
-import logging
-import torch
-
-logger = logging.getLogger(__name__)
-
-class MorphologyEngine:
-    """支持GPU加速的形态学分析引擎"""
-    
-    def __init__(self, gpu_acc: GPUAccelerator = None):
-        self.measurements = {}
-        self.gpu_acc = gpu_acc or GPUAccelerator()
-        
-    def calculate_2d_features(self, mask: np.ndarray) -> Dict[str, Any]:
-        """计算2D形态特征（支持GPU加速）"""
-        try:
-            if self.gpu_acc.is_gpu_available:
-                # 转换为GPU张量
-                mask_tensor = self.gpu_acc.to_device(mask)
-                
-                # GPU加速的形态学计算
-                props = self._calculate_props_gpu(mask_tensor)
-                
-                # 转换回CPU
-                props = self._tensor_to_props(props)
-            else:
-                props = measure.regionprops(mask.astype(int))[0]
-            
-            # 添加更多形态学特征
-            features = {
-                'area': props.area,
-                'perimeter': props.perimeter,
-                'eccentricity': props.eccentricity,
-                'solidity': props.solidity,
-                'major_axis_length': props.major_axis_length,
-                'minor_axis_length': props.minor_axis_length,
-                'orientation': props.orientation,
-                'circularity': 4 * np.pi * props.area / (props.perimeter ** 2),
-                'aspect_ratio': props.major_axis_length / props.minor_axis_length
-            }
-            
-            # 添加纹理特征
-            features.update(self._calculate_texture_features(mask))
-            
-            return features
-            
-        except Exception as e:
-            logger.error(f"Error calculating 2D features: {str(e)}")
-            raise
-            
-    def calculate_3d_features(self, volume: np.ndarray) -> Dict[str, Any]:
-        """计算3D形态特征"""
-        try:
-            props = measure.regionprops(volume.astype(int))[0]
-            
-            features = {
-                'volume': props.area,
-                'surface_area': self._calculate_surface_area(volume),
-                'sphericity': self._calculate_sphericity(volume),
-                'compactness': self._calculate_compactness(volume),
-                'principal_moments': props.inertia_tensor_eigvals,
-                'elongation': self._calculate_elongation(props)
-            }
-            
-            return features
-            
-        except Exception as e:
-            logger.error(f"Error calculating 3D features: {str(e)}")
-            raise
-            
-    def batch_process(self, images: List[np.ndarray]) -> List[Dict[str, Any]]:
-        """批量处理多个图像"""
-        results = []
-        for idx, image in enumerate(images):
-            try:
-                if image.ndim == 2:
-                    result = self.calculate_2d_features(image)
-                else:
-                    result = self.calculate_3d_features(image)
-                results.append(result)
-            except Exception as e:
-                logger.error(f"Error processing image {idx}: {str(e)}")
-                results.append(None)
-        return results
-    
-    def _calculate_texture_features(self, mask: np.ndarray) -> Dict[str, float]:
-        """计算纹理特征"""
-        glcm = morphology.local_binary_pattern(mask, 8, 1)
-        return {
-            'texture_uniformity': np.sum(glcm ** 2),
-            'texture_entropy': -np.sum(glcm * np.log2(glcm + 1e-10))
-        } 
-    
-    def _calculate_props_gpu(self, mask_tensor: torch.Tensor):
-        """在GPU上计算区域属性"""
-        # 实现GPU加速的形态学计算
-        # 这里可以使用torch.cuda操作进行加速
-        pass 
\ No newline at end of file
+import numpy as np
+from typing import Dict, Any, List, Sequence, Tuple, TYPE_CHECKING
+from skimage import morphology
+from scipy import ndimage
+import logging
+from src.utils.performance import GPUAccelerator
+from src.utils.image_io import ImageReader
+from src.features.labeled import label_objects, compute_label_table
+from src.features.batch import BatchFeatures, compute_batch_features
+from src.features.texture import compute_texture_table
+from src.features import surface
+from src.features.shared import SharedFeatures
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_2D_FEATURES = ['area', 'perimeter', 'eccentricity', 'solidity', 'major_axis_length',
+                       'minor_axis_length', 'orientation', 'circularity', 'aspect_ratio']
+DEFAULT_3D_FEATURES = ['volume', 'surface_area', 'sphericity', 'compactness',
+                       'principal_moments', 'elongation']
+
+# 张量后端可直接提供的单对象特征节点 -> 所需的张量属性
+_TENSOR_FEATURES = {
+    'area': ('area',),
+    'centroid': ('centroid',),
+    'perimeter': ('perimeter',),
+    'eccentricity': ('eccentricity',),
+    'solidity': ('area',),
+    'major_axis_length': ('major_axis_length',),
+    'minor_axis_length': ('minor_axis_length',),
+    'orientation': ('orientation',),
+    'principal_moments': ('inertia_tensor_eigvals',),
+}
+
+class MorphologyEngine:
+    """支持GPU加速的形态学分析引擎"""
+    
+    def __init__(self, gpu_acc: GPUAccelerator = None, backend: str = 'auto',
+                 texture_levels: int = 32, spacing: Tuple[float, ...] = None,
+                 surface_method: str = 'voxel', surface_options: Dict[str, Any] = None):
+        """backend: 'auto' 有GPU时用张量后端，'torch' 强制张量后端（可在CPU上运行），'skimage' 强制CPU后端"""
+        if backend not in ('auto', 'torch', 'skimage'):
+            raise ValueError(f"Unsupported backend: {backend}")
+        self.measurements = {}
+        self.gpu_acc = gpu_acc or GPUAccelerator()
+        self.backend = backend
+        self.texture_levels = texture_levels
+        # 3D表面积：'voxel' 快速体素面计数，'mesh' marching cubes（可设 step_size/smoothing_sigma）
+        self.spacing = spacing
+        self.surface_method = surface_method
+        self.surface_options = surface_options or {}
+        
+    @property
+    def use_torch(self) -> bool:
+        """是否使用张量后端"""
+        if self.backend == 'auto':
+            return self.gpu_acc.is_gpu_available
+        return self.backend == 'torch'
+        
+    def feature_context(self, mask: np.ndarray, image: np.ndarray = None, **precomputed) -> SharedFeatures:
+        """按引擎参数（体素尺寸、纹理灰度级、表面积方法）构建单对象特征上下文"""
+        return SharedFeatures(mask, self.spacing, image=image, texture_levels=self.texture_levels,
+                              surface_method=self.surface_method,
+                              surface_options=self.surface_options, **precomputed)
+    
+    def calculate_features(self, mask: np.ndarray, features: Sequence[str],
+                           image: np.ndarray = None, **precomputed) -> Dict[str, Any]:
+        """按依赖图只计算请求的特征及其依赖（如只要 area/centroid 时跳过周长、纹理与网格）"""
+        context = self.feature_context(mask, image, **precomputed)
+        result = context.compute(features)
+        # 纹理节点是一组特征，展开到结果中
+        if 'texture' in result:
+            result.update(result.pop('texture'))
+        return result
+        
+    def calculate_2d_features(self, mask: np.ndarray, image: np.ndarray = None,
+                              features: Sequence[str] = None) -> Dict[str, Any]:
+        """计算2D形态特征（支持GPU加速）；提供强度图像时附加纹理特征
+
+        features 为 None 时计算全部默认特征，否则只计算列出的特征。
+        """
+        try:
+            if features is None:
+                features = DEFAULT_2D_FEATURES + (['texture'] if image is not None else [])
+            precomputed = {}
+            if self.use_torch:
+                # 只计算请求的特征实际依赖的区域属性
+                needed = [n for n in self.feature_context(mask, image).missing(features)
+                          if n in _TENSOR_FEATURES]
+                if needed:
+                    props = self._calculate_props_gpu(self.gpu_acc.to_device(mask), needed)
+                    precomputed = self._tensor_features(props, mask, needed)
+            
+            return self.calculate_features(mask, features, image, **precomputed)
+            
+        except Exception as e:
+            logger.error(f"Error calculating 2D features: {str(e)}")
+            raise
+            
+    def calculate_3d_features(self, volume: np.ndarray, features: Sequence[str] = None) -> Dict[str, Any]:
+        """计算3D形态特征；features 为 None 时计算全部默认特征"""
+        try:
+            return self.calculate_features(volume, features or DEFAULT_3D_FEATURES)
+            
+        except Exception as e:
+            logger.error(f"Error calculating 3D features: {str(e)}")
+            raise
+            
+    def calculate_object_table(self, mask: np.ndarray, connectivity: int = None,
+                               image: np.ndarray = None) -> Dict[str, np.ndarray]:
+        """逐对象计算形态特征（一次连通域标记，返回每个类器官一行的列式表）"""
+        try:
+            labels, num = label_objects(mask, connectivity)
+            table = compute_label_table(labels)
+            if image is not None:
+                texture = compute_texture_table(image, labels, levels=self.texture_levels,
+                                                ids=table['label'])
+                table.update({k: v for k, v in texture.items() if k != 'label'})
+            if labels.ndim == 3:
+                volume_size = table['area'] * (float(np.prod(self.spacing)) if self.spacing else 1.0)
+                surface_area = surface.surface_area_table(
+                    labels, table, self.spacing, self.surface_method, **self.surface_options)
+                table['surface_area'] = surface_area
+                table['sphericity'] = surface.sphericity(volume_size, surface_area)
+                table['compactness'] = surface.compactness(volume_size, surface_area)
+            logger.debug(f"Measured {num} objects")
+            return table
+            
+        except Exception as e:
+            logger.error(f"Error calculating object table: {str(e)}")
+            raise
+            
+    def batch_process(self, images: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """批量处理多个图像"""
+        results = []
+        for idx, image in enumerate(images):
+            try:
+                if image.ndim == 2:
+                    result = self.calculate_2d_features(image)
+                else:
+                    result = self.calculate_3d_features(image)
+                results.append(result)
+            except Exception as e:
+                logger.error(f"Error processing image {idx}: {str(e)}")
+                results.append(None)
+        return results
+    
+    def batch_process_stack(self, masks, chunk_size: int = 256) -> BatchFeatures:
+        """向量化批量处理等尺寸掩膜（N×H×W 或 N×Z×H×W），返回结构化数组结果"""
+        try:
+            if len(masks) == 0:
+                return BatchFeatures.concat([])
+            if self.use_torch and np.ndim(masks[0]) == 2:
+                # 张量后端按需导入，避免纯CPU流程加载 torch
+                from src.features.torch_backend import compute_tensor_batch_features
+                result = compute_tensor_batch_features(
+                    masks, device=self.gpu_acc.device, chunk_size=chunk_size)
+            else:
+                result = compute_batch_features(masks, chunk_size=chunk_size)
+            invalid = len(result) - int(result.valid.sum())
+            if invalid:
+                logger.warning(f"{invalid} of {len(result)} masks could not be measured")
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error in batch feature computation: {str(e)}")
+            raise
+    
+    def batch_process_reader(self, reader: ImageReader, chunk_size: int = 256) -> BatchFeatures:
+        """从掩膜堆栈文件分块流式读取并批量计算，内存占用与块大小成正比"""
+        parts = []
+        for start in range(0, reader.n_planes, chunk_size):
+            chunk = reader.read_region(slice(start, start + chunk_size))
+            parts.append(self.batch_process_stack(chunk, chunk_size=chunk_size))
+        return BatchFeatures.concat(parts)
+    
+    def _calculate_props_gpu(self, mask_tensor: "torch.Tensor",
+                             features: Sequence[str]) -> Dict[str, "torch.Tensor"]:
+        """在张量设备（GPU或CPU）上只计算给定特征所需的区域属性"""
+        from src.features.torch_backend import compute_tensor_props
+        properties = sorted({p for name in features for p in _TENSOR_FEATURES[name]})
+        return compute_tensor_props(mask_tensor, device=self.gpu_acc.device, properties=properties)
+    
+    def _tensor_features(self, props: Dict[str, "torch.Tensor"], mask: np.ndarray,
+                         features: Sequence[str]) -> Dict[str, Any]:
+        """将张量结果转换为特征节点的值（凸包只在需要 solidity 时在CPU上计算）"""
+        values = {k: v[0].detach().cpu().numpy() for k, v in props.items()}
+        result = {}
+        for name in features:
+            if name == 'solidity':
+                convex_area = morphology.convex_hull_image(mask > 0).sum()
+                result[name] = float(values['area'] / convex_area) if convex_area else 0.0
+            elif name == 'centroid':
+                result[name] = tuple(values['centroid'].tolist())
+            elif name == 'principal_moments':
+                result[name] = values['inertia_tensor_eigvals'].tolist()
+            else:
+                result[name] = float(values[name])
+        return result 
\ No newline at end of file
@@ -1,116 +1,255 @@
-from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Type
-import numpy as np
-from pathlib import Path
-import importlib
-import inspect
-import logging
-
-logger = logging.getLogger(__name__)
-
-class OrganoidPlugin(ABC):
-    """增强的插件基类"""
-    
-    plugin_type: str = ""  # 插件类型标识
-    plugin_name: str = ""  # 插件名称
-    version: str = "1.0.0"  # 插件版本
-    
-    def __init__(self, config: Dict[str, Any] = None):
-        self.config = config or {}
-        self._validate_config()
-    
-    @abstractmethod
-    def define_morphology(self) -> Dict[str, Any]:
-        """定义形态学特征"""
-        pass
-    
-    @abstractmethod
-    def analyze(self, image: np.ndarray) -> Dict[str, Any]:
-        """执行形态分析"""
-        pass
-    
-    def _validate_config(self):
-        """验证插件配置"""
-        required_configs = self.get_required_configs()
-        missing = [key for key in required_configs if key not in self.config]
-        if missing:
-            raise ValueError(f"Missing required configs: {missing}")
-    
-    @classmethod
-    def get_required_configs(cls) -> List[str]:
-        """获取必需的配置项"""
-        return []
-    
-    def get_metadata(self) -> Dict[str, Any]:
-        """获取插件元数据"""
-        return {
-            "type": self.plugin_type,
-            "name": self.plugin_name,
-            "version": self.version,
-            "config": self.config
-        }
-
-def register_plugin(plugin_type: str, plugin_name: str):
-    """插件注册装饰器"""
-    def decorator(cls):
-        cls.plugin_type = plugin_type
-        cls.plugin_name = plugin_name
-        return cls
-    return decorator
-
-class PluginManager:
-    """增强的插件管理系统"""
-    
-    def __init__(self):
-        self.plugins: Dict[str, Type[OrganoidPlugin]] = {}
-        self.plugin_instances: Dict[str, OrganoidPlugin] = {}
-        
-    def register_plugin(self, plugin_class: Type[OrganoidPlugin]):
-        """注册插件类"""
-        key = f"{plugin_class.plugin_type}.{plugin_class.plugin_name}"
-        self.plugins[key] = plugin_class
-        logger.info(f"Registered plugin: {key}")
-        
-    def create_plugin(self, plugin_type: str, plugin_name: str, 
-                     config: Dict[str, Any] = None) -> OrganoidPlugin:
-        """创建插件实例"""
-        key = f"{plugin_type}.{plugin_name}"
-        if key not in self.plugins:
-            raise ValueError(f"Plugin not found: {key}")
-            
-        plugin_class = self.plugins[key]
-        instance = plugin_class(config)
-        self.plugin_instances[key] = instance
-        return instance
-    
-    def get_plugin(self, plugin_type: str, plugin_name: str) -> OrganoidPlugin:
-        """获取插件实例"""
-        key = f"{plugin_type}.{plugin_name}"
-        return self.plugin_instances.get(key)
-    
-    def load_plugins(self, plugin_dir: Path):
-        """从目录加载插件"""
-        plugin_dir = Path(plugin_dir)
-        if not plugin_dir.exists():
-            raise ValueError(f"Plugin directory not found: {plugin_dir}")
-            
-        for plugin_file in plugin_dir.glob("*.py"):
-            if plugin_file.name.startswith("_"):
-                continue
-                
-            try:
-                module_name = f"plugins.{plugin_file.stem}"
-                spec = importlib.util.spec_from_file_location(
-                    module_name, plugin_file)
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
-                
-                # 查找模块中的插件类
-                for name, obj in inspect.getmembers(module):
-                    if (inspect.isclass(obj) and 
-                        issubclass(obj, OrganoidPlugin) and 
-                        obj != OrganoidPlugin):
-                        self.register_plugin(obj)
-                        
-            except Exception as e:
-                logger.error(f"Error loading plugin {plugin_file}: {str(e)}") 
\ No newline at end of file
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Type
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+from pathlib import Path
+import importlib.util
+import inspect
+import ast
+import logging
+from src.features.shared import SharedFeatures
+
+logger = logging.getLogger(__name__)
+
+class OrganoidPlugin(ABC):
+    """增强的插件基类"""
+    
+    plugin_type: str = ""  # 插件类型标识
+    plugin_name: str = ""  # 插件名称
+    version: str = "1.0.0"  # 插件版本
+    required_features: List[str] = []  # 使用的共享特征（如 regionprops、label_table、surface_mesh）
+    
+    def __init__(self, config: Dict[str, Any] = None):
+        self.config = config or {}
+        self._validate_config()
+    
+    @abstractmethod
+    def define_morphology(self) -> Dict[str, Any]:
+        """定义形态学特征"""
+        pass
+    
+    @abstractmethod
+    def analyze(self, image: np.ndarray) -> Dict[str, Any]:
+        """执行形态分析"""
+        pass
+    
+    def analyze_batch(self, images: Sequence[np.ndarray],
+                      features: Optional[Sequence[SharedFeatures]] = None) -> List[Dict[str, Any]]:
+        """批量分析，默认逐个调用 analyze；声明了 required_features 的插件会收到共享特征"""
+        if features is None or not self.required_features:
+            return [self.analyze(image) for image in images]
+        return [self.analyze(image, features=f) for image, f in zip(images, features)]
+    
+    def _validate_config(self):
+        """验证插件配置"""
+        required_configs = self.get_required_configs()
+        missing = [key for key in required_configs if key not in self.config]
+        if missing:
+            raise ValueError(f"Missing required configs: {missing}")
+    
+    @classmethod
+    def get_required_configs(cls) -> List[str]:
+        """获取必需的配置项"""
+        return []
+    
+    def result_schema(self) -> Dict[str, str]:
+        """结果列及其类型名（define_morphology 的 'features' 项），供列式结果存储建表"""
+        return dict(self.define_morphology().get('features', {}))
+    
+    def get_metadata(self) -> Dict[str, Any]:
+        """获取插件元数据"""
+        return {
+            "type": self.plugin_type,
+            "name": self.plugin_name,
+            "version": self.version,
+            "config": self.config
+        }
+
+def register_plugin(plugin_type: str, plugin_name: str):
+    """插件注册装饰器"""
+    def decorator(cls):
+        cls.plugin_type = plugin_type
+        cls.plugin_name = plugin_name
+        return cls
+    return decorator
+
+@dataclass
+class PluginSpec:
+    """不导入插件模块即可得到的插件元数据"""
+    plugin_type: str
+    plugin_name: str
+    class_name: str
+    path: Path
+    version: str = ""
+    
+    @property
+    def key(self) -> str:
+        return f"{self.plugin_type}.{self.plugin_name}"
+
+def _literal(node: ast.AST) -> Optional[str]:
+    return node.value if isinstance(node, ast.Constant) and isinstance(node.value, str) else None
+
+def scan_plugin_file(plugin_file: Path) -> Tuple[List[PluginSpec], bool]:
+    """静态解析插件文件，从 @register_plugin 装饰器或类属性中读取插件类型与名称
+    
+    返回 (插件元数据, 是否完整)；存在无法静态确定的插件类时需要导入模块才能注册。
+    """
+    tree = ast.parse(Path(plugin_file).read_text(encoding='utf-8'), filename=str(plugin_file))
+    specs, complete = [], True
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef):
+            continue
+        fields: Dict[str, Optional[str]] = {}
+        for stmt in node.body:
+            if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.targets[0], ast.Name):
+                fields[stmt.targets[0].id] = _literal(stmt.value)
+            elif isinstance(stmt, ast.AnnAssign) and isinstance(stmt.target, ast.Name) and stmt.value:
+                fields[stmt.target.id] = _literal(stmt.value)
+        for decorator in node.decorator_list:
+            func = decorator.func if isinstance(decorator, ast.Call) else None
+            name = getattr(func, 'id', getattr(func, 'attr', None))
+            if name == 'register_plugin' and len(decorator.args) == 2:
+                fields['plugin_type'], fields['plugin_name'] = map(_literal, decorator.args)
+        
+        if fields.get('plugin_type') and fields.get('plugin_name'):
+            specs.append(PluginSpec(fields['plugin_type'], fields['plugin_name'], node.name,
+                                    Path(plugin_file), fields.get('version') or ""))
+        elif node.bases:
+            # 可能是通过其他方式设置类型与名称的插件类
+            complete = False
+    return specs, complete
+
+@dataclass
+class PluginError:
+    """某个插件在某个掩膜上失败的记录"""
+    plugin: str
+    error: Exception
+
+class PluginManager:
+    """增强的插件管理系统
+    
+    load_plugins 只静态扫描插件文件登记元数据，插件模块在首次 create_plugin 时才导入。
+    """
+    
+    def __init__(self):
+        self.plugins: Dict[str, Type[OrganoidPlugin]] = {}
+        self.plugin_instances: Dict[str, OrganoidPlugin] = {}
+        self.plugin_specs: Dict[str, PluginSpec] = {}  # 已发现但未导入的插件
+        self._imported_files: Set[Path] = set()
+        
+    def register_plugin(self, plugin_class: Type[OrganoidPlugin]):
+        """注册插件类"""
+        key = f"{plugin_class.plugin_type}.{plugin_class.plugin_name}"
+        self.plugins[key] = plugin_class
+        logger.info(f"Registered plugin: {key}")
+        
+    def create_plugin(self, plugin_type: str, plugin_name: str, 
+                     config: Dict[str, Any] = None) -> OrganoidPlugin:
+        """创建插件实例"""
+        key = f"{plugin_type}.{plugin_name}"
+        if key not in self.plugins and key in self.plugin_specs:
+            self._import_plugin_file(self.plugin_specs[key].path)
+        if key not in self.plugins:
+            raise ValueError(f"Plugin not found: {key}")
+            
+        plugin_class = self.plugins[key]
+        instance = plugin_class(config)
+        self.plugin_instances[key] = instance
+        return instance
+    
+    def get_plugin(self, plugin_type: str, plugin_name: str) -> OrganoidPlugin:
+        """获取插件实例"""
+        key = f"{plugin_type}.{plugin_name}"
+        return self.plugin_instances.get(key)
+    
+    def run_plugins(self, masks: Iterable[np.ndarray], plugin_keys: Optional[List[str]] = None,
+                    batch_size: int = 8, max_workers: int = 1,
+                    spacing: Optional[Sequence[float]] = None) -> Iterator[Dict[str, Any]]:
+        """在掩膜流上运行多个已创建的插件，按输入顺序逐个产出 {插件键: 结果}
+        
+        各插件声明的共享特征每个掩膜只计算一次；同一批掩膜上的各插件在线程池中并行执行。
+        插件失败时对应结果为 PluginError。
+        """
+        keys = plugin_keys or list(self.plugin_instances)
+        missing = [key for key in keys if key not in self.plugin_instances]
+        if missing:
+            raise ValueError(f"Plugins not created: {missing}")
+        plugins = {key: self.plugin_instances[key] for key in keys}
+        required = sorted(set().union(*(p.required_features for p in plugins.values())))
+        
+        masks = iter(masks)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                batch = list(islice(masks, batch_size))
+                if not batch:
+                    break
+                features = [SharedFeatures(mask, spacing) for mask in batch]
+                # 先统一计算共享特征，插件并行执行时只读
+                list(executor.map(lambda f: f.prefetch(required), features))
+                
+                futures = {key: executor.submit(self._run_plugin_batch, key, plugin, batch, features)
+                           for key, plugin in plugins.items()}
+                results = {key: future.result() for key, future in futures.items()}
+                for i in range(len(batch)):
+                    yield {key: results[key][i] for key in keys}
+    
+    @staticmethod
+    def _run_plugin_batch(key: str, plugin: OrganoidPlugin, batch: List[np.ndarray],
+                          features: List[SharedFeatures]) -> List[Any]:
+        """执行插件批处理；整批失败时逐个重试以定位失败的掩膜"""
+        try:
+            return plugin.analyze_batch(batch, features)
+        except Exception:
+            results = []
+            for mask, feature in zip(batch, features):
+                try:
+                    results.extend(plugin.analyze_batch([mask], [feature]))
+                except Exception as e:
+                    logger.error(f"Plugin {key} failed: {str(e)}")
+                    results.append(PluginError(key, e))
+            return results
+    
+    def available_plugins(self) -> List[str]:
+        """已发现（含未导入）的插件键"""
+        return sorted(set(self.plugins) | set(self.plugin_specs))
+    
+    def load_plugins(self, plugin_dir: Path, lazy: bool = True):
+        """从目录发现插件；lazy=False 时立即导入所有插件模块"""
+        plugin_dir = Path(plugin_dir)
+        if not plugin_dir.exists():
+            raise ValueError(f"Plugin directory not found: {plugin_dir}")
+            
+        for plugin_file in plugin_dir.glob("*.py"):
+            if plugin_file.name.startswith("_"):
+                continue
+                
+            try:
+                specs, complete = scan_plugin_file(plugin_file) if lazy else ([], False)
+                for spec in specs:
+                    self.plugin_specs[spec.key] = spec
+                    logger.debug(f"Discovered plugin: {spec.key}")
+                if not complete:
+                    self._import_plugin_file(plugin_file)
+            except Exception as e:
+                logger.error(f"Error loading plugin {plugin_file}: {str(e)}")
+    
+    def _import_plugin_file(self, plugin_file: Path):
+        """导入插件模块并注册其中的插件类"""
+        plugin_file = Path(plugin_file)
+        if plugin_file in self._imported_files:
+            return
+        module_name = f"plugins.{plugin_file.stem}"
+        spec = importlib.util.spec_from_file_location(
+            module_name, plugin_file)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        self._imported_files.add(plugin_file)
+        
+        # 查找模块中的插件类
+        for name, obj in inspect.getmembers(module):
+            if (inspect.isclass(obj) and 
+                issubclass(obj, OrganoidPlugin) and 
+                obj != OrganoidPlugin):
+                self.register_plugin(obj) 
\ No newline at end of file
@@ -1,67 +1,120 @@
-from src.plugin_manager import OrganoidPlugin, register_plugin
-import numpy as np
-from typing import Dict, Any, List
-from skimage import measure
-import logging
-
-logger = logging.getLogger(__name__)
-
-@register_plugin("organoid", "spheroid")
-class SpheroidPlugin(OrganoidPlugin):
-    """球状类器官分析插件"""
-    
-    version = "1.0.0"
-    
-    @classmethod
-    def get_required_configs(cls) -> List[str]:
-        return ["size_range", "sphericity_threshold"]
-    
-    def define_morphology(self) -> Dict[str, Any]:
-        return {
-            'expected_shape': 'spherical',
-            'size_range': self.config['size_range'],
-            'sphericity_threshold': self.config['sphericity_threshold']
-        }
-        
-    def analyze(self, image: np.ndarray) -> Dict[str, Any]:
-        """分析球状类器官"""
-        try:
-            # 基本测量
-            props = measure.regionprops(image.astype(int))[0]
-            
-            # 计算球形度
-            volume = props.area
-            surface_area = self._calculate_surface_area(image)
-            sphericity = self._calculate_sphericity(volume, surface_area)
-            
-            # 检查是否满足形态要求
-            min_size, max_size = self.config['size_range']
-            is_valid = (min_size <= volume <= max_size and 
-                       sphericity >= self.config['sphericity_threshold'])
-            
-            return {
-                'diameter': self._calculate_diameter(props),
-                'volume': volume,
-                'surface_area': surface_area,
-                'sphericity': sphericity,
-                'is_valid_spheroid': is_valid,
-                'centroid': props.centroid,
-                'orientation': props.orientation
-            }
-            
-        except Exception as e:
-            logger.error(f"Error in spheroid analysis: {str(e)}")
-            raise
-            
-    def _calculate_diameter(self, props) -> float:
-        """计算等效直径"""
-        return 2 * (3 * props.area / (4 * np.pi)) ** (1/3)
-    
-    def _calculate_surface_area(self, mask: np.ndarray) -> float:
-        """计算表面积"""
-        # 实现表面积计算逻辑
-        pass
-    
-    def _calculate_sphericity(self, volume: float, surface_area: float) -> float:
-        """计算球形度"""
-        return ((6 * volume * np.pi) ** (2/3)) / surface_area 
\ No newline at end of file
+from src.plugin_manager import OrganoidPlugin, register_plugin
+import numpy as np
+from typing import Dict, Any, List
+from src.features.labeled import label_objects, compute_label_table
+from src.features import surface
+from src.features.shared import SharedFeatures
+import logging
+
+logger = logging.getLogger(__name__)
+
+@register_plugin("organoid", "spheroid")
+class SpheroidPlugin(OrganoidPlugin):
+    """球状类器官分析插件"""
+    
+    version = "1.0.0"
+    required_features = ['regionprops']
+    
+    @classmethod
+    def get_required_configs(cls) -> List[str]:
+        return ["size_range", "sphericity_threshold"]
+    
+    def define_morphology(self) -> Dict[str, Any]:
+        return {
+            'expected_shape': 'spherical',
+            'size_range': self.config['size_range'],
+            'sphericity_threshold': self.config['sphericity_threshold'],
+            # analyze 输出的列及类型
+            'features': {
+                'diameter': 'float64',
+                'volume': 'float64',
+                'surface_area': 'float64',
+                'sphericity': 'float64',
+                'is_valid_spheroid': 'bool',
+                'centroid': 'list<float64>',
+                'orientation': 'float64'
+            }
+        }
+        
+    def analyze(self, image: np.ndarray, features: SharedFeatures = None) -> Dict[str, Any]:
+        """分析球状类器官；features 提供时复用共享的 regionprops"""
+        try:
+            # 基本测量：复用共享的 regionprops，体积/表面积按插件自身的体素尺寸与表面积参数计算
+            spacing, method, options = self._surface_params()
+            precomputed = {'regionprops': features.get('regionprops')} if features is not None else {}
+            context = SharedFeatures(image, spacing, surface_method=method,
+                                     surface_options=options, **precomputed)
+            
+            volume = context.get('volume')
+            min_size, max_size = self.config['size_range']
+            is_valid = min_size <= volume <= max_size
+            
+            # 表面积与球形度只对3D体积有意义；skimage 只为2D区域定义 orientation
+            surface_area = sphericity = orientation = None
+            if image.ndim == 3:
+                surface_area = context.get('surface_area')
+                sphericity = context.get('sphericity')
+                is_valid = is_valid and sphericity >= self.config['sphericity_threshold']
+            else:
+                orientation = context.get('orientation')
+            
+            return {
+                'diameter': context.get('equivalent_diameter'),
+                'volume': volume,
+                'surface_area': surface_area,
+                'sphericity': sphericity,
+                'is_valid_spheroid': is_valid,
+                'centroid': context.get('props').centroid,
+                'orientation': orientation
+            }
+            
+        except Exception as e:
+            logger.error(f"Error in spheroid analysis: {str(e)}")
+            raise
+            
+    def analyze_objects(self, image: np.ndarray) -> Dict[str, np.ndarray]:
+        """逐对象分析掩膜中的所有球状类器官，返回列式表"""
+        try:
+            labels, _ = label_objects(image)
+            table = compute_label_table(labels)
+            spacing, method, options = self._surface_params()
+            volume = table['area'] * (float(np.prod(spacing)) if spacing else 1.0)
+            
+            min_size, max_size = self.config['size_range']
+            is_valid = (volume >= min_size) & (volume <= max_size)
+            centroids = {k: v for k, v in table.items() if k.startswith('centroid-')}
+            result = {
+                'label': table['label'],
+                'diameter': 2 * (3 * volume / (4 * np.pi)) ** (1/3),
+                'volume': volume,
+                **centroids
+            }
+            
+            # 表面积与球形度只对3D体积有意义
+            if labels.ndim == 3:
+                surface_area = surface.surface_area_table(labels, table, spacing, method, **options)
+                sphericity = surface.sphericity(volume, surface_area)
+                result['surface_area'] = surface_area
+                result['sphericity'] = sphericity
+                is_valid &= sphericity >= self.config['sphericity_threshold']
+            result['is_valid_spheroid'] = is_valid
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error in spheroid object analysis: {str(e)}")
+            raise
+            
+    def _calculate_diameter(self, props) -> float:
+        """计算等效直径"""
+        return 2 * (3 * props.area / (4 * np.pi)) ** (1/3)
+    
+    def _surface_params(self):
+        """从 analysis_params 读取体素尺寸、表面积方法及网格参数"""
+        params = self.config.get('analysis_params', {})
+        method = params.get('surface_method', 'voxel')
+        options = {}
+        if method == 'mesh':
+            options['step_size'] = params.get('mesh_step_size', 1)
+            if params.get('surface_smoothing', False):
+                options['smoothing_sigma'] = params.get('smoothing_sigma', 1.0)
+        return params.get('spacing'), method, options
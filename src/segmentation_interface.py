@@ -1,29 +1,239 @@
-from abc import ABC, abstractmethod
-import numpy as np
-
-class SegmentationModel(ABC):
-    """分割模型接口"""
-    
-    @abstractmethod
-    def segment(self, image: np.ndarray) -> np.ndarray:
-        pass
-
-class SAMAdapter(SegmentationModel):
-    """SAM模型适配器"""
-    def __init__(self, model_path: str):
-        # 初始化SAM模型
-        pass
-        
-    def segment(self, image: np.ndarray) -> np.ndarray:
-        # 实现SAM分割
-        pass
-
-class DINOAdapter(SegmentationModel):
-    """DINO模型适配器"""
-    def __init__(self, model_path: str):
-        # 初始化DINO模型
-        pass
-        
-    def segment(self, image: np.ndarray) -> np.ndarray:
-        # 实现DINO分割
-        pass 
\ No newline at end of file
+from abc import ABC, abstractmethod
+from typing import List, Sequence, Union
+from pathlib import Path
+import numpy as np
+from scipy import ndimage
+from src.utils.image_io import ImageReader
+from src.utils.mask_store import MaskStore
+from src.utils.batching import MicroBatcher
+
+class SegmentationModel(ABC):
+    """分割模型接口"""
+    
+    @abstractmethod
+    def segment(self, image: np.ndarray) -> np.ndarray:
+        pass
+    
+    def segment_batch(self, images: Sequence[np.ndarray]) -> List[np.ndarray]:
+        """批量分割（N×H×W[×C] 数组或图像列表）；支持批量前向的模型应重写此方法"""
+        return [self.segment(image) for image in images]
+    
+    def segment_stack(self, reader: ImageReader, out: np.ndarray = None) -> np.ndarray:
+        """逐平面分割3D堆栈，每次只读取一个平面；out 可传入磁盘内存映射数组"""
+        if out is None:
+            out = np.zeros((reader.n_planes, *reader.plane_shape), dtype=np.int32)
+        for index, plane in reader.iter_planes():
+            out[index] = self.segment(plane)
+        return out
+
+class SAMAdapter(SegmentationModel):
+    """SAM模型适配器"""
+    def __init__(self, model_path: str):
+        # 初始化SAM模型
+        pass
+        
+    def segment(self, image: np.ndarray) -> np.ndarray:
+        # 实现SAM分割
+        pass
+
+class DINOAdapter(SegmentationModel):
+    """DINO模型适配器"""
+    def __init__(self, model_path: str):
+        # 初始化DINO模型
+        pass
+        
+    def segment(self, image: np.ndarray) -> np.ndarray:
+        # 实现DINO分割
+        pass 
+
+class BatchedSegmentation(SegmentationModel):
+    """微批处理分割包装器：多个线程并发的 segment 调用合并为一次 segment_batch 前向推理"""
+    
+    def __init__(self, model: SegmentationModel, batcher: MicroBatcher):
+        self.model = model
+        self.batcher = batcher
+        
+    @classmethod
+    def from_config(cls, model: SegmentationModel, config, **kwargs) -> 'BatchedSegmentation':
+        """批大小与队列容量取自 Config 的 batch_size 与 performance.prefetch_factor"""
+        return cls(model, MicroBatcher.from_config(model.segment_batch, config, **kwargs))
+        
+    def __enter__(self):
+        self.batcher.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+        
+    def close(self):
+        """处理完已提交的请求后停止批处理线程"""
+        self.batcher.close()
+        
+    def segment(self, image: np.ndarray) -> np.ndarray:
+        return self.batcher.submit(image).result()
+    
+    def segment_batch(self, images: Sequence[np.ndarray]) -> List[np.ndarray]:
+        return self.batcher.map(images)
+
+class CachedSegmentation(SegmentationModel):
+    """带掩膜存储的分割包装器：同一图像在同一检查点下只推理一次"""
+    
+    def __init__(self, model: SegmentationModel, store: MaskStore, checkpoint: Union[str, Path]):
+        self.model = model
+        self.store = store
+        self.checkpoint = checkpoint  # 检查点路径或已计算的摘要
+        
+    def segment(self, image: np.ndarray) -> np.ndarray:
+        key = self.store.key(image, self.checkpoint)
+        mask = self.store.get(*key)
+        if mask is None:
+            mask = self.model.segment(image)
+            self.store.put(*key, mask)
+        return mask
+    
+    def segment_batch(self, images: Sequence[np.ndarray]) -> List[np.ndarray]:
+        """只把未命中的图像送入模型批量推理"""
+        keys = [self.store.key(image, self.checkpoint) for image in images]
+        masks = [self.store.get(*key) for key in keys]
+        missing = [i for i, mask in enumerate(masks) if mask is None]
+        if missing:
+            # 以列表传入，尺寸不同的图像由模型（或微批处理）决定如何合批
+            predicted = self.model.segment_batch([images[i] for i in missing])
+            for i, mask in zip(missing, predicted):
+                self.store.put(*keys[i], mask)
+                masks[i] = mask
+        return masks
+
+class _LabelUnion:
+    """拼接时合并跨分块标签的并查集"""
+    
+    def __init__(self):
+        self.parent = np.zeros(1, dtype=np.int64)
+        self.written = np.ones(1, dtype=bool)  # 标签是否实际写入输出
+        
+    def add(self, count: int) -> int:
+        """分配 count 个新标签，返回第一个新标签"""
+        start = len(self.parent)
+        self.parent = np.concatenate([self.parent, np.arange(start, start + count)])
+        self.written = np.concatenate([self.written, np.zeros(count, dtype=bool)])
+        return start
+        
+    def find(self, label: int) -> int:
+        root = label
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[label] != root:
+            self.parent[label], label = root, self.parent[label]
+        return root
+        
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+            
+    def lookup_table(self) -> np.ndarray:
+        """所有标签到连续最终标签的映射表"""
+        roots = self.parent.copy()
+        while True:
+            jumped = roots[roots]
+            if np.array_equal(jumped, roots):
+                break
+            roots = jumped
+        # 只为实际写入的标签分配连续编号
+        used = np.unique(roots[self.written])
+        return np.searchsorted(used, roots).astype(np.int32)
+
+
+class TiledSegmentation(SegmentationModel):
+    """分块分割包装器：重叠切块、批量推理、在重叠区合并标签后拼接
+    
+    峰值内存由分块大小决定；输出可通过 out 传入磁盘内存映射数组。
+    overlap 为0时不做跨分块合并，被分块边界切开的对象会保留为多个标签。
+    """
+    
+    def __init__(self, model: SegmentationModel, tile_size: int = 1024,
+                 overlap: int = 128, batch_size: int = 4, min_overlap: float = 0.5):
+        if not 0 <= overlap < tile_size:
+            raise ValueError(f"Overlap {overlap} must be in [0, tile_size={tile_size})")
+        self.model = model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.min_overlap = min_overlap  # 重叠像素占较小对象的比例达到该值才合并
+        
+    def _grid(self, length: int):
+        """分块起点及各分块独占的核心区间（核心区间恰好划分整幅图像）"""
+        step = self.tile_size - self.overlap
+        starts = list(range(0, max(length - self.overlap, 1), step))
+        cores = [0] + [s + self.overlap // 2 for s in starts[1:]] + [length]
+        return [(s, cores[i], cores[i + 1]) for i, s in enumerate(starts)]
+        
+    def segment(self, image: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """分块分割整幅图像（支持内存映射输入），返回拼接后的标签图"""
+        h, w = image.shape[:2]
+        if out is None:
+            out = np.zeros((h, w), dtype=np.int32)
+        labels = _LabelUnion()
+        
+        tiles = [(ry, rx) for ry in self._grid(h) for rx in self._grid(w)]
+        for start in range(0, len(tiles), self.batch_size):
+            batch = tiles[start:start + self.batch_size]
+            inputs = []
+            for (y0, _, _), (x0, _, _) in batch:
+                tile = np.asarray(image[y0:y0 + self.tile_size, x0:x0 + self.tile_size])
+                # 边缘分块补零到统一尺寸，便于批量推理
+                pad = [(0, self.tile_size - tile.shape[0]), (0, self.tile_size - tile.shape[1])]
+                inputs.append(np.pad(tile, pad + [(0, 0)] * (tile.ndim - 2)))
+            
+            for ((y0, cy0, cy1), (x0, cx0, cx1)), mask in zip(batch, self.model.segment_batch(np.stack(inputs))):
+                self._stitch_tile(out, labels, np.asarray(mask), y0, x0, cy0, cy1, cx0, cx1)
+        
+        # 合并后的标签映射为连续编号，按行分块写回以限制内存
+        lut = labels.lookup_table()
+        for y in range(0, h, self.tile_size):
+            out[y:y + self.tile_size] = lut[out[y:y + self.tile_size]]
+        return out
+        
+    def _stitch_tile(self, out: np.ndarray, labels: _LabelUnion, mask: np.ndarray,
+                     y0: int, x0: int, cy0: int, cy1: int, cx0: int, cx1: int):
+        """将单个分块的结果合并进输出"""
+        y1, x1 = min(y0 + self.tile_size, out.shape[0]), min(x0 + self.tile_size, out.shape[1])
+        mask = mask[:y1 - y0, :x1 - x0]
+        
+        # 分块内实例标签映射为全局唯一标签
+        if mask.max(initial=0) <= 1:
+            local, count = ndimage.label(mask > 0)
+        else:
+            # 只对非零像素重新编号：分块可能完全落在对象内部，没有背景像素
+            foreground = mask > 0
+            ids = np.unique(mask[foreground])
+            local = np.where(foreground, np.searchsorted(ids, mask) + 1, 0)
+            count = int(ids.size)
+        first = labels.add(count)
+        tile_labels = np.where(local > 0, local + first - 1, 0)
+        
+        # 已写入区域：上方各行分块的核心区，以及同一行左侧分块的核心区
+        written = np.zeros(mask.shape, dtype=bool)
+        written[:cy0 - y0] = True
+        written[cy0 - y0:cy1 - y0, :cx0 - x0] = True
+        existing = np.asarray(out[y0:y1, x0:x1])
+        both = written & (existing > 0) & (tile_labels > 0)
+        if both.any():
+            self._merge_overlap(labels, existing, tile_labels, written, both)
+        
+        core = tile_labels[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+        out[cy0:cy1, cx0:cx1] = core
+        labels.written[np.unique(core)] = True
+        
+    def _merge_overlap(self, labels: _LabelUnion, existing: np.ndarray, tile_labels: np.ndarray,
+                       written: np.ndarray, both: np.ndarray):
+        """在重叠区按重叠比例合并冲突标签"""
+        pairs, counts = np.unique(np.stack([existing[both], tile_labels[both]]), axis=1,
+                                  return_counts=True)
+        old_ids, old_sizes = np.unique(existing[written & (existing > 0)], return_counts=True)
+        new_ids, new_sizes = np.unique(tile_labels[written & (tile_labels > 0)], return_counts=True)
+        old_size = old_sizes[np.searchsorted(old_ids, pairs[0])]
+        new_size = new_sizes[np.searchsorted(new_ids, pairs[1])]
+        keep = counts >= self.min_overlap * np.minimum(old_size, new_size)
+        for a, b in pairs[:, keep].T:
+            labels.union(int(a), int(b))
@@ -0,0 +1,166 @@
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from concurrent.futures import Future
+import threading
+import queue
+import time
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def pad_to_common_shape(images: Sequence[np.ndarray]) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """将不同尺寸的图像右下补零到同一尺寸并堆叠，返回堆栈和原始 (h, w)"""
+    shapes = [img.shape[:2] for img in images]
+    h = max(s[0] for s in shapes)
+    w = max(s[1] for s in shapes)
+    batch = np.zeros((len(images), h, w) + images[0].shape[2:], dtype=images[0].dtype)
+    for i, img in enumerate(images):
+        batch[i, :img.shape[0], :img.shape[1]] = img
+    return batch, shapes
+
+
+def resize_to_shape(images: Sequence[np.ndarray], shape: Tuple[int, int]) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """将图像缩放到统一尺寸并堆叠，返回堆栈和原始 (h, w)"""
+    from skimage.transform import resize
+
+    shapes = [img.shape[:2] for img in images]
+    batch = np.stack([
+        img if img.shape[:2] == tuple(shape) else
+        resize(img, tuple(shape) + img.shape[2:], preserve_range=True, anti_aliasing=True).astype(img.dtype)
+        for img in images
+    ])
+    return batch, shapes
+
+
+def restore_output(output: Any, shape: Tuple[int, int], batch_shape: Tuple[int, int], mode: str) -> Any:
+    """将批处理输出还原到原始尺寸：补零模式裁剪，缩放模式最近邻缩放回原尺寸"""
+    if not isinstance(output, np.ndarray) or output.shape[:2] != tuple(batch_shape):
+        return output
+    if mode == 'pad':
+        return output[:shape[0], :shape[1]]
+    from skimage.transform import resize
+    return resize(output, tuple(shape) + output.shape[2:], order=0,
+                  preserve_range=True, anti_aliasing=False).astype(output.dtype)
+
+
+class MicroBatcher:
+    """动态微批处理：收集请求直到达到批大小或等待超时，合并为一次前向推理后按请求拆分结果
+
+    batch_fn 接收 N×H×W[×C] 数组，返回长度为 N 的输出序列。
+    """
+
+    def __init__(self, batch_fn: Callable[[np.ndarray], Sequence[Any]],
+                 max_batch_size: int = 16, max_latency: float = 0.01,
+                 mode: str = 'pad', target_shape: Optional[Tuple[int, int]] = None,
+                 max_queue_size: int = 0):
+        if mode not in ('pad', 'resize'):
+            raise ValueError(f"Unsupported batching mode: {mode}")
+        if mode == 'resize' and target_shape is None:
+            raise ValueError("target_shape is required for resize mode")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency  # 首个请求到达后的最长等待时间（秒）
+        self.mode = mode
+        self.target_shape = target_shape
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, batch_fn: Callable[[np.ndarray], Sequence[Any]], config, **kwargs) -> 'MicroBatcher':
+        """根据 Config 的 batch_size 与 performance.prefetch_factor 创建"""
+        performance = getattr(config, 'performance', {}) or {}
+        batch_size = performance.get('batch_size', config.batch_size)
+        prefetch_factor = performance.get('prefetch_factor', 2)
+        return cls(batch_fn, max_batch_size=batch_size,
+                   max_queue_size=batch_size * prefetch_factor, **kwargs)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        """启动后台批处理线程（并发首次提交时也只启动一个）"""
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._worker.start()
+
+    def close(self):
+        """处理完已提交的请求后停止"""
+        with self._worker_lock:
+            if self._worker is not None:
+                self._queue.put(_STOP)
+                self._worker.join()
+                self._worker = None
+
+    def submit(self, image: np.ndarray) -> Future:
+        """提交单个图像，返回结果 Future；队列已满时阻塞（背压）"""
+        self.start()
+        future: Future = Future()
+        self._queue.put((np.asarray(image), future))
+        return future
+
+    def map(self, images: Sequence[np.ndarray]) -> List[Any]:
+        """提交一组图像并按输入顺序返回结果"""
+        futures = [self.submit(img) for img in images]
+        return [f.result() for f in futures]
+
+    def _collect(self) -> Tuple[list, bool]:
+        """阻塞等待首个请求，然后在截止时间内尽量凑满一批"""
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        items = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return items, True
+            items.append(item)
+        return items, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            items, stop = self._collect()
+            if items:
+                self._process(items)
+
+    def _process(self, items: list):
+        """合并为一次前向推理并把输出分发给各请求"""
+        images = [img for img, _ in items]
+        futures = [f for _, f in items]
+        try:
+            # 尺寸不同的请求补零或缩放到同一尺寸
+            same_shape = len({img.shape for img in images}) == 1
+            if self.mode == 'resize':
+                batch, shapes = resize_to_shape(images, self.target_shape)
+            elif same_shape:
+                batch, shapes = np.stack(images), [img.shape[:2] for img in images]
+            else:
+                batch, shapes = pad_to_common_shape(images)
+
+            outputs = self.batch_fn(batch)
+            if len(outputs) != len(images):
+                raise RuntimeError(f"batch_fn returned {len(outputs)} outputs for {len(images)} inputs")
+
+            for future, output, shape in zip(futures, outputs, shapes):
+                future.set_result(restore_output(output, shape, batch.shape[1:3], self.mode))
+        except Exception as e:
+            logger.error(f"Micro-batch of {len(items)} failed: {str(e)}")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,97 @@
+from typing import Any, Optional, Tuple, Union, TYPE_CHECKING
+from pathlib import Path
+import tempfile
+import sys
+import os
+import logging
+from src.utils.hashing import digest_file
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+
+def is_torch_module(obj: Any) -> bool:
+    """判断是否为 torch 模块；torch 尚未导入时对象不可能是模块，无需为此导入 torch"""
+    torch = sys.modules.get('torch')
+    return torch is not None and isinstance(obj, torch.nn.Module)
+
+
+def configure_torch_threads(intra_op: Optional[int] = None, inter_op: Optional[int] = None):
+    """设置当前进程的 intra-op / inter-op 线程数；多进程时每个工作进程应各自调用
+
+    inter-op 线程池只能在首次并行运算前设置一次，之后的调用会被忽略。
+    """
+    if not intra_op and not inter_op:
+        return
+    import torch
+    
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            logger.debug(f"Inter-op threads already fixed: {str(e)}")
+
+
+def artifact_path(checkpoint_path: Path, suffix: str, quantize: bool = False) -> Path:
+    """编译产物路径：与检查点同目录，文件名带检查点摘要，检查点变化后自动失效"""
+    checkpoint_path = Path(checkpoint_path)
+    tag = digest_file(checkpoint_path)[:12] + ('.int8' if quantize else '')
+    return checkpoint_path.with_name(f"{checkpoint_path.stem}.{tag}{suffix}")
+
+
+def _save_atomic(module: "torch.jit.ScriptModule", path: Path):
+    import torch
+    
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    os.close(fd)
+    try:
+        torch.jit.save(module, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def compile_for_cpu(module: "torch.nn.Module", example_inputs: Union["torch.Tensor", Tuple[Any, ...]],
+                    cache_path: Path, quantize: bool = False) -> "torch.jit.ScriptModule":
+    """将模块编译为冻结的 TorchScript（可选动态int8量化），产物缓存到 cache_path
+
+    已存在的缓存直接加载，不再重新追踪。缓存的是冻结后的图，
+    optimize_for_inference 的融合结果不可序列化，每次加载后重新应用。
+    """
+    import torch
+    
+    cache_path = Path(cache_path)
+    if cache_path.exists():
+        try:
+            return torch.jit.optimize_for_inference(torch.jit.load(str(cache_path), map_location='cpu'))
+        except Exception as e:
+            logger.warning(f"Recompiling unreadable artifact {cache_path}: {str(e)}")
+
+    try:
+        module = module.cpu().eval()
+        if quantize:
+            # 动态int8量化只作用于全连接与循环层（卷积层需要校准数据的静态量化）
+            layers = {torch.nn.Linear, torch.nn.LSTM, torch.nn.GRU}
+            module = torch.ao.quantization.quantize_dynamic(module, layers, dtype=torch.qint8)
+        inputs = example_inputs if isinstance(example_inputs, tuple) else (example_inputs,)
+        with torch.no_grad():
+            frozen = torch.jit.freeze(torch.jit.trace(module, inputs))
+        _save_atomic(frozen, cache_path)
+        logger.info(f"Compiled CPU inference artifact {cache_path}")
+        return torch.jit.optimize_for_inference(frozen)
+    except Exception as e:
+        logger.error(f"Error compiling model for CPU: {str(e)}")
+        raise
+
+
+def quantize_onnx(onnx_path: Path, output_path: Path) -> Path:
+    """用 onnxruntime 对 ONNX 模型做动态int8权重量化"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(onnx_path), str(output_path), weight_type=QuantType.QInt8)
+    return Path(output_path)
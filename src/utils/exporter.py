@@ -1,107 +1,392 @@
-from typing import Dict, Any
-import pandas as pd
-import json
-from pathlib import Path
-import matplotlib.pyplot as plt
-import logging
-
-logger = logging.getLogger(__name__)
-
-class ResultExporter:
-    """增强的结果导出工具"""
-    
-    def __init__(self, output_dir: Path):
-        self.output_dir = output_dir
-        self.output_dir.mkdir(parents=True, exist_ok=True)
-        
-    def export_to_csv(self, results: List[Dict[str, Any]], filename: str):
-        """导出为CSV文件"""
-        try:
-            df = pd.DataFrame(results)
-            output_path = self.output_dir / f"{filename}.csv"
-            df.to_csv(output_path, index=False)
-            logger.info(f"Results exported to {output_path}")
-        except Exception as e:
-            logger.error(f"Error exporting to CSV: {str(e)}")
-            
-    def export_to_json(self, results: Dict[str, Any], filename: str):
-        """导出为JSON文件"""
-        try:
-            output_path = self.output_dir / f"{filename}.json"
-            with open(output_path, 'w') as f:
-                json.dump(results, f, indent=2)
-            logger.info(f"Results exported to {output_path}")
-        except Exception as e:
-            logger.error(f"Error exporting to JSON: {str(e)}")
-            
-    def save_figures(self, figures: Dict[str, plt.Figure]):
-        """保存matplotlib图形"""
-        try:
-            for name, fig in figures.items():
-                output_path = self.output_dir / f"{name}.png"
-                fig.savefig(output_path, dpi=300, bbox_inches='tight')
-                plt.close(fig)
-            logger.info(f"Figures saved to {self.output_dir}")
-        except Exception as e:
-            logger.error(f"Error saving figures: {str(e)}")
-            
-    def export_time_series(self, time_series_data: Dict[str, Any], filename: str):
-        """导出时间序列数据"""
-        try:
-            # 导出为CSV
-            df = pd.DataFrame(time_series_data['time_points'])
-            csv_path = self.output_dir / f"{filename}_timeseries.csv"
-            df.to_csv(csv_path, index=False)
-            
-            # 导出分析结果
-            analysis_path = self.output_dir / f"{filename}_analysis.json"
-            analysis_results = {
-                'growth_analysis': time_series_data.get('growth_analysis', {}),
-                'morphology_changes': time_series_data.get('morphology_changes', {})
-            }
-            with open(analysis_path, 'w') as f:
-                json.dump(analysis_results, f, indent=2)
-            
-            # 生成时间序列图表
-            self._plot_time_series(time_series_data, filename)
-            
-            logger.info(f"Time series data exported to {self.output_dir}")
-            
-        except Exception as e:
-            logger.error(f"Error exporting time series data: {str(e)}")
-            
-    def _plot_time_series(self, data: Dict[str, Any], filename: str):
-        """绘制时间序列图表"""
-        try:
-            df = pd.DataFrame(data['time_points'])
-            
-            # 创建多子图
-            fig, axes = plt.subplots(2, 2, figsize=(15, 10))
-            
-            # 绘制生长曲线
-            axes[0,0].plot(df['time'], df['volume'], 'b-')
-            axes[0,0].set_title('Growth Curve')
-            axes[0,0].set_xlabel('Time')
-            axes[0,0].set_ylabel('Volume')
-            
-            # 绘制形态变化
-            axes[0,1].plot(df['time'], df['sphericity'], 'r-')
-            axes[0,1].set_title('Morphology Changes')
-            axes[0,1].set_xlabel('Time')
-            axes[0,1].set_ylabel('Sphericity')
-            
-            # 绘制生长率
-            if 'growth_analysis' in data:
-                growth_rate = data['growth_analysis']['growth_rate']
-                axes[1,0].plot(df['time'][1:], growth_rate, 'g-')
-                axes[1,0].set_title('Growth Rate')
-                axes[1,0].set_xlabel('Time')
-                axes[1,0].set_ylabel('Growth Rate')
-            
-            # 保存图表
-            plot_path = self.output_dir / f"{filename}_timeseries_plots.png"
-            plt.savefig(plot_path, dpi=300, bbox_inches='tight')
-            plt.close()
-            
-        except Exception as e:
+from typing import Dict, Any, Iterable, List, Optional, Sequence, Tuple, TYPE_CHECKING
+import pandas as pd
+import tempfile
+import threading
+import queue
+import json
+import csv
+import os
+from pathlib import Path
+import numpy as np
+import logging
+
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+logger = logging.getLogger(__name__)
+
+
+def _umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# 导出文件的权限：mkstemp 创建的临时文件为 0600，重命名前改为与普通新建文件一致
+_FILE_MODE = 0o666 & ~_umask()
+
+
+def _make_temp(path: Path) -> Tuple[int, str]:
+    """在目标目录创建临时文件（普通文件权限），返回 (fd, 路径)"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        os.chmod(tmp, _FILE_MODE)
+    except BaseException:
+        os.close(fd)
+        Path(tmp).unlink(missing_ok=True)
+        raise
+    return fd, tmp
+
+
+def _json_default(value: Any) -> Any:
+    """json 不认识的类型：NumPy 标量/数组、路径"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, Path):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value: Any) -> Any:
+    """CSV 单元格：缺失为空，序列写成 JSON 列表，NumPy 标量转为 Python 标量"""
+    if value is None:
+        return ''
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return json.dumps(value, default=_json_default)
+    return value
+
+
+def _write_atomic(path: Path, write):
+    """先写同目录临时文件再重命名，失败时不留下半个文件"""
+    fd, tmp = _make_temp(path)
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+class _CsvEncoder:
+    """表头为给定的 columns；未给出时取第一块结果中出现的列（按出现顺序）
+    
+    表头写出后不能再增加列，之后出现的新列不会写出（首次出现时记录警告）。
+    """
+    
+    def __init__(self, columns: Optional[Sequence[str]] = None):
+        self._columns = list(columns) if columns is not None else None
+        
+    def open(self, path: Path):
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._header_written = False
+        self._dropped = set()
+        
+    def write(self, rows: List[Dict[str, Any]]):
+        if self._columns is None:
+            self._columns = list(dict.fromkeys(k for row in rows for k in row))
+        if not self._header_written:
+            self._writer.writerow(self._columns)
+            self._header_written = True
+            self._known = set(self._columns)
+        unseen = {k for row in rows for k in row} - self._known - self._dropped
+        if unseen:
+            self._dropped |= unseen
+            logger.warning(f"Columns {sorted(unseen)} are not in the CSV header and will not be "
+                           f"exported; pass columns= to include them")
+        self._writer.writerows([_csv_value(row.get(k)) for k in self._columns] for row in rows)
+        
+    def close(self):
+        self._file.close()
+
+
+class _NdjsonEncoder:
+    """每行一个 JSON 对象"""
+    
+    def open(self, path: Path):
+        self._file = open(path, 'w')
+        
+    def write(self, rows: List[Dict[str, Any]]):
+        self._file.write(''.join(json.dumps(row, default=_json_default) + '\n' for row in rows))
+        
+    def close(self):
+        self._file.close()
+
+
+class _ParquetEncoder:
+    """每块写成一个行组；未给出 schema 时由第一块推断（其中全为空的列按 float64 存储）"""
+    
+    def __init__(self, schema: Any = None, compression: str = 'zstd'):
+        self.schema = schema
+        self.compression = compression
+        
+    def open(self, path: Path):
+        self._path = path
+        self._writer = None
+        
+    def write(self, rows: List[Dict[str, Any]]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from src.utils.feature_store import promote_null_fields
+        
+        table = pa.Table.from_pylist(rows, schema=self.schema)
+        if self.schema is None:
+            self.schema = promote_null_fields(table.schema)
+            table = table.cast(self.schema)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._path, self.schema, compression=self.compression)
+        self._writer.write_table(table)
+        
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+_ENCODERS = {
+    'csv': _CsvEncoder,
+    'ndjson': _NdjsonEncoder,
+    'parquet': _ParquetEncoder,
+}
+
+
+class ResultStream:
+    """结果流式写出：调用方逐行写入，按块经有界队列交给后台线程编码写盘
+    
+    导出与分析重叠执行；队列满时写入方阻塞，内存占用不超过 queue_size 块。
+    数据先写入同目录的临时文件，close 成功后才原子重命名为目标文件。
+    CSV 的表头在写出第一块时确定：行的键不固定时应通过 columns 给出完整列名，
+    否则只写出第一块中出现的列。Parquet 的列类型同样由 schema 给出（pyarrow.Schema，
+    或 schema_from_morphology 接受的 {列名: 类型名}），否则由第一块推断。
+    """
+    
+    def __init__(self, path: Path, format: str = 'csv', chunk_size: int = 1024, queue_size: int = 8,
+                 columns: Optional[Sequence[str]] = None, schema: Any = None):
+        if format not in _ENCODERS:
+            raise ValueError(f"Unsupported export format: {format}")
+        if chunk_size < 1 or queue_size < 1:
+            raise ValueError("chunk_size and queue_size must be positive")
+        self.path = Path(path)
+        self.chunk_size = chunk_size
+        self.rows_written = 0
+        if format == 'csv':
+            self._encoder = _CsvEncoder(columns)
+        elif format == 'parquet':
+            if isinstance(schema, dict):
+                from src.utils.feature_store import schema_from_morphology
+                schema = schema_from_morphology(schema)
+            self._encoder = _ParquetEncoder(schema)
+        else:
+            self._encoder = _ENCODERS[format]()
+        self._chunk: List[Dict[str, Any]] = []
+        self._queue: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=queue_size)
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        
+        fd, tmp = _make_temp(self.path)
+        os.close(fd)
+        self._tmp_path = Path(tmp)
+        self._encoder.open(self._tmp_path)
+        self._thread = threading.Thread(target=self._run, name=f"export-{self.path.name}", daemon=True)
+        self._thread.start()
+        
+    def _run(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self._error is not None:
+                continue  # 出错后继续取空队列，避免写入方阻塞
+            try:
+                self._encoder.write(chunk)
+            except BaseException as e:
+                self._error = e
+                
+    def write(self, row: Dict[str, Any]):
+        """写入一行结果"""
+        if self._closed:
+            raise ValueError(f"Result stream {self.path} is closed")
+        if self._error is not None:
+            raise self._error
+        self._chunk.append(row)
+        self.rows_written += 1
+        if len(self._chunk) >= self.chunk_size:
+            self._queue.put(self._chunk)
+            self._chunk = []
+            
+    def extend(self, rows: Iterable[Dict[str, Any]]):
+        for row in rows:
+            self.write(row)
+            
+    def _finish(self) -> Optional[BaseException]:
+        if self._chunk:
+            self._queue.put(self._chunk)
+            self._chunk = []
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            self._encoder.close()
+        except BaseException as e:
+            self._error = self._error or e
+        self._closed = True
+        return self._error
+            
+    def close(self) -> Path:
+        """等待后台写完并发布文件"""
+        if self._closed:
+            return self.path
+        error = self._finish()
+        if error is not None:
+            self._tmp_path.unlink(missing_ok=True)
+            logger.error(f"Error exporting to {self.path}: {str(error)}")
+            raise error
+        os.replace(self._tmp_path, self.path)
+        logger.info(f"Results exported to {self.path}")
+        return self.path
+        
+    def abort(self):
+        """丢弃已写入的内容"""
+        if not self._closed:
+            self._finish()
+        self._tmp_path.unlink(missing_ok=True)
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ResultExporter:
+    """增强的结果导出工具"""
+    
+    def __init__(self, output_dir: Path):
+        self.output_dir = output_dir
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        
+    def open_stream(self, filename: str, format: str = 'csv', chunk_size: int = 1024,
+                    queue_size: int = 8, columns: Optional[Sequence[str]] = None,
+                    schema: Any = None) -> ResultStream:
+        """打开流式导出（csv / ndjson / parquet），分析过程中逐行写入
+        
+        columns 为 CSV 的固定列名，schema 为 Parquet 的列类型（如 schema_from_morphology 的结果）。
+        """
+        return ResultStream(self.output_dir / f"{filename}.{format}", format, chunk_size, queue_size,
+                            columns, schema)
+        
+    def export_stream(self, rows: Iterable[Dict[str, Any]], filename: str, format: str = 'csv',
+                      chunk_size: int = 1024, queue_size: int = 8,
+                      columns: Optional[Sequence[str]] = None, schema: Any = None) -> Path:
+        """从结果迭代器流式导出，不需要把全部结果放在内存中"""
+        with self.open_stream(filename, format, chunk_size, queue_size, columns, schema) as stream:
+            stream.extend(rows)
+        return stream.path
+        
+    @staticmethod
+    def _union_columns(rows: Iterable[Dict[str, Any]]) -> Optional[List[str]]:
+        """已在内存中的结果列表取所有行的列名并集；迭代器返回 None（按第一块确定）"""
+        if not isinstance(rows, (list, tuple)):
+            return None
+        return list(dict.fromkeys(k for row in rows for k in row))
+        
+    def export_to_csv(self, results: Iterable[Dict[str, Any]], filename: str,
+                      columns: Optional[Sequence[str]] = None):
+        """导出为CSV文件；结果为列表时默认写出所有行的列名并集"""
+        try:
+            self.export_stream(results, filename, 'csv',
+                               columns=columns if columns is not None else self._union_columns(results))
+        except Exception as e:
+            logger.error(f"Error exporting to CSV: {str(e)}")
+            
+    def export_to_json(self, results: Any, filename: str):
+        """导出为JSON文件"""
+        try:
+            output_path = self.output_dir / f"{filename}.json"
+            _write_atomic(output_path, lambda f: json.dump(results, f, indent=2, default=_json_default))
+            logger.info(f"Results exported to {output_path}")
+        except Exception as e:
+            logger.error(f"Error exporting to JSON: {str(e)}")
+            
+    def save_figures(self, figures: Dict[str, "Figure"]):
+        """保存matplotlib图形"""
+        try:
+            import matplotlib.pyplot as plt
+            
+            for name, fig in figures.items():
+                output_path = self.output_dir / f"{name}.png"
+                fig.savefig(output_path, dpi=300, bbox_inches='tight')
+                plt.close(fig)
+            logger.info(f"Figures saved to {self.output_dir}")
+        except Exception as e:
+            logger.error(f"Error saving figures: {str(e)}")
+            
+    def export_time_series(self, time_series_data: Dict[str, Any], filename: str):
+        """导出时间序列数据"""
+        try:
+            # 导出为CSV
+            time_points = time_series_data['time_points']
+            self.export_stream(time_points, f"{filename}_timeseries", 'csv',
+                               columns=self._union_columns(time_points))
+            
+            # 导出分析结果
+            analysis_path = self.output_dir / f"{filename}_analysis.json"
+            analysis_results = {
+                'growth_analysis': time_series_data.get('growth_analysis', {}),
+                'morphology_changes': time_series_data.get('morphology_changes', {}),
+                'growth_models': time_series_data.get('growth_models', {})
+            }
+            _write_atomic(analysis_path,
+                          lambda f: json.dump(analysis_results, f, indent=2, default=_json_default))
+            
+            # 生成时间序列图表
+            self._plot_time_series(time_series_data, filename)
+            
+            logger.info(f"Time series data exported to {self.output_dir}")
+            
+        except Exception as e:
+            logger.error(f"Error exporting time series data: {str(e)}")
+            
+    def _plot_time_series(self, data: Dict[str, Any], filename: str):
+        """绘制时间序列图表"""
+        try:
+            import matplotlib.pyplot as plt
+            
+            df = pd.DataFrame(data['time_points'])
+            
+            # 创建多子图
+            fig, axes = plt.subplots(2, 2, figsize=(15, 10))
+            
+            # 绘制生长曲线
+            axes[0,0].plot(df['time'], df['volume'], 'b-')
+            axes[0,0].set_title('Growth Curve')
+            axes[0,0].set_xlabel('Time')
+            axes[0,0].set_ylabel('Volume')
+            
+            # 绘制形态变化
+            axes[0,1].plot(df['time'], df['sphericity'], 'r-')
+            axes[0,1].set_title('Morphology Changes')
+            axes[0,1].set_xlabel('Time')
+            axes[0,1].set_ylabel('Sphericity')
+            
+            # 绘制生长率
+            if 'growth_analysis' in data:
+                growth_rate = data['growth_analysis']['growth_rate']
+                axes[1,0].plot(df['time'][1:], growth_rate, 'g-')
+                axes[1,0].set_title('Growth Rate')
+                axes[1,0].set_xlabel('Time')
+                axes[1,0].set_ylabel('Growth Rate')
+            
+            # 保存图表
+            plot_path = self.output_dir / f"{filename}_timeseries_plots.png"
+            plt.savefig(plot_path, dpi=300, bbox_inches='tight')
+            plt.close()
+            
+        except Exception as e:
             logger.error(f"Error plotting time series: {str(e)}") 
\ No newline at end of file
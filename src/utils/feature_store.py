@@ -0,0 +1,184 @@
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Union
+from pathlib import Path
+import threading
+import time
+import os
+import logging
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+# define_morphology 中 'features' 项可用的类型名
+_TYPES = {
+    'float64': pa.float64(),
+    'float32': pa.float32(),
+    'int64': pa.int64(),
+    'int32': pa.int32(),
+    'bool': pa.bool_(),
+    'string': pa.string(),
+    'list<float64>': pa.list_(pa.float64()),
+    'list<int64>': pa.list_(pa.int64()),
+}
+
+
+def schema_from_morphology(columns: Mapping[str, str],
+                           extra: Optional[Mapping[str, str]] = None) -> pa.Schema:
+    """由插件声明的 {列名: 类型名} 构建 Arrow 表结构，extra 为附加的元数据列（如 image_path）"""
+    fields = []
+    for name, type_name in {**(extra or {}), **columns}.items():
+        if type_name not in _TYPES:
+            raise ValueError(f"Unsupported column type {type_name} for {name}")
+        fields.append(pa.field(name, _TYPES[type_name]))
+    return pa.schema(fields)
+
+
+def promote_null_fields(schema: pa.Schema, type_name: str = 'float64') -> pa.Schema:
+    """推断出的 null 类型列（样本中全为空）改为 type_name 类型，之后的非空值才能写入"""
+    nulls = [f.name for f in schema if pa.types.is_null(f.type)]
+    if not nulls:
+        return schema
+    logger.warning(f"Columns {nulls} were empty when the schema was inferred and are stored as "
+                   f"{type_name}; pass an explicit schema to choose their types")
+    return pa.schema([f.with_type(_TYPES[type_name]) if f.name in nulls else f for f in schema])
+
+
+class FeatureStore:
+    """列式特征结果存储：目录下的 Parquet 分片，结果按行组增量追加
+
+    每次写入会话生成一个新分片，写完（close）后才以原子重命名的方式出现在目录中，
+    中断的运行不会留下半个文件。读取时只解码请求的列，过滤条件按行组统计下推。
+    未给出 schema 时由第一批结果推断（其中全为空的列按 float64 存储），之后的批次按该结构转换。
+    行组转换失败时二分定位第一个出错的行，去掉该行并报告行号，其余缓冲的行保留。
+    """
+
+    def __init__(self, root: Path, schema: Optional[pa.Schema] = None,
+                 row_group_size: int = 4096, compression: str = 'zstd'):
+        if row_group_size < 1:
+            raise ValueError("row_group_size must be positive")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self._rows: List[Dict[str, Any]] = []
+        self._appended = 0  # 本会话已接受的行数，用于在错误中定位行号
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._tmp_path: Optional[Path] = None
+        self._part_path: Optional[Path] = None
+        self._lock = threading.Lock()
+
+    def append(self, row: Mapping[str, Any]):
+        """追加一行结果，缓冲满一个行组时写出"""
+        with self._lock:
+            self._rows.append(dict(row))
+            self._appended += 1
+            if len(self._rows) >= self.row_group_size:
+                self._write_rows()
+
+    def extend(self, rows: Iterable[Mapping[str, Any]]):
+        for row in rows:
+            self.append(row)
+
+    def flush(self):
+        """把缓冲的行写成一个行组（分片在 close 之前对读取不可见）"""
+        with self._lock:
+            self._write_rows()
+
+    def close(self) -> Optional[Path]:
+        """写出剩余的行并发布当前分片，返回分片路径（没有写入任何行时为 None）"""
+        with self._lock:
+            self._write_rows()
+            if self._writer is None:
+                return None
+            part_path = self._part_path
+            try:
+                self._writer.close()
+                os.replace(self._tmp_path, part_path)
+            except BaseException:
+                self._tmp_path.unlink(missing_ok=True)
+                raise
+            finally:
+                self._writer = self._tmp_path = self._part_path = None
+            logger.info(f"Feature results written to {part_path}")
+            return part_path
+
+    def abort(self):
+        """丢弃当前未发布的分片"""
+        with self._lock:
+            self._rows.clear()
+            if self._writer is not None:
+                self._writer.close()
+                self._tmp_path.unlink(missing_ok=True)
+                self._writer = self._tmp_path = self._part_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _first_bad_row(self) -> int:
+        """行组转换失败时，二分查找第一个使前缀无法转换的行"""
+        lo, hi = 0, len(self._rows) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            try:
+                pa.Table.from_pylist(self._rows[:mid + 1], schema=self.schema)
+                lo = mid + 1
+            except (pa.ArrowException, TypeError, ValueError):
+                hi = mid
+        return lo
+
+    def _write_rows(self):
+        if not self._rows:
+            return
+        try:
+            try:
+                table = pa.Table.from_pylist(self._rows, schema=self.schema)
+            except (pa.ArrowException, TypeError, ValueError) as e:
+                # 去掉出错的行并报告其行号，其余缓冲的行保留到下次写出
+                bad = self._first_bad_row()
+                index = self._appended - len(self._rows) + bad
+                del self._rows[bad]
+                raise ValueError(f"Feature row {index} could not be converted and was dropped: "
+                                 f"{str(e)}") from e
+            if self.schema is None:
+                self.schema = promote_null_fields(table.schema)
+                table = table.cast(self.schema)
+            if self._writer is None:
+                name = f"part-{time.time_ns()}-{os.getpid()}"
+                self._part_path = self.root / f"{name}.parquet"
+                self._tmp_path = self.root / f".{name}.parquet.tmp"
+                self._writer = pq.ParquetWriter(self._tmp_path, self.schema,
+                                                compression=self.compression)
+            self._writer.write_table(table, row_group_size=self.row_group_size)
+            self._rows.clear()
+        except Exception as e:
+            logger.error(f"Error writing feature row group: {str(e)}")
+            raise
+
+    def parts(self) -> List[Path]:
+        """已发布的分片，按写入时间排序"""
+        return sorted(self.root.glob('part-*.parquet'))
+
+    def read(self, columns: Optional[Sequence[str]] = None,
+             filters: Optional[Union[List[tuple], "pa.compute.Expression"]] = None) -> pa.Table:
+        """读取结果；columns 只解码所需的列，filters 如 [('sphericity', '>=', 0.8)] 按行组统计跳过数据"""
+        parts = self.parts()
+        if not parts:
+            return (self.schema or pa.schema([])).empty_table()
+        try:
+            return pq.read_table([str(p) for p in parts], columns=columns, filters=filters,
+                                 schema=self.schema)
+        except Exception as e:
+            logger.error(f"Error reading feature store {self.root}: {str(e)}")
+            raise
+
+    def read_pandas(self, columns: Optional[Sequence[str]] = None,
+                    filters: Optional[Union[List[tuple], "pa.compute.Expression"]] = None):
+        """读取为 DataFrame"""
+        return self.read(columns, filters).to_pandas()
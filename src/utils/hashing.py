@@ -0,0 +1,74 @@
+from typing import Any, Dict, Tuple
+from pathlib import Path
+import hashlib
+import json
+import threading
+import numpy as np
+
+# 大数组与大文件按块送入哈希，避免一次性读入内存（内存映射数组同样按需分页）
+_HASH_CHUNK_BYTES = 16 << 20
+_DIGEST_SIZE = 20
+
+_file_digests: Dict[Tuple[str, int, int], str] = {}
+_file_digests_lock = threading.Lock()
+
+
+def _hasher():
+    return hashlib.blake2b(digest_size=_DIGEST_SIZE)
+
+
+def _update_array(h, arr: np.ndarray):
+    """把数组的类型、形状与内容写入哈希"""
+    arr = np.asarray(arr)
+    h.update(f"ndarray:{arr.dtype.str}:{arr.shape}".encode())
+    flat = arr.reshape(-1) if arr.flags.c_contiguous else np.ascontiguousarray(arr).reshape(-1)
+    step = max(_HASH_CHUNK_BYTES // max(arr.itemsize, 1), 1)
+    for start in range(0, flat.size, step):
+        h.update(memoryview(np.ascontiguousarray(flat[start:start + step])).cast('B'))
+
+
+def digest_array(arr: np.ndarray) -> str:
+    """图像内容哈希"""
+    h = _hasher()
+    _update_array(h, arr)
+    return h.hexdigest()
+
+
+def digest_file(path: Path) -> str:
+    """文件内容哈希（如模型检查点），按 (路径, 大小, 修改时间) 在进程内记忆"""
+    path = Path(path)
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    with _file_digests_lock:
+        if key in _file_digests:
+            return _file_digests[key]
+
+    h = _hasher()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_CHUNK_BYTES), b''):
+            h.update(block)
+    digest = h.hexdigest()
+    with _file_digests_lock:
+        _file_digests[key] = digest
+    return digest
+
+
+def _update(h, part: Any):
+    if isinstance(part, np.ndarray):
+        _update_array(h, part)
+    elif isinstance(part, Path):
+        h.update(f"file:{digest_file(part) if part.is_file() else part}".encode())
+    elif isinstance(part, bytes):
+        h.update(b"bytes:" + part)
+    else:
+        # 配置字典等按规范化JSON哈希，键顺序不影响结果
+        h.update(b"json:" + json.dumps(part, sort_keys=True, default=str).encode())
+    h.update(b"\x00")
+
+
+def make_cache_key(*parts: Any) -> str:
+    """内容寻址缓存键：数组按内容、Path 按文件内容、其余按规范化JSON参与哈希"""
+    h = _hasher()
+    for part in parts:
+        _update(h, part)
+    return h.hexdigest()
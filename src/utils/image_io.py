@@ -0,0 +1,131 @@
+from typing import Iterator, Optional, Tuple, Union
+from pathlib import Path
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+TIFF_SUFFIXES = ('.tif', '.tiff')
+
+
+class ImageReader:
+    """大图像读取器：未压缩TIFF走内存映射，其余按平面惰性读取"""
+
+    def __init__(self, path: Union[str, Path], use_memmap: bool = True):
+        import tifffile
+
+        self.path = Path(path)
+        if self.path.suffix.lower() not in TIFF_SUFFIXES:
+            raise ValueError(f"ImageReader only supports TIFF/OME-TIFF files: {self.path}")
+        self._tif = tifffile.TiffFile(str(self.path))
+        self._series = self._tif.series[0]
+        self._memmap = None
+
+        # 连续存储的未压缩数据可以直接映射，不占用进程内存
+        if use_memmap and self._series.dataoffset is not None:
+            try:
+                self._memmap = tifffile.memmap(str(self.path), mode='r')
+            except ValueError as e:
+                logger.debug(f"Memory mapping unavailable for {self.path}: {str(e)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """关闭文件句柄"""
+        self._memmap = None
+        self._tif.close()
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(self._series.shape)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._series.dtype
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def plane_shape(self) -> Tuple[int, int]:
+        return tuple(self.shape[-2:])
+
+    @property
+    def n_planes(self) -> int:
+        return int(np.prod(self.shape[:-2], dtype=np.int64))
+
+    @property
+    def is_memmapped(self) -> bool:
+        return self._memmap is not None
+
+    def memmap(self) -> np.ndarray:
+        """返回只读内存映射数组（仅未压缩的连续TIFF可用）"""
+        if self._memmap is None:
+            raise ValueError(f"Image data are not memory-mappable: {self.path}")
+        return self._memmap
+
+    def read_plane(self, index: int) -> np.ndarray:
+        """读取单个2D平面（多维堆栈按前导维展平后的序号）"""
+        if not 0 <= index < self.n_planes:
+            raise IndexError(f"Plane index {index} out of range [0, {self.n_planes})")
+        if self._memmap is not None:
+            return np.asarray(self._memmap.reshape(-1, *self.plane_shape)[index])
+        return self._series.pages[index].asarray()
+
+    def iter_planes(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """逐平面读取，内存占用为单个平面"""
+        for index in range(self.n_planes):
+            yield index, self.read_plane(index)
+
+    def read_region(self, plane_slice: slice = slice(None), y: slice = slice(None),
+                    x: slice = slice(None)) -> np.ndarray:
+        """读取平面范围内的矩形区域，返回 (planes, h, w) 数组"""
+        if self._memmap is not None:
+            return np.array(self._memmap.reshape(-1, *self.plane_shape)[plane_slice, y, x])
+        indices = range(self.n_planes)[plane_slice]
+        return np.stack([self.read_plane(i)[y, x] for i in indices])
+
+    def iter_tiles(self, tile_shape: Tuple[int, int], overlap: int = 0,
+                   planes: Optional[range] = None) -> Iterator[Tuple[np.ndarray, Tuple[int, ...]]]:
+        """按平面和 (h, w) 分块生成 (tile, offset)；offset 为 (plane, y, x) 或 2D图像的 (y, x)"""
+        th, tw = tile_shape
+        if overlap >= min(th, tw):
+            raise ValueError(f"Overlap {overlap} must be smaller than tile shape {tile_shape}")
+        h, w = self.plane_shape
+        step_y, step_x = th - overlap, tw - overlap
+        planes = planes if planes is not None else range(self.n_planes)
+
+        for p in planes:
+            # 非映射模式下每个平面只解码一次
+            plane = self._memmap.reshape(-1, h, w)[p] if self._memmap is not None else self.read_plane(p)
+            for y0 in range(0, max(h - overlap, 1), step_y):
+                for x0 in range(0, max(w - overlap, 1), step_x):
+                    tile = np.asarray(plane[y0:y0 + th, x0:x0 + tw])
+                    offset = (y0, x0) if self.ndim == 2 else (p, y0, x0)
+                    yield tile, offset
+
+
+def load_image(path: Union[str, Path], use_memmap: bool = True) -> np.ndarray:
+    """加载图像；未压缩TIFF返回内存映射数组，按需分页读取"""
+    path = Path(path)
+    try:
+        if path.suffix.lower() in TIFF_SUFFIXES:
+            import tifffile
+            if use_memmap:
+                try:
+                    return tifffile.memmap(str(path), mode='r')
+                except ValueError:
+                    pass
+            return tifffile.imread(str(path))
+
+        from skimage import io
+        return io.imread(str(path))
+
+    except Exception as e:
+        logger.error(f"Error loading image {path}: {str(e)}")
+        raise
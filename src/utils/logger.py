@@ -1,17 +1,17 @@
-import logging
-from pathlib import Path
-
-def setup_logger(name: str, log_file: Path, level=logging.INFO):
-    """配置日志系统"""
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    
-    handler = logging.FileHandler(log_file)
-    handler.setFormatter(formatter)
-    
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    logger.addHandler(handler)
-    
+import logging
+from pathlib import Path
+
+def setup_logger(name: str, log_file: Path, level=logging.INFO):
+    """配置日志系统"""
+    formatter = logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    handler = logging.FileHandler(log_file)
+    handler.setFormatter(formatter)
+    
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.addHandler(handler)
+    
     return logger 
\ No newline at end of file
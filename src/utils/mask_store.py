@@ -0,0 +1,135 @@
+from typing import List, Optional, Tuple, Union
+from pathlib import Path
+import tempfile
+import json
+import zlib
+import re
+import os
+import numpy as np
+import logging
+from src.utils.hashing import digest_array, digest_file, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+# 已计算好的检查点摘要（与 digest_file 的输出格式一致）
+_DIGEST_PATTERN = re.compile(r'[0-9a-f]{40}')
+
+
+def _encode_chunk(chunk: np.ndarray, encoding: str, level: int) -> np.ndarray:
+    """压缩单个分块：二值掩膜按位打包，标记图按行程编码，再做 zlib 压缩"""
+    flat = chunk.ravel()
+    if encoding == 'bits':
+        payload = np.packbits(flat.astype(bool)).tobytes()
+    else:
+        starts = np.concatenate([[0], np.flatnonzero(flat[1:] != flat[:-1]) + 1]) if flat.size else np.zeros(0, np.int64)
+        lengths = np.diff(np.append(starts, flat.size)).astype(np.uint32)
+        payload = np.uint64(starts.size).tobytes() + lengths.tobytes() + flat[starts].tobytes()
+    return np.frombuffer(zlib.compress(payload, level), dtype=np.uint8)
+
+
+def _decode_chunk(data: np.ndarray, encoding: str, shape: Tuple[int, ...], dtype: np.dtype) -> np.ndarray:
+    payload = zlib.decompress(data.tobytes())
+    size = int(np.prod(shape, dtype=np.int64))
+    if encoding == 'bits':
+        flat = np.unpackbits(np.frombuffer(payload, dtype=np.uint8), count=size).astype(dtype)
+    else:
+        n = int(np.frombuffer(payload[:8], dtype=np.uint64)[0])
+        lengths = np.frombuffer(payload, dtype=np.uint32, count=n, offset=8)
+        values = np.frombuffer(payload, dtype=dtype, count=n, offset=8 + 4 * n)
+        flat = np.repeat(values, lengths)
+    return flat.reshape(shape)
+
+
+class MaskStore:
+    """分割结果存储：按 (图像内容哈希, 检查点摘要) 寻址，分块压缩保存
+
+    目录结构为 root/<检查点摘要>/<图像哈希前两位>/<图像哈希>.npz，
+    可以直接看出每个掩膜由哪个检查点产生；模型未变时下游分析可完全跳过推理。
+    """
+
+    def __init__(self, root: Union[str, Path], chunk_rows: int = 256, level: int = 6):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.chunk_rows = chunk_rows  # 沿第一维的分块大小（行或平面）
+        self.level = level  # zlib 压缩级别
+
+    @staticmethod
+    def key(image: np.ndarray, checkpoint: Union[str, Path]) -> Tuple[str, str]:
+        """返回 (图像内容哈希, 检查点摘要)
+
+        checkpoint 为已有文件时按文件内容计算，为已计算的摘要时直接使用；
+        其他字符串（如不存在的路径或模型名）按字符串哈希，不会直接作为目录名。
+        """
+        if Path(checkpoint).is_file():
+            checkpoint_digest = digest_file(checkpoint)
+        elif isinstance(checkpoint, str) and _DIGEST_PATTERN.fullmatch(checkpoint):
+            checkpoint_digest = checkpoint
+        else:
+            checkpoint_digest = make_cache_key(str(checkpoint))
+        return digest_array(image), checkpoint_digest
+
+    def _path(self, image_digest: str, checkpoint_digest: str) -> Path:
+        return self.root / checkpoint_digest / image_digest[:2] / f"{image_digest}.npz"
+
+    def contains(self, image_digest: str, checkpoint_digest: str) -> bool:
+        return self._path(image_digest, checkpoint_digest).exists()
+
+    def checkpoints(self) -> List[str]:
+        """已有存储结果的检查点摘要"""
+        return sorted(p.name for p in self.root.iterdir() if p.is_dir())
+
+    def put(self, image_digest: str, checkpoint_digest: str, mask: np.ndarray):
+        """压缩保存掩膜（先写临时文件再原子替换，并发写入安全）"""
+        mask = np.asarray(mask)
+        if mask.ndim == 0:
+            raise ValueError("Mask must have at least one dimension")
+        binary = mask.dtype == bool or (mask.min(initial=0) >= 0 and mask.max(initial=0) <= 1)
+        encoding = 'bits' if binary else 'rle'
+        meta = {
+            'shape': list(mask.shape),
+            'dtype': mask.dtype.str,
+            'encoding': encoding,
+            'chunk_rows': self.chunk_rows,
+            'checkpoint': checkpoint_digest,
+        }
+        arrays = {'meta': np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)}
+        for i, start in enumerate(range(0, mask.shape[0], self.chunk_rows)):
+            arrays[f'chunk_{i}'] = _encode_chunk(mask[start:start + self.chunk_rows], encoding, self.level)
+
+        path = self._path(image_digest, checkpoint_digest)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.savez(f, **arrays)
+                os.replace(tmp, path)
+            except BaseException:
+                Path(tmp).unlink(missing_ok=True)
+                raise
+        except Exception as e:
+            logger.error(f"Error saving mask {image_digest}: {str(e)}")
+            raise
+
+    def get(self, image_digest: str, checkpoint_digest: str,
+            rows: Optional[slice] = None) -> Optional[np.ndarray]:
+        """读取掩膜，未命中返回 None；rows 指定第一维范围时只解压覆盖到的分块"""
+        path = self._path(image_digest, checkpoint_digest)
+        try:
+            archive = np.load(path)
+        except FileNotFoundError:
+            return None
+        with archive:
+            meta = json.loads(archive['meta'].tobytes())
+            shape, dtype = tuple(meta['shape']), np.dtype(meta['dtype'])
+            chunk_rows = meta['chunk_rows']
+            start, stop, _ = (rows or slice(None)).indices(shape[0])
+            stop = max(stop, start)
+            out = np.empty((stop - start,) + shape[1:], dtype=dtype)
+            for i in range(start // chunk_rows, -(-stop // chunk_rows)):
+                c0 = i * chunk_rows
+                c1 = min(c0 + chunk_rows, shape[0])
+                chunk = _decode_chunk(archive[f'chunk_{i}'], meta['encoding'], (c1 - c0,) + shape[1:], dtype)
+                lo, hi = max(start, c0), min(stop, c1)
+                out[lo - start:hi - start] = chunk[lo - c0:hi - c0]
+        return out
@@ -1,87 +1,361 @@
-from typing import List, Callable, Any
-import multiprocessing as mp
-from pathlib import Path
-import numpy as np
-import torch
-from functools import lru_cache
-import logging
-from concurrent.futures import ProcessPoolExecutor, as_completed
-
-logger = logging.getLogger(__name__)
-
-class ProcessingPool:
-    """多进程处理池"""
-    
-    def __init__(self, num_workers: int = None):
-        self.num_workers = num_workers or mp.cpu_count()
-        
-    def map_batch(self, func: Callable, items: List[Any], 
-                 batch_size: int = 1) -> List[Any]:
-        """批量处理数据"""
-        results = []
-        
-        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
-            # 提交批处理任务
-            futures = []
-            for i in range(0, len(items), batch_size):
-                batch = items[i:i + batch_size]
-                future = executor.submit(self._process_batch, func, batch)
-                futures.append(future)
-            
-            # 收集结果
-            for future in as_completed(futures):
-                try:
-                    batch_result = future.result()
-                    results.extend(batch_result)
-                except Exception as e:
-                    logger.error(f"Batch processing error: {str(e)}")
-                    
-        return results
-    
-    @staticmethod
-    def _process_batch(func: Callable, batch: List[Any]) -> List[Any]:
-        """处理单个批次"""
-        return [func(item) for item in batch]
-
-class GPUAccelerator:
-    """GPU加速器"""
-    
-    def __init__(self, device: str = None):
-        self.device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
-        self.torch_enabled = self.device != 'cpu'
-        
-    def to_device(self, data: np.ndarray) -> torch.Tensor:
-        """将数据转移到GPU"""
-        if self.torch_enabled:
-            return torch.from_numpy(data).to(self.device)
-        return data
-    
-    def to_numpy(self, tensor: torch.Tensor) -> np.ndarray:
-        """将数据转回CPU"""
-        if self.torch_enabled:
-            return tensor.cpu().numpy()
-        return tensor
-    
-    @property
-    def is_gpu_available(self) -> bool:
-        return self.torch_enabled
-
-class DataCache:
-    """数据缓存管理器"""
-    
-    def __init__(self, cache_dir: Path = None, max_size: int = 1000):
-        self.cache_dir = cache_dir or Path(".cache")
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.max_size = max_size
-        
-    @lru_cache(maxsize=1000)
-    def cache_result(self, key: str, value: Any) -> Any:
-        """缓存计算结果"""
-        return value
-    
-    def get_cached(self, key: str) -> Any:
-        """获取缓存结果"""
-        try:
-            return self.cache_result(key, None)
-        except Exception:
-            return None 
\ No newline at end of file
+from typing import List, Callable, Any, Dict, Iterable, Iterator, Optional, Tuple, TYPE_CHECKING
+from dataclasses import dataclass
+from collections import OrderedDict
+from itertools import islice
+import multiprocessing as mp
+import threading
+import tempfile
+import pickle
+import time
+import os
+from pathlib import Path
+import numpy as np
+import logging
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from src.utils.cpu_inference import configure_torch_threads
+from src.utils.shared_memory import SharedMemoryPool, call_shared, DEFAULT_MIN_SHARED_BYTES
+
+if TYPE_CHECKING:
+    import torch
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+@dataclass
+class TaskError:
+    """单个条目的处理失败记录，保留输入序号"""
+    index: int
+    error: Exception
+
+class ProcessingPool:
+    """多进程处理池
+    
+    use_shared_memory=True 时大数组放入共享内存段，跨进程只传递 (段名, 形状, 类型) 句柄。
+    """
+    
+    def __init__(self, num_workers: int = None, use_shared_memory: bool = False,
+                 min_shared_bytes: int = DEFAULT_MIN_SHARED_BYTES,
+                 target_chunk_time: float = 0.2, max_chunk_size: int = 64):
+        self.num_workers = num_workers or mp.cpu_count()
+        self.min_shared_bytes = min_shared_bytes
+        self.shared_pool = SharedMemoryPool(min_shared_bytes) if use_shared_memory else None
+        self.target_chunk_time = target_chunk_time  # 自动分块时每个分块的目标耗时（秒）
+        self.max_chunk_size = max_chunk_size
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def close(self):
+        """释放共享内存段"""
+        if self.shared_pool is not None:
+            self.shared_pool.close()
+    
+    def imap(self, func: Callable, items: Iterable[Any], ordered: bool = True,
+             chunk_size: Optional[int] = None,
+             max_in_flight: Optional[int] = None) -> Iterator[Tuple[int, Any]]:
+        """流式处理，逐个产出 (输入序号, 结果)；失败条目的结果为 TaskError
+        
+        ordered=True 时经重排缓冲按输入顺序产出，否则按完成顺序产出。
+        同时在途的分块数不超过 max_in_flight（默认为工作进程数的两倍），输入按需惰性读取；
+        有序模式下已提交但尚未产出的条目（含重排缓冲）也不超过 max_in_flight 个分块，
+        队首条目很慢时不会继续读入后续输入。
+        chunk_size 为 None 时根据实测的单条耗时自动调整分块大小。
+        """
+        max_in_flight = max_in_flight or 2 * self.num_workers
+        auto_chunk = chunk_size is None
+        chunk_size = chunk_size or 1
+        item_time = None  # 单条耗时的指数滑动平均
+        iterator = iter(items)
+        next_index = 0
+        exhausted = False
+        pending: Dict[Future, Tuple[int, List[Any]]] = {}
+        reorder: Dict[int, Any] = {}
+        next_yield = 0
+        
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            try:
+                while True:
+                    # 补满在途窗口
+                    while (not exhausted and len(pending) < max_in_flight
+                           and (not ordered or next_index - next_yield < max_in_flight * chunk_size)):
+                        chunk = list(islice(iterator, chunk_size))
+                        if not chunk:
+                            exhausted = True
+                            break
+                        if self.shared_pool is not None:
+                            chunk = self.shared_pool.to_shared(chunk)
+                        future = executor.submit(self._process_chunk, func, next_index, chunk,
+                                                 self.min_shared_bytes if self.shared_pool else None)
+                        pending[future] = (next_index, chunk)
+                        next_index += len(chunk)
+                    if not pending:
+                        break
+                    
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        start, chunk = pending.pop(future)
+                        try:
+                            results, elapsed = future.result()
+                            if self.shared_pool is not None:
+                                results = self.shared_pool.from_shared(results)
+                            if auto_chunk:
+                                per_item = elapsed / len(chunk)
+                                item_time = per_item if item_time is None else 0.7 * item_time + 0.3 * per_item
+                                chunk_size = int(min(max(self.target_chunk_time / max(item_time, 1e-6), 1),
+                                                     self.max_chunk_size))
+                        except Exception as e:
+                            # 整个分块失败（如进程崩溃或结果无法序列化）时逐条记录
+                            logger.error(f"Chunk starting at item {start} failed: {str(e)}")
+                            results = [TaskError(start + k, e) for k in range(len(chunk))]
+                        finally:
+                            if self.shared_pool is not None:
+                                self.shared_pool.release_all(chunk)
+                        
+                        for k, result in enumerate(results):
+                            if ordered:
+                                reorder[start + k] = result
+                            else:
+                                yield start + k, result
+                    
+                    while next_yield in reorder:
+                        yield next_yield, reorder.pop(next_yield)
+                        next_yield += 1
+            finally:
+                # 消费方提前退出时取消未开始的分块
+                for future, (_, chunk) in pending.items():
+                    future.cancel()
+                    if self.shared_pool is not None:
+                        self.shared_pool.release_all(chunk)
+        
+    def map_batch(self, func: Callable, items: List[Any], 
+                 batch_size: int = 1) -> List[Any]:
+        """批量处理数据，按输入顺序返回结果；失败的条目记录日志，对应位置为 None"""
+        results = []
+        for index, result in self.imap(func, items, ordered=True, chunk_size=batch_size):
+            if isinstance(result, TaskError):
+                logger.error(f"Processing error on item {index}: {str(result.error)}")
+                result = None
+            results.append(result)
+        return results
+    
+    @staticmethod
+    def _process_chunk(func: Callable, start: int, chunk: List[Any],
+                       min_shared_bytes: Optional[int]) -> Tuple[List[Any], float]:
+        """在子进程中处理一个分块，单条失败不影响同块其他条目，同时返回耗时"""
+        begin = time.perf_counter()
+        results = []
+        for k, item in enumerate(chunk):
+            try:
+                if min_shared_bytes is not None:
+                    results.append(call_shared(func, item, min_shared_bytes))
+                else:
+                    results.append(func(item))
+            except Exception as e:
+                results.append(TaskError(start + k, e))
+        return results, time.perf_counter() - begin
+
+class GPUAccelerator:
+    """GPU加速器"""
+    
+    def __init__(self, device: str = None, num_threads: int = None):
+        self._device = device  # 未指定时首次使用才导入 torch 检测
+        
+        # CPU上的张量运算依赖intra-op线程并行
+        configure_torch_threads(num_threads)
+        
+    @property
+    def device(self) -> str:
+        if self._device is None:
+            import torch
+            self._device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        return self._device
+    
+    @property
+    def torch_enabled(self) -> bool:
+        return self.device != 'cpu'
+        
+    def to_device(self, data: np.ndarray) -> "torch.Tensor":
+        """将数据转移到GPU"""
+        if self.torch_enabled:
+            import torch
+            return torch.from_numpy(data).to(self.device)
+        return data
+    
+    def to_numpy(self, tensor: "torch.Tensor") -> np.ndarray:
+        """将数据转回CPU"""
+        if self.torch_enabled:
+            return tensor.cpu().numpy()
+        return tensor
+    
+    @property
+    def is_gpu_available(self) -> bool:
+        return self.torch_enabled
+
+class DataCache:
+    """数据缓存管理器：内存LRU前端 + cache_dir 下的持久化内容寻址存储
+    
+    键建议用 make_cache_key(图像, 检查点路径, 插件元数据) 生成。
+    磁盘条目以临时文件写入后原子替换，多个进程可同时读写；超出 max_size 条目或
+    max_disk_bytes 时按最近访问时间淘汰。中断的写入留下的临时文件在启动时清理
+    （只清理超过 stale_tmp_seconds 的，避免删掉其他进程正在写的文件）。
+    
+    内存层命中时返回的是缓存中的同一个对象（不复制）：调用方不应原地修改
+    get_cached / cache_result 返回的值，否则会影响之后的命中。
+    """
+    
+    def __init__(self, cache_dir: Path = None, max_size: int = 1000,
+                 max_memory_bytes: int = 256 << 20, max_disk_bytes: Optional[int] = None,
+                 stale_tmp_seconds: float = 3600):
+        self.cache_dir = Path(cache_dir or ".cache")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size  # 磁盘条目数上限
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._remove_stale_tmp(stale_tmp_seconds)
+        entries = self._disk_entries()
+        self._disk_count = len(entries)
+        self._disk_bytes = sum(size for _, _, size in entries)
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.pkl"
+    
+    def _remove_stale_tmp(self, max_age: float):
+        """删除中断的原子写入留下的临时文件"""
+        cutoff = time.time() - max_age
+        for path in self.cache_dir.glob('*/*.tmp'):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"Failed to remove stale cache temp file {path}: {str(e)}")
+    
+    def _disk_entries(self) -> List[Tuple[float, Path, int]]:
+        """扫描磁盘条目，返回 (最近访问时间, 路径, 字节数)"""
+        entries = []
+        for path in self.cache_dir.glob('*/*.pkl'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # 被其他进程淘汰
+                continue
+            entries.append((stat.st_mtime, path, stat.st_size))
+        return entries
+    
+    def _remember(self, key: str, value: Any, nbytes: int):
+        """放入内存层，超出字节预算时淘汰最久未用的条目"""
+        if nbytes > self.max_memory_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._memory.pop(key)[1]
+            self._memory[key] = (value, nbytes)
+            self._memory_bytes += nbytes
+            while self._memory_bytes > self.max_memory_bytes:
+                _, (_, size) = self._memory.popitem(last=False)
+                self._memory_bytes -= size
+    
+    def _evict_disk(self):
+        """按最近访问时间淘汰磁盘条目（重新扫描目录以计入其他进程的写入）"""
+        entries = sorted(self._disk_entries(), key=lambda e: e[0])
+        count = len(entries)
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if count <= self.max_size and (self.max_disk_bytes is None or total <= self.max_disk_bytes):
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            count -= 1
+            total -= size
+        with self._lock:
+            self._disk_count, self._disk_bytes = count, total
+        
+    def cache_result(self, key: str, value: Any) -> Any:
+        """缓存计算结果，返回 value 本身（之后内存层命中返回的也是这个对象）"""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        path = self._path(key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            # 先写临时文件再原子替换，读者不会看到写了一半的条目
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                # 覆盖已有条目时只更新占用差值，不增加条目数
+                try:
+                    old_size = path.stat().st_size
+                except FileNotFoundError:
+                    old_size = None
+                os.replace(tmp, path)
+            except BaseException:
+                Path(tmp).unlink(missing_ok=True)
+                raise
+        except OSError as e:
+            logger.error(f"Failed to write cache entry {key}: {str(e)}")
+        else:
+            with self._lock:
+                if old_size is None:
+                    self._disk_count += 1
+                    self._disk_bytes += len(data)
+                else:
+                    self._disk_bytes += len(data) - old_size
+                over = self._disk_count > self.max_size or (
+                    self.max_disk_bytes is not None and self._disk_bytes > self.max_disk_bytes)
+            if over:
+                self._evict_disk()
+        self._remember(key, value, len(data))
+        return value
+    
+    def get_cached(self, key: str, default: Any = None) -> Any:
+        """获取缓存结果，未命中返回 default；内存层命中时返回共享对象，不要原地修改"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key][0]
+        
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)  # 刷新访问时间供淘汰排序
+        except FileNotFoundError:
+            return default
+        try:
+            value = pickle.loads(data)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cache entry {key}: {str(e)}")
+            path.unlink(missing_ok=True)
+            return default
+        self._remember(key, value, len(data))
+        return value
+    
+    def get_or_compute(self, key: str, func: Callable[[], Any]) -> Any:
+        """命中则返回缓存，否则计算并写入"""
+        value = self.get_cached(key, _MISSING)
+        if value is _MISSING:
+            value = self.cache_result(key, func())
+        return value
+    
+    def invalidate(self, key: str):
+        """删除单个条目"""
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= self._memory.pop(key)[1]
+        self._path(key).unlink(missing_ok=True)
+    
+    def clear(self):
+        """清空内存与磁盘缓存"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+        for _, path, _ in self._disk_entries():
+            path.unlink(missing_ok=True)
+        self._evict_disk()
@@ -0,0 +1,164 @@
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import threading
+import queue
+import logging
+from src.utils.shared_memory import SharedMemoryPool, call_shared
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+@dataclass
+class Stage:
+    """流水线阶段"""
+    name: str
+    func: Callable[[Any], Any]
+    workers: int = 1  # 并行工作者数
+    use_processes: bool = False  # CPU密集阶段在子进程中执行（func 及数据需可pickle）
+    queue_size: int = 8  # 该阶段输入队列容量，满时上游阻塞（背压）
+    shared_memory: bool = False  # 进程阶段经共享内存传递大数组，避免 pickle
+
+
+@dataclass
+class StageError:
+    """某个条目在某阶段失败的记录，后续阶段直接透传"""
+    stage: str
+    index: int
+    error: Exception
+
+
+class Pipeline:
+    """分阶段流水线执行器：阶段间用有界队列连接，I/O、推理与特征计算重叠执行
+
+    典型用法为 解码 -> 分割 -> 测量 -> 导出。
+    """
+
+    def __init__(self, stages: List[Stage], poll_interval: float = 0.1):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._shared_pool: Optional[SharedMemoryPool] = None
+        self._input_error: Optional[Exception] = None
+
+    def _put(self, q: "queue.Queue", item: Any) -> bool:
+        """带停止检查的阻塞写入"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: "queue.Queue") -> Any:
+        """带停止检查的阻塞读取"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _feed(self, items: Iterable[Any], out_q: "queue.Queue", n_consumers: int):
+        """把输入条目编号后送入第一阶段；输入迭代器出错时记录错误，由 run 在已送入的条目处理完后抛出"""
+        try:
+            for index, item in enumerate(items):
+                if not self._put(out_q, (index, item)):
+                    return
+        except Exception as e:
+            logger.error(f"Pipeline input iterator failed: {str(e)}")
+            self._input_error = e
+        finally:
+            for _ in range(n_consumers):
+                self._put(out_q, _END)
+
+    def _work(self, stage: Stage, in_q: "queue.Queue", out_q: "queue.Queue",
+              executor: Optional[ProcessPoolExecutor], done: List[int],
+              lock: threading.Lock, n_consumers: int):
+        """阶段工作线程：取条目、执行、写入下游；进程阶段的线程只负责提交与等待"""
+        while True:
+            entry = self._get(in_q)
+            if entry is _END:
+                break
+            index, value = entry
+            if not isinstance(value, StageError):
+                try:
+                    if executor is not None and stage.shared_memory:
+                        value = self._call_shared(stage, executor, value)
+                    elif executor is not None:
+                        value = executor.submit(stage.func, value).result()
+                    else:
+                        value = stage.func(value)
+                except Exception as e:
+                    logger.error(f"Stage '{stage.name}' failed on item {index}: {str(e)}")
+                    value = StageError(stage.name, index, e)
+            if not self._put(out_q, (index, value)):
+                return
+
+        # 本阶段最后一个退出的工作线程通知下游结束
+        with lock:
+            done[0] += 1
+            last = done[0] == stage.workers
+        if last:
+            for _ in range(n_consumers):
+                self._put(out_q, _END)
+
+    def _call_shared(self, stage: Stage, executor: ProcessPoolExecutor, value: Any) -> Any:
+        """经共享内存把条目交给子进程执行"""
+        shared = self._shared_pool.to_shared(value)
+        try:
+            result = executor.submit(call_shared, stage.func, shared,
+                                     self._shared_pool.min_bytes).result()
+            return self._shared_pool.from_shared(result)
+        finally:
+            self._shared_pool.release_all(shared)
+
+    def run(self, items: Iterable[Any]) -> Iterator[Tuple[int, Any]]:
+        """流式执行，按完成顺序产出 (输入序号, 结果)；失败的条目结果为 StageError
+
+        输入迭代器本身出错时，已读取的条目照常产出，之后抛出该错误。
+        """
+        self._stop.clear()
+        self._input_error = None
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        queues.append(queue.Queue(maxsize=self.stages[-1].queue_size))
+        executors = [ProcessPoolExecutor(max_workers=s.workers) if s.use_processes else None
+                     for s in self.stages]
+        if any(s.use_processes and s.shared_memory for s in self.stages):
+            self._shared_pool = SharedMemoryPool()
+        threads = [threading.Thread(target=self._feed, name="pipeline-feed", daemon=True,
+                                    args=(items, queues[0], self.stages[0].workers))]
+        for i, stage in enumerate(self.stages):
+            n_consumers = self.stages[i + 1].workers if i + 1 < len(self.stages) else 1
+            done, lock = [0], threading.Lock()
+            for w in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, name=f"pipeline-{stage.name}-{w}", daemon=True,
+                    args=(stage, queues[i], queues[i + 1], executors[i], done, lock, n_consumers)))
+
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                entry = self._get(queues[-1])
+                if entry is _END:
+                    break
+                yield entry
+            if self._input_error is not None:
+                raise self._input_error
+        finally:
+            # 消费方提前退出时停止所有阶段
+            self._stop.set()
+            for t in threads:
+                t.join()
+            for executor in executors:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+            if self._shared_pool is not None:
+                self._shared_pool.close()
+                self._shared_pool = None
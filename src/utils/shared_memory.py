@@ -0,0 +1,213 @@
+from typing import Any, Callable, Dict, List, Tuple
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from dataclasses import dataclass
+import threading
+import numpy as np
+import logging
+
+try:
+    import _posixshmem
+except ImportError:  # Windows 上段在所有句柄关闭后自动释放
+    _posixshmem = None
+
+logger = logging.getLogger(__name__)
+
+# 小于该字节数的数组直接随 pickle 传递，共享内存的建段开销不划算
+DEFAULT_MIN_SHARED_BYTES = 1 << 20
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """跨进程传递的共享内存数组句柄，只包含段名、形状与类型"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape, dtype=np.int64)) * np.dtype(self.dtype).itemsize
+
+    def view(self, shm: SharedMemory) -> np.ndarray:
+        """在已连接的段上构造数组视图（不复制）"""
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=shm.buf)
+
+
+def _open_untracked(**kwargs) -> SharedMemory:
+    """子进程中打开或创建段，不向资源跟踪器登记（段统一由父进程回收）"""
+    try:
+        return SharedMemory(track=False, **kwargs)
+    except TypeError:
+        pass
+    # Python < 3.13 没有 track 参数；子进程单线程执行，可临时屏蔽登记
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: (
+        None if rtype == 'shared_memory' else register(name, rtype))
+    try:
+        return SharedMemory(**kwargs)
+    finally:
+        resource_tracker.register = register
+
+
+def _close(shm: SharedMemory):
+    """关闭段映射；仍有数组视图引用时保留映射，由进程退出时回收"""
+    try:
+        shm.close()
+    except BufferError:
+        logger.debug(f"Shared memory {shm.name} still referenced, leaving it mapped")
+
+
+def _shareable(arr: np.ndarray, min_bytes: int) -> bool:
+    """只共享足够大的普通数值数组（对象/结构化数组仍走 pickle）"""
+    return arr.nbytes >= min_bytes and not arr.dtype.hasobject and arr.dtype.fields is None
+
+
+def _map_arrays(obj: Any, func: Callable[[Any], Any], array_type: type) -> Any:
+    """递归替换 dict/list/tuple 中的数组或句柄"""
+    if isinstance(obj, array_type):
+        return func(obj)
+    if isinstance(obj, dict):
+        return {k: _map_arrays(v, func, array_type) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        mapped = [_map_arrays(v, func, array_type) for v in obj]
+        return mapped if isinstance(obj, list) else tuple(mapped)
+    return obj
+
+
+def attach_arrays(obj: Any) -> Tuple[Any, List[SharedMemory]]:
+    """子进程中把句柄替换为共享内存视图，返回替换结果和需关闭的段"""
+    segments: List[SharedMemory] = []
+
+    def attach(handle: SharedArray) -> np.ndarray:
+        shm = _open_untracked(name=handle.name)
+        segments.append(shm)
+        return handle.view(shm)
+
+    return _map_arrays(obj, attach, SharedArray), segments
+
+
+def export_arrays(obj: Any, min_bytes: int = DEFAULT_MIN_SHARED_BYTES) -> Any:
+    """子进程中把大数组结果写入新建的共享内存段，回收责任交给父进程"""
+    created: List[SharedMemory] = []
+
+    def export(arr: np.ndarray) -> Any:
+        if not _shareable(arr, min_bytes):
+            return arr
+        shm = _open_untracked(create=True, size=max(arr.nbytes, 1))
+        created.append(shm)
+        handle = SharedArray(shm.name, arr.shape, arr.dtype.str)
+        handle.view(shm)[...] = arr
+        return handle
+
+    try:
+        result = _map_arrays(obj, export, np.ndarray)
+    except Exception:
+        # 未登记的段不能用 unlink()（会向跟踪器注销），直接删除
+        for shm in created:
+            _close(shm)
+            if _posixshmem is not None:
+                _posixshmem.shm_unlink(shm._name)
+        raise
+    for shm in created:
+        _close(shm)
+    return result
+
+
+def call_shared(func: Callable[[Any], Any], item: Any,
+                min_bytes: int = DEFAULT_MIN_SHARED_BYTES) -> Any:
+    """子进程入口：连接输入段、执行函数，并通过共享内存返回大数组结果"""
+    value, segments = attach_arrays(item)
+    try:
+        result = export_arrays(func(value), min_bytes)
+    finally:
+        del value
+        for shm in segments:
+            _close(shm)
+    return result
+
+
+class SharedMemoryPool:
+    """父进程持有的可复用共享内存段池，负责所有段的创建与回收"""
+
+    def __init__(self, min_bytes: int = DEFAULT_MIN_SHARED_BYTES,
+                 max_cached_bytes: int = 1 << 30):
+        self.min_bytes = min_bytes
+        self.max_cached_bytes = max_cached_bytes  # 空闲段总字节数上限
+        self._in_use: Dict[str, SharedMemory] = {}
+        self._free: List[SharedMemory] = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _acquire(self, nbytes: int) -> SharedMemory:
+        """取容量足够的最小空闲段，没有则新建"""
+        with self._lock:
+            fits = [shm for shm in self._free if shm.size >= nbytes]
+            if fits:
+                shm = min(fits, key=lambda s: s.size)
+                self._free.remove(shm)
+            else:
+                shm = SharedMemory(create=True, size=max(nbytes, 1))
+            self._in_use[shm.name] = shm
+            return shm
+
+    def release(self, handle: SharedArray):
+        """把段放回空闲列表，超出缓存上限时释放最旧的空闲段"""
+        with self._lock:
+            shm = self._in_use.pop(handle.name, None)
+            if shm is None:
+                return
+            self._free.append(shm)
+            while self._free and sum(s.size for s in self._free) > self.max_cached_bytes:
+                old = self._free.pop(0)
+                _close(old)
+                old.unlink()
+
+    def share(self, arr: np.ndarray) -> SharedArray:
+        """把数组复制进共享内存段，返回可跨进程传递的句柄"""
+        arr = np.asarray(arr)
+        shm = self._acquire(arr.nbytes)
+        handle = SharedArray(shm.name, arr.shape, arr.dtype.str)
+        handle.view(shm)[...] = arr
+        return handle
+
+    def adopt(self, handle: SharedArray) -> np.ndarray:
+        """接管子进程创建的结果段：复制出数组，段留在池中供后续复用"""
+        shm = SharedMemory(name=handle.name)
+        with self._lock:
+            self._in_use[shm.name] = shm
+        arr = handle.view(shm).copy()
+        self.release(handle)
+        return arr
+
+    def to_shared(self, obj: Any) -> Any:
+        """把结构中的大数组替换为句柄"""
+        def share(arr: np.ndarray) -> Any:
+            return self.share(arr) if _shareable(arr, self.min_bytes) else arr
+
+        return _map_arrays(obj, share, np.ndarray)
+
+    def from_shared(self, obj: Any) -> Any:
+        """把结构中的结果句柄替换为普通数组"""
+        return _map_arrays(obj, self.adopt, SharedArray)
+
+    def release_all(self, obj: Any):
+        """释放结构中所有输入句柄占用的段"""
+        _map_arrays(obj, self.release, SharedArray)
+
+    def close(self):
+        """关闭并删除池中所有段"""
+        with self._lock:
+            segments = list(self._in_use.values()) + self._free
+            self._in_use.clear()
+            self._free = []
+        for shm in segments:
+            _close(shm)
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
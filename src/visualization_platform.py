@@ -1,26 +1,28 @@
-import matplotlib.pyplot as plt
-from typing import Dict, Any
-import seaborn as sns
-
-class VisualizationPlatform:
-    """可视化平台"""
-    
-    def __init__(self):
-        self.style_configs = {}
-        
-    def plot_morphology_results(self, 
-                              data: Dict[str, Any],
-                              plot_type: str,
-                              **kwargs):
-        """绘制形态学分析结果"""
-        if plot_type == 'scatter':
-            self._create_scatter_plot(data, **kwargs)
-        elif plot_type == 'box':
-            self._create_box_plot(data, **kwargs)
-        elif plot_type == '3d':
-            self._create_3d_plot(data, **kwargs)
-            
-    def _create_scatter_plot(self, data: Dict[str, Any], **kwargs):
-        plt.figure(figsize=(10, 6))
-        sns.scatterplot(data=data, **kwargs)
+from typing import Dict, Any
+
+class VisualizationPlatform:
+    """可视化平台"""
+    
+    def __init__(self):
+        self.style_configs = {}
+        
+    def plot_morphology_results(self, 
+                              data: Dict[str, Any],
+                              plot_type: str,
+                              **kwargs):
+        """绘制形态学分析结果"""
+        if plot_type == 'scatter':
+            self._create_scatter_plot(data, **kwargs)
+        elif plot_type == 'box':
+            self._create_box_plot(data, **kwargs)
+        elif plot_type == '3d':
+            self._create_3d_plot(data, **kwargs)
+            
+    def _create_scatter_plot(self, data: Dict[str, Any], **kwargs):
+        # 绘图库只在实际绘图时导入
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+        
+        plt.figure(figsize=(10, 6))
+        sns.scatterplot(data=data, **kwargs)
         plt.show() 
\ No newline at end of file
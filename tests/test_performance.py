@@ -0,0 +1,63 @@
+import os
+import time
+from src.utils.performance import DataCache, ProcessingPool
+
+
+def _slow_head(item):
+    if item == 0:
+        time.sleep(1.0)
+    return item * 2
+
+
+def _fail_odd(item):
+    if item % 2:
+        raise ValueError(item)
+    return item
+
+
+def test_imap_ordered_bounds_unyielded_items_with_slow_head():
+    pulled = []
+
+    def source():
+        for i in range(200):
+            pulled.append(i)
+            yield i
+
+    with ProcessingPool(num_workers=2) as pool:
+        results = pool.imap(_slow_head, source(), ordered=True, chunk_size=1, max_in_flight=4)
+        first_index, first_result = next(results)
+        pulled_before_first = len(pulled)
+        rest = list(results)
+
+    assert (first_index, first_result) == (0, 0)
+    assert pulled_before_first <= 4
+    assert [index for index, _ in rest] == list(range(1, 200))
+
+
+def test_map_batch_keeps_failed_items_in_place():
+    with ProcessingPool(num_workers=2) as pool:
+        results = pool.map_batch(_fail_odd, list(range(6)), batch_size=2)
+    assert results == [0, None, 2, None, 4, None]
+
+
+def test_data_cache_overwrite_does_not_grow_disk_accounting(tmp_path):
+    cache = DataCache(tmp_path, max_size=2)
+    for _ in range(5):
+        cache.cache_result('ab' * 20, list(range(10)))
+    assert cache._disk_count == 1
+    assert cache._disk_bytes == cache._path('ab' * 20).stat().st_size
+    cache.cache_result('ab' * 20, list(range(100)))
+    assert cache._disk_bytes == cache._path('ab' * 20).stat().st_size
+
+
+def test_data_cache_removes_stale_temp_files(tmp_path):
+    shard = tmp_path / 'ab'
+    shard.mkdir()
+    stale = shard / 'tmpstale.tmp'
+    fresh = shard / 'tmpfresh.tmp'
+    stale.write_bytes(b'partial')
+    fresh.write_bytes(b'partial')
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+    DataCache(tmp_path)
+    assert not stale.exists()
+    assert fresh.exists()
@@ -0,0 +1,17 @@
+import numpy as np
+from src.segmentation_interface import SegmentationModel, TiledSegmentation
+
+
+class _OffsetLabels(SegmentationModel):
+    """把前景标为一个实例，标签值带偏移（不从1开始）"""
+
+    def segment(self, image):
+        return np.where(image > 0, 6, 0).astype(np.int32)
+
+
+def test_tiled_segmentation_keeps_objects_covering_whole_tiles():
+    image = np.zeros((200, 200), dtype=np.uint8)
+    image[20:180, 20:180] = 1
+    out = TiledSegmentation(_OffsetLabels(), tile_size=64, overlap=16).segment(image)
+    assert (out > 0).sum() == 160 * 160
+    assert np.unique(out[out > 0]).tolist() == [1]